@@ -0,0 +1,11 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Offline benchmarks for the Blood on the Clocktower extensions."""
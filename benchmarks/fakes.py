@@ -0,0 +1,466 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Stand-ins for Discord objects, backed by a simulated HTTP layer."""
+
+import asyncio
+import collections
+import itertools
+import random
+import time
+
+import discord
+
+# (requests, per seconds) for each simulated rate-limit bucket kind
+FAKE_BUCKET_LIMITS = {
+    "member": (10, 10.0),
+    "message": (5, 5.0),
+    "delete": (5, 1.0),
+    "reaction": (1, 0.25),
+    "guild": (5, 5.0),
+}
+
+_MISSING = object()
+_snowflakes = itertools.count(100000)
+
+
+def snowflake():
+    """Get a new unique ID."""
+    return next(_snowflakes)
+
+
+class FakeResponse(object):
+    """Minimal HTTP response, as expected by `discord.HTTPException`."""
+
+    def __init__(self, status, reason, retry_after=None):
+        self.status = status
+        self.reason = reason
+        self.headers = {}
+        if retry_after is not None:
+            self.headers["Retry-After"] = f"{retry_after:.3f}"
+
+
+class FakeHTTP(object):
+    """Simulated Discord HTTP layer with latency, rate limits, and failures.
+
+    Every API call made by the fake Discord objects goes through `request`, which
+    counts the call, enforces a sliding-window limit on its rate-limit bucket, waits
+    out a latency drawn from [latency, latency + jitter], and then fails with the
+    given probability.
+
+    Like discord.py itself, rate-limited calls wait for the bucket and retry unless
+    `raise_rate_limits` is set, in which case a 429 error is raised to the caller.
+    `inject_rate_limits` answers the next calls on a kind of bucket with 429 errors
+    regardless of their window, to see how callers back off.
+
+    """
+
+    def __init__(
+        self,
+        latency=0.05,
+        jitter=0.05,
+        failure_rate=0.0,
+        limits=None,
+        raise_rate_limits=False,
+        seed=None,
+    ):
+        """Initialize the simulated HTTP layer."""
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.limits = dict(FAKE_BUCKET_LIMITS if limits is None else limits)
+        self.raise_rate_limits = raise_rate_limits
+        self.rng = random.Random(seed)
+        self.calls = collections.Counter()
+        self.rate_limited = collections.Counter()
+        self.failures = collections.Counter()
+        self.wait_seconds = 0.0
+        self._windows = collections.defaultdict(collections.deque)
+        # bucket kind -> [calls left to answer with a 429, retry-after seconds]
+        self._injected = {}
+
+    def inject_rate_limits(self, kind, count=1, retry_after=1.0):
+        """Answer the next `count` calls on a kind of bucket with 429 errors."""
+        self._injected[kind] = [count, retry_after]
+
+    def reset(self):
+        """Forget all counts and rate-limit windows."""
+        self.calls.clear()
+        self.rate_limited.clear()
+        self.failures.clear()
+        self.wait_seconds = 0.0
+        self._windows.clear()
+        self._injected.clear()
+
+    def _retry_after(self, bucket):
+        capacity, per = self.limits[bucket[0]]
+        window = self._windows[bucket]
+        now = time.monotonic()
+        while window and window[0] <= now - per:
+            window.popleft()
+        if len(window) < capacity:
+            window.append(now)
+            return 0.0
+        return window[0] + per - now
+
+    async def request(self, route, bucket):
+        """Simulate an API call on a route counted against a rate-limit bucket."""
+        self.calls[route] += 1
+        injected = self._injected.get(bucket[0])
+        if injected is not None:
+            injected[0] -= 1
+            if injected[0] <= 0:
+                del self._injected[bucket[0]]
+            self.rate_limited[route] += 1
+            response = FakeResponse(429, "Too Many Requests", injected[1])
+            raise discord.HTTPException(response, "You are being rate limited.")
+        retry_after = self._retry_after(bucket)
+        while retry_after > 0:
+            self.rate_limited[route] += 1
+            if self.raise_rate_limits:
+                response = FakeResponse(429, "Too Many Requests", retry_after)
+                raise discord.HTTPException(response, "You are being rate limited.")
+            self.wait_seconds += retry_after
+            await asyncio.sleep(retry_after)
+            retry_after = self._retry_after(bucket)
+        await asyncio.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            self.failures[route] += 1
+            response = FakeResponse(500, "Internal Server Error")
+            raise discord.HTTPException(response, "Simulated failure.")
+
+
+class FakeRole(object):
+    """Stand-in for `discord.Role`."""
+
+    def __init__(self, guild, name, id=None, default=False):
+        self.guild = guild
+        self.id = snowflake() if id is None else id
+        self.name = name
+        self._default = default
+
+    def is_default(self):
+        return self._default
+
+    @property
+    def mention(self):
+        return f"<@&{self.id}>"
+
+
+class FakeMember(object):
+    """Stand-in for `discord.Member`."""
+
+    def __init__(self, guild, name, id=None):
+        self.guild = guild
+        self.id = snowflake() if id is None else id
+        self.name = name
+        self.nick = None
+        self.bot = False
+        self.roles = [guild.default_role]
+        self.avatar_url = ""
+        self.voice_channel = None
+
+    def __repr__(self):
+        return f"<FakeMember id={self.id} display_name={self.display_name!r}>"
+
+    @property
+    def display_name(self):
+        return self.nick or self.name
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    async def edit(self, *, nick=_MISSING, roles=None, reason=None):
+        await self.guild.http.request("edit_member", ("member", self.guild.id))
+        if nick is not _MISSING:
+            self.nick = nick or None
+        if roles is not None:
+            self.roles = [self.guild.default_role] + [
+                role for role in roles if not role.is_default()
+            ]
+
+    async def move_to(self, channel, reason=None):
+        await self.guild.http.request("move_member", ("member", self.guild.id))
+        self.voice_channel = channel
+
+
+class FakeAttachment(object):
+    """Stand-in for `discord.Attachment`, made from a sent `discord.File`."""
+
+    def __init__(self, file):
+        self.filename = file.filename
+        self._data = file.fp.read()
+
+    async def read(self):
+        return self._data
+
+
+class FakeMessage(object):
+    """Stand-in for `discord.Message` and `discord.PartialMessage`."""
+
+    def __init__(self, channel, author, content=None, embed=None, id=None):
+        self.channel = channel
+        self.guild = channel.guild
+        self.id = snowflake() if id is None else id
+        self.author = author
+        self.content = content
+        self.embeds = [] if embed is None else [embed]
+        self.attachments = []
+        self.reactions = []
+        self.pinned = False
+        self.deleted = False
+
+    @property
+    def jump_url(self):
+        return (
+            f"https://discord.com/channels/{self.guild.id}/{self.channel.id}/{self.id}"
+        )
+
+    async def edit(self, *, content=_MISSING, embed=_MISSING):
+        await self.guild.http.request("edit_message", ("message", self.channel.id))
+        if content is not _MISSING:
+            self.content = content
+        if embed is not _MISSING:
+            self.embeds = [] if embed is None else [embed]
+
+    async def pin(self, *, reason=None):
+        await self.guild.http.request("pin_message", ("message", self.channel.id))
+        self.pinned = True
+
+    async def delete(self, *, delay=None):
+        if delay is not None:
+
+            async def delayed():
+                await asyncio.sleep(delay)
+                try:
+                    await self.delete()
+                except discord.HTTPException:
+                    pass
+
+            asyncio.ensure_future(delayed())
+            return
+        await self.guild.http.request("delete_message", ("delete", self.channel.id))
+        self.deleted = True
+        self.channel.messages.pop(self.id, None)
+
+    async def add_reaction(self, emoji):
+        await self.guild.http.request("add_reaction", ("reaction", self.channel.id))
+        self.reactions.append(emoji)
+
+    async def clear_reactions(self):
+        await self.guild.http.request("clear_reactions", ("reaction", self.channel.id))
+        self.reactions = []
+
+
+class FakeTextChannel(object):
+    """Stand-in for `discord.TextChannel`."""
+
+    def __init__(self, guild, name, category=None, id=None):
+        self.guild = guild
+        self.id = snowflake() if id is None else id
+        self.name = name
+        self.category = category
+        self.messages = {}
+
+    async def send(self, content=None, *, embed=None, file=None, delete_after=None):
+        await self.guild.http.request("send_message", ("message", self.id))
+        message = FakeMessage(self, self.guild.me, content, embed)
+        if file is not None:
+            message.attachments.append(FakeAttachment(file))
+        self.messages[message.id] = message
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    def get_partial_message(self, message_id):
+        try:
+            return self.messages[message_id]
+        except KeyError:
+            return FakeMessage(self, None, id=message_id)
+
+
+class FakeVoiceChannel(object):
+    """Stand-in for `discord.VoiceChannel`."""
+
+    def __init__(self, guild, name, category=None, id=None):
+        self.guild = guild
+        self.id = snowflake() if id is None else id
+        self.name = name
+        self.category = category
+
+    @property
+    def members(self):
+        return [member for member in self.guild.members if member.voice_channel is self]
+
+
+class FakeCategoryChannel(object):
+    """Stand-in for `discord.CategoryChannel`."""
+
+    def __init__(self, guild, name, id=None):
+        self.guild = guild
+        self.id = snowflake() if id is None else id
+        self.name = name
+        self.text_channels = []
+        self.voice_channels = []
+
+    @property
+    def channels(self):
+        return self.text_channels + self.voice_channels
+
+
+class FakeGuild(object):
+    """Stand-in for `discord.Guild`, with all API calls going through `http`."""
+
+    def __init__(self, http, name="Guild", id=None):
+        self.http = http
+        self.id = snowflake() if id is None else id
+        self.name = name
+        self.default_role = FakeRole(self, "@everyone", id=self.id, default=True)
+        self._roles = {self.default_role.id: self.default_role}
+        self._members = {}
+        self._channels = {}
+        self.me = self.add_member("Bot")
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def roles(self):
+        return list(self._roles.values())
+
+    @property
+    def categories(self):
+        return [
+            ch for ch in self._channels.values() if isinstance(ch, FakeCategoryChannel)
+        ]
+
+    def add_member(self, name):
+        """Add a member without an API call."""
+        member = FakeMember(self, name)
+        self._members[member.id] = member
+        return member
+
+    def add_role(self, name):
+        """Add a role without an API call."""
+        role = FakeRole(self, name)
+        self._roles[role.id] = role
+        return role
+
+    def add_town(self, name, num_sidebars=7):
+        """Add a town category with its channels without API calls."""
+        category = FakeCategoryChannel(self, name)
+        self._channels[category.id] = category
+        text = FakeTextChannel(self, name.replace(" ", "-").lower(), category)
+        category.text_channels.append(text)
+        self._channels[text.id] = text
+        for vname in (
+            ["Town Square"]
+            + [f"Sidebar {n}" for n in range(1, num_sidebars + 1)]
+            + ["Storyteller Sidebar"]
+        ):
+            voice = FakeVoiceChannel(self, vname, category)
+            category.voice_channels.append(voice)
+            self._channels[voice.id] = voice
+        return category
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    async def create_category(self, name, *, overwrites=None, reason=None, **kwargs):
+        await self.http.request("create_channel", ("guild", self.id))
+        category = FakeCategoryChannel(self, name)
+        self._channels[category.id] = category
+        return category
+
+    async def create_text_channel(self, name, *, category=None, reason=None, **kwargs):
+        await self.http.request("create_channel", ("guild", self.id))
+        channel = FakeTextChannel(self, name, category)
+        self._channels[channel.id] = channel
+        if category is not None:
+            category.text_channels.append(channel)
+        return channel
+
+    async def create_voice_channel(self, name, *, category=None, reason=None, **kwargs):
+        await self.http.request("create_channel", ("guild", self.id))
+        channel = FakeVoiceChannel(self, name, category)
+        self._channels[channel.id] = channel
+        if category is not None:
+            category.voice_channels.append(channel)
+        return channel
+
+    async def create_role(self, *, name, reason=None, **kwargs):
+        await self.http.request("create_role", ("guild", self.id))
+        return self.add_role(name)
+
+
+class FakeSettings(object):
+    """In-memory stand-in for the bot's persistent per-ID settings."""
+
+    def __init__(self, defaults=None):
+        self.defaults = {} if defaults is None else dict(defaults)
+        self._settings = {}
+
+    def get(self, id, key, default=None):
+        try:
+            return self._settings[id][key]
+        except KeyError:
+            return self.defaults.get(key, default)
+
+    def set(self, id, key, value):
+        self._settings.setdefault(id, {})[key] = value
+
+    def unset(self, id, key):
+        self._settings.get(id, {}).pop(key, None)
+
+    def teardown(self):
+        pass
+
+
+class FakeBot(object):
+    """Bare bot holding the attributes the town square extension sets up."""
+
+    def __init__(self, settings):
+        self.botc_townsquare_settings = settings
+        self.botc_townsquare = None
+
+
+class FakeContext(object):
+    """Synthetic command context for invoking a command as a member in a channel."""
+
+    def __init__(self, bot, command, author, channel, content=""):
+        self.bot = bot
+        self.command = command
+        self.guild = channel.guild
+        self.message = FakeMessage(channel, author, content)
+        self.prefix = "."
+        self.command_failed = False
+        self.invoked_subcommand = None
+
+    @property
+    def author(self):
+        return self.message.author
+
+    @property
+    def channel(self):
+        return self.message.channel
+
+    async def send(self, content=None, **kwargs):
+        return await self.message.channel.send(content, **kwargs)
+
+    async def invoke(self, command, *args, **kwargs):
+        return await command(self, *args, **kwargs)
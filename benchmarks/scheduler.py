@@ -0,0 +1,116 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Check that the write scheduler backs off on 429s and sends urgent writes first.
+
+A member edit is answered with a 429 by the fake HTTP layer. While its bucket is
+blocked, cosmetic, interactive, and critical writes are queued in that order. None
+of them may go out before Discord's retry-after time has passed, and then they have
+to go out most urgent first, in the order they were queued within a priority class.
+
+Run as a module from the bot's package root, e.g.
+
+    python -m <bot>.extensions.botc_extensions.benchmarks.scheduler
+
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import discord
+
+from . import fakes
+from ..townsquare.scheduler import (
+    MutationScheduler,
+    PRIORITY_COSMETIC,
+    PRIORITY_CRITICAL,
+    PRIORITY_INTERACTIVE,
+)
+
+# writes queued while the bucket is blocked, in the order they are queued
+QUEUED_WRITES = (
+    ("cosmetic 1", PRIORITY_COSMETIC),
+    ("cosmetic 2", PRIORITY_COSMETIC),
+    ("interactive 1", PRIORITY_INTERACTIVE),
+    ("critical", PRIORITY_CRITICAL),
+    ("interactive 2", PRIORITY_INTERACTIVE),
+    ("cosmetic 3", PRIORITY_COSMETIC),
+)
+# how early (timer resolution) and late the first queued write may go out
+BACKOFF_EARLY = 0.01
+BACKOFF_LATE = 0.1
+
+
+async def check_backoff(retry_after):
+    """Rate limit a bucket and queue writes on it, raising if they misbehave."""
+    http = fakes.FakeHTTP(latency=0.01, jitter=0.0)
+    guild = fakes.FakeGuild(http)
+    member = guild.add_member("Player")
+    writes = MutationScheduler()
+    started = []
+
+    def write(name, priority):
+        async def send():
+            started.append((name, time.monotonic()))
+            await member.edit(nick=name)
+
+        return writes.submit(("member", guild.id), priority, send)
+
+    http.inject_rate_limits("member", 1, retry_after)
+    try:
+        await write("rate limited", PRIORITY_INTERACTIVE)
+    except discord.HTTPException as e:
+        if e.status != 429:
+            raise
+    else:
+        raise AssertionError("The injected 429 did not reach the caller")
+    limited_at = time.monotonic()
+    await asyncio.gather(*(write(name, priority) for name, priority in QUEUED_WRITES))
+
+    problems = []
+    waited = started[1][1] - limited_at
+    if waited < retry_after - BACKOFF_EARLY:
+        problems.append(f"first write went out {waited:.3f}s after the 429")
+    elif waited > retry_after + BACKOFF_LATE:
+        problems.append(f"first write waited {waited:.3f}s after the 429")
+    order = [name for name, _ in started[1:]]
+    expected = [name for name, _ in sorted(QUEUED_WRITES, key=lambda write: write[1])]
+    if order != expected:
+        problems.append(f"writes went out as {order}, not {expected}")
+    if problems:
+        raise AssertionError(f"Retry after {retry_after}s: " + "; ".join(problems))
+    return waited
+
+
+def main(argv=None):
+    """Run the scheduler check from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        nargs="+",
+        default=[0.2, 0.5, 1.0],
+        help="retry-after seconds of the injected 429",
+    )
+    args = parser.parse_args(argv)
+
+    for retry_after in args.retry_after:
+        waited = asyncio.run(check_backoff(retry_after))
+        print(
+            f"Retry after {retry_after:.2f}s: backed off {waited:.3f}s, then sent"
+            f" {len(QUEUED_WRITES)} queued writes most urgent first"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
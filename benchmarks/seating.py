@@ -0,0 +1,66 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Naive seating model that the seating engine is timed and tested against."""
+
+import random
+
+
+class ListSeating(object):
+    """Naive seating model: a list of member IDs in seat order."""
+
+    def __init__(self, member_ids=()):
+        self.order = list(member_ids)
+
+    def _changes(self, before):
+        """List the members whose seat differs from the seats in `before`."""
+        return [
+            member_id
+            for seat, member_id in enumerate(self.order, 1)
+            if before.get(member_id) != seat
+        ]
+
+    def _seats(self):
+        return {member_id: seat for seat, member_id in enumerate(self.order, 1)}
+
+    def insert(self, member_id, seat=None):
+        before = self._seats()
+        if seat is None:
+            self.order.append(member_id)
+        else:
+            self.order.insert(min(max(seat, 1), len(self.order) + 1) - 1, member_id)
+        return self._changes(before)
+
+    def remove(self, member_id):
+        before = self._seats()
+        self.order.remove(member_id)
+        return self._changes(before)
+
+    def move(self, member_id, seat):
+        before = self._seats()
+        self.order.remove(member_id)
+        self.order.insert(min(max(seat, 1), len(self.order) + 1) - 1, member_id)
+        return self._changes(before)
+
+    def swap(self, member_id, other_id):
+        before = self._seats()
+        i, j = self.order.index(member_id), self.order.index(other_id)
+        self.order[i], self.order[j] = self.order[j], self.order[i]
+        return self._changes(before)
+
+    def reorder(self, member_ids):
+        before = self._seats()
+        self.order = list(member_ids)
+        return self._changes(before)
+
+    def shuffle(self, rng=random):
+        before = self._seats()
+        rng.shuffle(self.order)
+        return self._changes(before)
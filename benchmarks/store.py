@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Check that processes sharing a SQLite town store never lose each other's changes.
+
+Worker processes each make a number of changes to a handful of shared towns the way
+the town square does: a town is loaded once and kept, reloaded only when the store
+says it is no longer current, changed by adding a player, and saved. A stale save is
+retried from a fresh load. Afterwards every player added by every worker has to be
+in its town exactly once.
+
+Run as a module from the bot's package root, e.g.
+
+    python -m <bot>.extensions.botc_extensions.benchmarks.store --processes 4
+
+"""
+
+import argparse
+import multiprocessing
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+from ..townsquare.store import SQLiteTownStore, StaleTownError
+
+
+def make_changes(path, worker, num_changes, num_towns, seed):
+    """Add players to random towns in a shared store, returning the stale saves."""
+    store = SQLiteTownStore(path)
+    rng = random.Random(seed + worker)
+    towns = {}
+    conflicts = 0
+    for n in range(num_changes):
+        cat_id = rng.randrange(num_towns) + 1
+        member_id = worker * num_changes + n + 1
+        while True:
+            if cat_id not in towns or not store.is_current(cat_id):
+                towns[cat_id] = store.load(cat_id) or dict(players=[])
+            state = towns[cat_id]
+            state["players"].append(member_id)
+            try:
+                store.save(cat_id, state)
+            except StaleTownError:
+                conflicts += 1
+                del towns[cat_id]
+            else:
+                break
+    store.close()
+    return conflicts
+
+
+def check(path, num_processes, num_changes, num_towns):
+    """Check the towns left in the store, raising if any change was lost or doubled."""
+    store = SQLiteTownStore(path)
+    added = []
+    for cat_id in range(1, num_towns + 1):
+        state = store.load(cat_id)
+        if state is not None:
+            added += state["players"]
+    store.close()
+    expected = set(range(1, num_processes * num_changes + 1))
+    problems = []
+    if len(added) != len(set(added)):
+        problems.append(f"{len(added) - len(set(added))} players added twice")
+    if expected - set(added):
+        problems.append(f"{len(expected - set(added))} players lost")
+    if problems:
+        raise AssertionError("Inconsistent store: " + ", ".join(problems))
+
+
+def main(argv=None):
+    """Run the consistency check from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument(
+        "--changes", type=int, default=500, help="changes made by each process"
+    )
+    parser.add_argument("--towns", type=int, default=4, help="shared towns")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = pathlib.Path(tmpdir) / "towns.sqlite3"
+        # create the database before the workers race to
+        SQLiteTownStore(path).close()
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            conflicts = pool.starmap(
+                make_changes,
+                [
+                    (path, worker, args.changes, args.towns, args.seed)
+                    for worker in range(args.processes)
+                ],
+            )
+        elapsed = time.perf_counter() - start
+        check(path, args.processes, args.changes, args.towns)
+
+    num_changes = args.processes * args.changes
+    print(
+        f"{args.processes} processes x {args.changes} changes to {args.towns} towns:"
+        f" {elapsed:.2f}s, {num_changes / elapsed:.0f} changes/s,"
+        f" {sum(conflicts)} stale saves retried"
+    )
+    print("Consistent: every change was kept exactly once")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
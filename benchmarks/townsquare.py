@@ -0,0 +1,684 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Benchmark the town square cogs against a simulated Discord guild.
+
+Each scenario plays a scripted game in a number of concurrent towns, driving the real
+cog commands through synthetic contexts: storyteller and players join, players move
+seats, the town is shuffled and locked, some players die, nominations are made and
+voted on, the town square is summarized, and the town is cleared. Cog checks are
+skipped, but the command hooks run as they would when invoked by the bot.
+
+Run as a module from the bot's package root, e.g.
+
+    python -m <bot>.extensions.botc_extensions.benchmarks --towns 1,100 --players 5,20
+
+and pass `--save-baseline FILE` or `--baseline FILE` to record or compare results.
+Pass `--stores memory,sqlite` to compare the town store backends. Pass
+`--micro <name>,...` (or `--micro all`) to run micro-benchmarks of single operations
+instead of the game scenarios.
+
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import pathlib
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import discord
+
+from . import fakes
+from .seating import ListSeating
+from ..townsquare import BOTC_CATEGORY_DEFAULT_SETTINGS
+from ..townsquare.common import BOTCTownSquare
+from ..townsquare.events import GameEventLog
+from ..townsquare.journal import TownJournal
+from ..townsquare.manage import BOTCTownSquareManage
+from ..townsquare.players import BOTCTownSquarePlayers
+from ..townsquare.scheduler import MutationScheduler, safe_set_nickname
+from ..townsquare.seating import Seating
+from ..townsquare.settings import CategorySettings, format_name_re
+from ..townsquare.setup import BOTCTownSquareSetup
+from ..townsquare.state import TownState
+from ..townsquare.store import MemoryTownStore, SQLiteTownStore
+from ..townsquare.storytellers import BOTCTownSquareStorytellers
+
+BENCH_TOWNS = (1, 10, 100, 500)
+BENCH_PLAYERS = (5, 10, 20)
+BENCH_STORES = ("memory",)
+BENCH_RECORDS = (1000, 10000, 50000)
+BENCH_MEMORY_TOWNS = 1000
+BENCH_SEATING_OPERATIONS = 20000
+BENCH_CLEAR_PLAYERS = 12
+BENCH_CLEAR_TRAVELERS = 2
+# relative slowdown in p50/p99 latency or throughput reported as a regression
+BENCH_REGRESSION_TOLERANCE = 0.10
+# name -> micro-benchmark coroutine function, run with `--micro <name>`
+MICRO_BENCHMARKS = {}
+
+
+def percentile(sorted_values, q):
+    """Get the q-th quantile of sorted values by the nearest-rank method."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(q * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def open_store(kind, state_path):
+    """Open a town store of the given kind ("memory" or "sqlite") in a directory."""
+    if kind == "sqlite":
+        state_path.mkdir(parents=True, exist_ok=True)
+        return SQLiteTownStore(state_path / "towns.sqlite3")
+    elif kind == "memory":
+        return MemoryTownStore(TownJournal(state_path))
+    raise ValueError(f"Unknown town store {kind}")
+
+
+class Harness(object):
+    """A bot with the town square cogs, wired to fake guilds."""
+
+    def __init__(self, http, state_path, store="memory"):
+        """Set up the extension the way its `setup` function does."""
+        self.http = http
+        self.bot = fakes.FakeBot(fakes.FakeSettings(BOTC_CATEGORY_DEFAULT_SETTINGS))
+        # keep the benchmark's state apart from any real town state
+        ts = BOTCTownSquare(self.bot, store=open_store(store, state_path))
+        ts.events = GameEventLog(state_path / "events")
+        self.bot.botc_townsquare = ts
+        self.setup = BOTCTownSquareSetup(self.bot)
+        self.storytellers = BOTCTownSquareStorytellers(self.bot)
+        self.players = BOTCTownSquarePlayers(self.bot)
+        self.manage = BOTCTownSquareManage(self.bot)
+        for cog in (self.setup, self.storytellers, self.players, self.manage):
+            # bind the commands to their cog, as adding the cog to a bot would
+            for command in cog.walk_commands():
+                command.cog = cog
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def add_town(self, guild, name):
+        """Add an enabled town category with roles to a guild."""
+        category = guild.add_town(name)
+        settings = self.bot.botc_townsquare_settings
+        settings.set(category.id, "is_enabled", True)
+        for key in ("player", "traveler", "storyteller"):
+            role = guild.add_role(f"{key.title()} {name}")
+            settings.set(category.id, f"role.{key}", role.id)
+        return category
+
+    async def invoke(self, cog, name, author, channel, *args, **kwargs):
+        """Invoke a cog command as a member would, recording its latency."""
+        command = getattr(cog, name)
+        ctx = fakes.FakeContext(self.bot, command, author, channel)
+        start = time.perf_counter()
+        try:
+            await cog.cog_before_invoke(ctx)
+            await command(ctx, *args, **kwargs)
+        except Exception as e:
+            ctx.command_failed = True
+            self.errors[(command.qualified_name, type(e).__name__)] += 1
+        finally:
+            try:
+                await cog.cog_after_invoke(ctx)
+            except Exception as e:
+                self.errors[(command.qualified_name, type(e).__name__)] += 1
+            self.latencies[command.qualified_name].append(time.perf_counter() - start)
+        return ctx
+
+    async def play_game(self, guild, category, num_players, rng):
+        """Play a scripted game in a town."""
+        channel = category.text_channels[0]
+        storyteller = guild.add_member(f"{category.name} Storyteller")
+        players = [
+            guild.add_member(f"{category.name} Player {n}")
+            for n in range(1, num_players + 1)
+        ]
+
+        await self.invoke(self.setup, "storytell", storyteller, channel)
+        for player in players:
+            await self.invoke(self.setup, "play", player, channel)
+        for player in rng.sample(players, min(3, num_players)):
+            seat = rng.randint(1, num_players)
+            await self.invoke(self.setup, "sit", player, channel, seat)
+        await self.invoke(self.setup, "shuffle", storyteller, channel)
+        await self.invoke(self.storytellers, "lock", storyteller, channel)
+        for seat in rng.sample(range(1, num_players + 1), num_players // 3):
+            await self.invoke(self.players, "dead", storyteller, channel, [seat])
+        await self.invoke(self.players, "townsquare", storyteller, channel)
+        for _ in range(2):
+            nominator, target = rng.sample(range(1, num_players + 1), 2)
+            await self.invoke(
+                self.players, "nominate", storyteller, channel, [nominator, target]
+            )
+            votes = rng.randint(0, num_players)
+            await self.invoke(
+                self.players, "nominate_votes", storyteller, channel, votes
+            )
+        await self.invoke(self.players, "townsquare", storyteller, channel)
+        await self.invoke(self.storytellers, "clear", storyteller, channel)
+
+
+async def run_scenario(
+    num_towns, num_players, towns_per_guild, http_options, state_path, seed, store
+):
+    """Play games in concurrent towns and summarize the command latencies."""
+    http = fakes.FakeHTTP(seed=seed, **http_options)
+    harness = Harness(http, state_path, store)
+    rng = random.Random(seed)
+    guilds = []
+    towns = []
+    for n in range(num_towns):
+        if n % towns_per_guild == 0:
+            guilds.append(fakes.FakeGuild(http, name=f"Guild {len(guilds)}"))
+        guild = guilds[-1]
+        towns.append((guild, harness.add_town(guild, f"Town {n}")))
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            harness.play_game(guild, category, num_players, random.Random(rng.random()))
+            for guild, category in towns
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    # drop the delayed deletions of bot replies still waiting to happen
+    current = asyncio.current_task()
+    for task in asyncio.all_tasks():
+        if task is not current:
+            task.cancel()
+    harness.bot.botc_townsquare.teardown()
+
+    commands = {}
+    num_commands = 0
+    for name, latencies in sorted(harness.latencies.items()):
+        latencies.sort()
+        num_commands += len(latencies)
+        commands[name] = dict(
+            count=len(latencies),
+            p50=percentile(latencies, 0.5),
+            p99=percentile(latencies, 0.99),
+            mean=sum(latencies) / len(latencies),
+        )
+    return dict(
+        towns=num_towns,
+        players=num_players,
+        store=store,
+        elapsed=elapsed,
+        commands_per_second=num_commands / elapsed,
+        commands=commands,
+        api_calls=dict(sorted(http.calls.items())),
+        api_calls_total=sum(http.calls.values()),
+        rate_limited=sum(http.rate_limited.values()),
+        rate_limit_wait=http.wait_seconds,
+        failures=sum(http.failures.values()),
+        errors={f"{cmd}: {err}": n for (cmd, err), n in harness.errors.items()},
+        writes=dict(harness.bot.botc_townsquare.writes.stats),
+    )
+
+
+def micro_benchmark(fn):
+    """Register a micro-benchmark under its name without the `bench_` prefix.
+
+    A micro-benchmark is called with the HTTP options, a scratch directory, and the
+    seed, and returns its report as lines of text.
+
+    """
+    MICRO_BENCHMARKS[fn.__name__[len("bench_") :]] = fn
+    return fn
+
+
+@micro_benchmark
+async def bench_renumber(http_options, state_path, seed):
+    """Rename every player one request at a time and through the scheduler."""
+    lines = ["renumber: wall-clock time to rename every player"]
+    for num_players in BENCH_PLAYERS:
+        elapsed = {}
+        for mode in ("sequential", "scheduled"):
+            http = fakes.FakeHTTP(seed=seed, **http_options)
+            guild = fakes.FakeGuild(http)
+            edits = [
+                (guild.add_member(f"Player {n}"), f"_{n:02d} Player {n}")
+                for n in range(1, num_players + 1)
+            ]
+            start = time.perf_counter()
+            if mode == "sequential":
+                # as the cogs did before the scheduler, one round trip after another
+                for member, nick in edits:
+                    await safe_set_nickname(member, nick)
+            else:
+                await MutationScheduler().set_nicknames(edits)
+            elapsed[mode] = time.perf_counter() - start
+        lines.append(
+            f"    {num_players:>3} players  sequential {elapsed['sequential']:7.3f}s"
+            f"  scheduled {elapsed['scheduled']:7.3f}s"
+            f"  ({elapsed['sequential'] / elapsed['scheduled']:.1f}x)"
+        )
+    return lines
+
+
+@micro_benchmark
+async def bench_seating(http_options, state_path, seed):
+    """Time seating operations against the naive list model they replaced."""
+    lines = ["seating: microseconds per operation, Seating / list model"]
+    for num_players in BENCH_PLAYERS:
+        timings = collections.defaultdict(dict)
+        for name, cls in (("seating", Seating), ("list", ListSeating)):
+            rng = random.Random(seed)
+            seating = cls(range(num_players))
+            ops = [
+                (rng.randrange(num_players), rng.randrange(num_players) + 1)
+                for _ in range(BENCH_SEATING_OPERATIONS)
+            ]
+            start = time.perf_counter()
+            for member_id, seat in ops:
+                seating.move(member_id, seat)
+            timings["move"][name] = time.perf_counter() - start
+            start = time.perf_counter()
+            for member_id, other in ops:
+                seating.swap(member_id, other - 1)
+            timings["swap"][name] = time.perf_counter() - start
+            start = time.perf_counter()
+            for member_id, seat in ops:
+                seating.remove(member_id)
+                seating.insert(member_id, seat)
+            timings["remove+insert"][name] = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in ops:
+                seating.shuffle(rng)
+            timings["shuffle"][name] = time.perf_counter() - start
+        cells = "  ".join(
+            f"{op} {t['seating'] * 1e6 / len(ops):5.2f}"
+            f"/{t['list'] * 1e6 / len(ops):5.2f}"
+            for op, t in timings.items()
+        )
+        lines.append(f"    {num_players:>3} players  {cells}")
+    return lines
+
+
+async def sequential_clear(harness, category):
+    """Clear a town the way `clear` did before batching member edits."""
+    ts = harness.bot.botc_townsquare
+    guild = category.guild
+    town = ts.get_town(category)
+    for key, member_ids in (
+        ("player", town.players),
+        ("storyteller", town.storytellers),
+        ("traveler", town.travelers),
+    ):
+        role = guild.get_role(town.role_ids[key])
+        for member in ts.get_members(guild, member_ids):
+            if key != "traveler":
+                nick = ts.match_name_re(category, member)["nick"]
+                await safe_set_nickname(member, nick)
+            try:
+                # one request, as `member.remove_roles` is
+                await member.edit(roles=[r for r in member.roles if r is not role])
+            except discord.HTTPException:
+                pass
+    ts.del_town(category)
+
+
+@micro_benchmark
+async def bench_clear(http_options, state_path, seed):
+    """Clear a full town one request at a time and with the `clear` command."""
+    lines = [
+        f"clear: {BENCH_CLEAR_PLAYERS} players ({BENCH_CLEAR_TRAVELERS} traveling)"
+        " and a storyteller"
+    ]
+    for mode in ("sequential", "command"):
+        http = fakes.FakeHTTP(seed=seed, **http_options)
+        harness = Harness(http, state_path / mode)
+        guild = fakes.FakeGuild(http)
+        category = harness.add_town(guild, "Town")
+        town = harness.bot.botc_townsquare.get_town(category)
+        roles = {key: guild.get_role(town.role_ids[key]) for key in town.role_ids}
+        # seat everyone without API calls, as if the game had been played
+        storyteller = guild.add_member("Storyteller")
+        storyteller.nick = f"!ST {storyteller.name}"
+        storyteller.roles.append(roles["storyteller"])
+        town.add_storyteller(storyteller.id)
+        members = [storyteller]
+        for seat in range(1, BENCH_CLEAR_PLAYERS + 1):
+            player = guild.add_member(f"Player {seat}")
+            player.nick = f"_{seat:02d} {player.name}"
+            player.roles.append(roles["player"])
+            town.add_player(player.id)
+            if seat <= BENCH_CLEAR_TRAVELERS:
+                player.roles.append(roles["traveler"])
+                town.add_traveler(player.id)
+            members.append(player)
+        start = time.perf_counter()
+        if mode == "sequential":
+            await sequential_clear(harness, category)
+        else:
+            await harness.invoke(
+                harness.storytellers, "clear", storyteller, category.text_channels[0]
+            )
+        elapsed = time.perf_counter() - start
+        left = sum(
+            member.display_name != member.name or len(member.roles) > 1
+            for member in members
+        )
+        lines.append(
+            f"    {mode:<10} {elapsed:7.3f}s  {http.calls['edit_member']:>3} member"
+            f" edits, {left} members left uncleared"
+        )
+    return lines
+
+
+@micro_benchmark
+async def bench_restore(http_options, state_path, seed):
+    """Journal changes to 100 towns, then restore them from journal and snapshot."""
+    rng = random.Random(seed)
+    lines = ["restore: journal write overhead and restore time for 100 towns"]
+    for num_records in BENCH_RECORDS:
+        path = state_path / str(num_records)
+        # keep every record in the journal tail until it is closed
+        journal = TownJournal(path, compact_records=num_records + 1)
+        towns = []
+        for cat_id in range(1, 101):
+            town = TownState(cat_id, None)
+            for member_id in range(cat_id * 100, cat_id * 100 + 10):
+                town.add_player(member_id)
+            towns.append(town)
+        for _ in range(num_records):
+            town = rng.choice(towns)
+            member_id = town.member_at_seat(rng.randint(1, 10))
+            town.update_info(member_id, dead=not town.get_info(member_id).dead)
+            journal.record(town.category_id, town.to_dict())
+        record = journal.stats["record_seconds"] / num_records
+        # finish the writes without compacting
+        journal.handoff()
+        start = time.perf_counter()
+        TownJournal(path).load()
+        from_journal = time.perf_counter() - start
+        journal = TownJournal(path)
+        journal.load()
+        journal.close()
+        start = time.perf_counter()
+        TownJournal(path).load()
+        from_snapshot = time.perf_counter() - start
+        lines.append(
+            f"    {num_records:>6} records  record {record * 1e6:6.1f}us"
+            f"  restore from journal {from_journal * 1000:7.1f}ms"
+            f"  from snapshot {from_snapshot * 1000:5.1f}ms"
+        )
+    return lines
+
+
+def dict_town(settings, members, storyteller, messages):
+    """Populate a town in the dictionary layout used before `TownState`."""
+    town = dict(
+        players=set(),
+        player_order=[],
+        player_info=collections.defaultdict(
+            lambda: dict(seat=None, dead=False, num_votes=None, traveling=False)
+        ),
+        travelers=set(),
+        storytellers={storyteller},
+        locked=True,
+        nomination=messages[1],
+        prev_nomination=messages[0],
+        role_ids=dict(settings.role_ids),
+        emojis=dict(settings.emojis),
+        name_re=format_name_re(settings.emojis),
+    )
+    for seat, member in enumerate(members, 1):
+        town["players"].add(member)
+        town["player_order"].append(member)
+        town["player_info"][member]["seat"] = seat
+    for member in members[:3]:
+        town["player_info"][member]["dead"] = True
+    return town
+
+
+def slotted_town(settings, members, storyteller, messages):
+    """Populate a `TownState` the same way as `dict_town`."""
+    town = TownState(settings.category_id, settings)
+    town.add_storyteller(storyteller.id)
+    for member in members:
+        town.add_player(member.id)
+    for member in members[:3]:
+        town.update_info(member.id, dead=True)
+    town.set_locked(True)
+    town.set_nomination(messages[0], members[3].id, members[4].id)
+    town.finish_nomination()
+    town.set_nomination(messages[1], members[5].id, members[6].id)
+    # the registry logs and drops queued events after every command
+    town.take_events()
+    return town
+
+
+@micro_benchmark
+async def bench_memory(http_options, state_path, seed):
+    """Compare the memory held by populated towns in the old and new layouts."""
+    http = fakes.FakeHTTP(seed=seed, **http_options)
+    store = fakes.FakeSettings(BOTC_CATEGORY_DEFAULT_SETTINGS)
+    guild = fakes.FakeGuild(http)
+    # Discord objects live in the client's cache either way, so are made untraced
+    towns = []
+    for n in range(BENCH_MEMORY_TOWNS):
+        category = guild.add_town(f"Town {n}", num_sidebars=0)
+        store.set(category.id, "is_enabled", True)
+        for key in ("player", "traveler", "storyteller"):
+            store.set(category.id, f"role.{key}", guild.add_role(key).id)
+        channel = category.text_channels[0]
+        members = [guild.add_member(f"Player {i}") for i in range(10)]
+        storyteller = guild.add_member("Storyteller")
+        messages = [fakes.FakeMessage(channel, storyteller) for _ in range(2)]
+        towns.append((category, members, storyteller, messages))
+    lines = [f"memory: {BENCH_MEMORY_TOWNS} towns of 10 players, locked, nominating"]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    snapshots = [CategorySettings(town[0], store) for town in towns]
+    settings_size = tracemalloc.get_traced_memory()[0] - before
+    for name, make_town in (("dict", dict_town), ("slotted", slotted_town)):
+        before = tracemalloc.get_traced_memory()[0]
+        made = [
+            make_town(settings, members, storyteller, messages)
+            for settings, (_, members, storyteller, messages) in zip(snapshots, towns)
+        ]
+        size = tracemalloc.get_traced_memory()[0] - before
+        lines.append(
+            f"    {name:<9} {size / 1024:8.1f} KiB  {size / len(made):6.0f} bytes/town"
+        )
+        del made
+    tracemalloc.stop()
+    # the old layout copied what it needed, the new one refers to the snapshot
+    lines.append(
+        f"    settings  {settings_size / 1024:8.1f} KiB"
+        f"  {settings_size / len(snapshots):6.0f} bytes/town (slotted towns only)"
+    )
+    return lines
+
+
+def scenario_key(result):
+    key = f"{result['towns']} towns x {result['players']} players"
+    store = result.get("store", "memory")
+    return key if store == "memory" else f"{key} ({store} store)"
+
+
+def format_result(result):
+    """Format a scenario result as lines of text."""
+    lines = [
+        f"{scenario_key(result)}: {result['elapsed']:.2f}s,"
+        f" {result['commands_per_second']:.1f} commands/s,"
+        f" {result['api_calls_total']} API calls,"
+        f" {result['rate_limited']} rate limited,"
+        f" {result['failures']} failed"
+    ]
+    for name, stats in result["commands"].items():
+        lines.append(
+            f"    {name:<16} {stats['count']:>6}x"
+            f"  p50 {stats['p50'] * 1000:8.1f}ms  p99 {stats['p99'] * 1000:8.1f}ms"
+        )
+    for error, count in sorted(result["errors"].items()):
+        lines.append(f"    error {error}: {count}")
+    return lines
+
+
+def compare(results, baseline, tolerance=BENCH_REGRESSION_TOLERANCE):
+    """Compare results against baseline results, returning lines and regressions."""
+    base = {scenario_key(result): result for result in baseline}
+    lines = []
+    regressions = 0
+
+    def change(new, old, higher_is_better=False):
+        nonlocal regressions
+        if not old:
+            return "   n/a"
+        ratio = new / old - 1
+        worse = -ratio if higher_is_better else ratio
+        flag = ""
+        if worse > tolerance:
+            regressions += 1
+            flag = " !"
+        return f"{ratio:+6.1%}{flag}"
+
+    for result in results:
+        key = scenario_key(result)
+        old = base.get(key)
+        if old is None:
+            lines.append(f"{key}: no baseline")
+            continue
+        throughput = change(
+            result["commands_per_second"], old["commands_per_second"], True
+        )
+        api_calls = change(result["api_calls_total"], old["api_calls_total"])
+        lines.append(f"{key}: throughput {throughput}, API calls {api_calls}")
+        for name, stats in result["commands"].items():
+            old_stats = old["commands"].get(name)
+            if old_stats is None:
+                continue
+            lines.append(
+                f"    {name:<16} p50 {change(stats['p50'], old_stats['p50'])}"
+                f"  p99 {change(stats['p99'], old_stats['p99'])}"
+            )
+    return lines, regressions
+
+
+def parse_ints(text):
+    return tuple(int(n) for n in text.split(","))
+
+
+def parse_names(text):
+    return tuple(name.strip() for name in text.split(","))
+
+
+def main(argv=None):
+    """Run the benchmark scenarios from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--towns", type=parse_ints, default=BENCH_TOWNS, help="concurrent towns"
+    )
+    parser.add_argument(
+        "--players", type=parse_ints, default=BENCH_PLAYERS, help="players per town"
+    )
+    parser.add_argument("--towns-per-guild", type=int, default=1)
+    parser.add_argument(
+        "--stores",
+        type=parse_names,
+        default=BENCH_STORES,
+        help="town store backends (memory, sqlite)",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="API call latency (s)"
+    )
+    parser.add_argument("--jitter", type=float, default=0.05, help="latency jitter (s)")
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="fraction of failed calls"
+    )
+    parser.add_argument(
+        "--raise-rate-limits",
+        action="store_true",
+        help="raise 429 errors instead of waiting like discord.py",
+    )
+    parser.add_argument(
+        "--micro",
+        type=parse_names,
+        help="run micro-benchmarks instead of game scenarios"
+        f" ({', '.join(MICRO_BENCHMARKS)}, or all)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=pathlib.Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=pathlib.Path, help="compare to results")
+    parser.add_argument(
+        "--save-baseline", type=pathlib.Path, help="write results as a new baseline"
+    )
+    args = parser.parse_args(argv)
+
+    http_options = dict(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        raise_rate_limits=args.raise_rate_limits,
+    )
+    if args.micro:
+        names = list(MICRO_BENCHMARKS) if args.micro == ("all",) else args.micro
+        for name in names:
+            if name not in MICRO_BENCHMARKS:
+                parser.error(f"unknown micro-benchmark {name}")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in names:
+                lines = asyncio.run(
+                    MICRO_BENCHMARKS[name](
+                        http_options, pathlib.Path(tmpdir) / name, args.seed
+                    )
+                )
+                print("\n".join(lines), flush=True)
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for store, num_towns, num_players in itertools.product(
+            args.stores, args.towns, args.players
+        ):
+            state_path = pathlib.Path(tmpdir) / f"{store}_{num_towns}_{num_players}"
+            result = asyncio.run(
+                run_scenario(
+                    num_towns,
+                    num_players,
+                    args.towns_per_guild,
+                    http_options,
+                    state_path,
+                    args.seed,
+                    store,
+                )
+            )
+            results.append(result)
+            print("\n".join(format_result(result)), flush=True)
+
+    for path in (args.output, args.save_baseline):
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare(results, baseline)
+        print(f"\nCompared to {args.baseline}:")
+        print("\n".join(lines))
+        if regressions:
+            print(f"{regressions} regressions beyond {BENCH_REGRESSION_TOLERANCE:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
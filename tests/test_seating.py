@@ -0,0 +1,103 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Tests for the seating engine, checked against a plain list of seated members."""
+
+import random
+
+import pytest
+
+from ..benchmarks.seating import ListSeating
+from ..townsquare.seating import Seating
+
+
+def random_operation(rng, order, next_id):
+    """Choose a valid operation on the seated members, as (name, args)."""
+    size = len(order)
+    choices = ["insert"]
+    if size:
+        choices += ["remove", "move", "reorder", "shuffle"]
+    if size > 1:
+        choices.append("swap")
+    name = rng.choice(choices)
+    # seats a little out of range are clamped, so try those too
+    seat = rng.randint(-1, size + 2)
+    if name == "insert":
+        return name, (next_id, rng.choice([None, seat]))
+    elif name == "remove":
+        return name, (rng.choice(order),)
+    elif name == "move":
+        return name, (rng.choice(order), seat)
+    elif name == "swap":
+        return name, tuple(rng.sample(order, 2))
+    elif name == "reorder":
+        return name, (rng.sample(order, size),)
+    return name, (rng.random(),)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_agrees_with_list_model(seed):
+    rng = random.Random(seed)
+    initial = list(range(1, rng.randint(0, 20) + 1))
+    seating = Seating(initial)
+    model = ListSeating(initial)
+    next_id = len(initial) + 1
+    for step in range(50):
+        name, args = random_operation(rng, model.order, next_id)
+        if name == "insert":
+            next_id += 1
+        if name == "shuffle":
+            # the same shuffle for both, from a generator seeded alike
+            changed = seating.shuffle(random.Random(args[0]))
+            expected = model.shuffle(random.Random(args[0]))
+        else:
+            changed = getattr(seating, name)(*args)
+            expected = getattr(model, name)(*args)
+        where = f"step {step}, {name}{args}"
+        assert list(seating) == model.order, where
+        assert len(changed) == len(set(changed)), where
+        assert set(changed) == set(expected), where
+        assert len(seating) == len(model.order), where
+        for seat, member_id in enumerate(model.order, 1):
+            assert seating.seat_of(member_id) == seat, where
+            assert seating.member_at(seat) == member_id, where
+        assert seating.member_at(len(seating) + 1) is None, where
+
+
+def test_move_shifts_those_in_between():
+    seating = Seating([1, 2, 3, 4, 5])
+    assert sorted(seating.move(4, 2)) == [2, 3, 4]
+    assert list(seating) == [1, 4, 2, 3, 5]
+
+
+def test_swap_changes_only_the_two_members():
+    seating = Seating([1, 2, 3, 4])
+    assert seating.swap(1, 4) == [1, 4]
+    assert list(seating) == [4, 2, 3, 1]
+    assert seating.swap(2, 2) == []
+
+
+def test_out_of_range_seats_are_clamped():
+    seating = Seating([1, 2, 3])
+    assert seating.insert(4, 10) == [4]
+    assert seating.seat_of(4) == 4
+    assert sorted(seating.move(4, 0)) == [1, 2, 3, 4]
+    assert list(seating) == [4, 1, 2, 3]
+    assert seating.member_at(0) is None
+
+
+def test_invalid_changes_are_refused():
+    seating = Seating([1, 2])
+    with pytest.raises(ValueError):
+        seating.insert(1)
+    with pytest.raises(ValueError):
+        seating.reorder([1, 3])
+    with pytest.raises(KeyError):
+        seating.remove(3)
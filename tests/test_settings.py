@@ -0,0 +1,69 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Tests for applying town settings documents."""
+
+import logging
+
+import pytest
+
+from ..benchmarks import fakes
+from ..townsquare.settings import BOTC_CATEGORY_DEFAULT_SETTINGS, apply_settings
+
+
+class FailingSettings(fakes.FakeSettings):
+    """Settings store whose writes fail after a number of them have succeeded."""
+
+    def __init__(self, writes, fail_rollback=False):
+        super().__init__(BOTC_CATEGORY_DEFAULT_SETTINGS)
+        self.writes = writes
+        self.fail_rollback = fail_rollback
+        self.failed = False
+
+    def _write(self):
+        if self.failed and self.fail_rollback:
+            raise RuntimeError("settings file has gone away")
+        if self.writes == 0 and not self.failed:
+            self.failed = True
+            raise OSError("settings file is read-only")
+        self.writes -= 1
+
+    def set(self, id, key, value):
+        self._write()
+        super().set(id, key, value)
+
+    def unset(self, id, key):
+        self._write()
+        super().unset(id, key)
+
+
+def test_failed_write_rolls_back_to_stored_and_default_values():
+    settings = FailingSettings(writes=3)
+    settings.set(1, "emoji.dead", "☠️")
+    changes = [
+        (1, "emoji.dead", "🪦"),
+        (1, "board.interval", 10),
+        (1, "emoji.vote", "✋"),
+    ]
+    with pytest.raises(OSError):
+        apply_settings(changes, settings)
+    assert settings.get(1, "emoji.dead") == "☠️"
+    # a setting left to its default is unset again rather than pinned to it
+    assert "board.interval" not in settings._settings[1]
+    assert settings.get(1, "emoji.vote") == BOTC_CATEGORY_DEFAULT_SETTINGS["emoji.vote"]
+
+
+def test_failed_rollback_is_logged_and_the_original_error_raised(caplog):
+    settings = FailingSettings(writes=1, fail_rollback=True)
+    changes = [(1, "emoji.dead", "🪦"), (1, "board.interval", 10)]
+    with caplog.at_level(logging.ERROR):
+        with pytest.raises(OSError):
+            apply_settings(changes, settings)
+    assert "Failed to roll back setting emoji.dead" in caplog.text
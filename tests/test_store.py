@@ -0,0 +1,103 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Tests for towns shared by town squares through a SQLite town store."""
+
+import asyncio
+
+import pytest
+
+from ..benchmarks import fakes
+from ..townsquare import BOTC_CATEGORY_DEFAULT_SETTINGS
+from ..townsquare.common import BOTCTownSquare, BOTCTownSquareErrors
+from ..townsquare.events import GameEventLog
+from ..townsquare.store import SQLiteTownStore
+
+
+def make_townsquare(db_path, state_path, settings):
+    """Set up a town square the way the extension does, on a shared store."""
+    bot = fakes.FakeBot(settings)
+    ts = BOTCTownSquare(bot, store=SQLiteTownStore(db_path))
+    ts.events = GameEventLog(state_path / "events")
+    bot.botc_townsquare = ts
+    return ts
+
+
+async def add_player(ts, category, member_id):
+    """Add a player the way a command does, holding the town until it is saved."""
+    await ts.hold_town(category)
+    try:
+        ts.get_town(category).add_player(member_id)
+        await ts.save_town(category)
+    finally:
+        ts.release_town(category)
+
+
+def test_stale_save_reloads_and_raises(tmp_path):
+    async def main():
+        settings = fakes.FakeSettings(BOTC_CATEGORY_DEFAULT_SETTINGS)
+        guild = fakes.FakeGuild(fakes.FakeHTTP(latency=0, jitter=0))
+        category = guild.add_town("Town")
+        settings.set(category.id, "is_enabled", True)
+        db_path = tmp_path / "towns.sqlite3"
+        first = make_townsquare(db_path, tmp_path / "first", settings)
+        second = make_townsquare(db_path, tmp_path / "second", settings)
+        try:
+            await add_player(first, category, 1)
+            await add_player(second, category, 2)
+            assert first.get_town(category).players == {1, 2}
+
+            # both processes start a command on the same version of the town
+            await first.hold_town(category)
+            await second.hold_town(category)
+            first.get_town(category).add_player(3)
+            second.get_town(category).add_player(4)
+            await first.save_town(category)
+            with pytest.raises(BOTCTownSquareErrors.TownChanged):
+                await second.save_town(category)
+            first.release_town(category)
+            second.release_town(category)
+
+            # the loser dropped its change and carries on from the winner's town
+            assert second.get_town(category).players == {1, 2, 3}
+            assert second.store.stats["conflicts"] == 1
+            await add_player(second, category, 4)
+            assert first.get_town(category).players == {1, 2, 3, 4}
+        finally:
+            first.teardown()
+            second.teardown()
+
+    asyncio.run(main())
+
+
+def test_store_loads_log_no_events(tmp_path):
+    async def main():
+        settings = fakes.FakeSettings(BOTC_CATEGORY_DEFAULT_SETTINGS)
+        guild = fakes.FakeGuild(fakes.FakeHTTP(latency=0, jitter=0))
+        category = guild.add_town("Town")
+        settings.set(category.id, "is_enabled", True)
+        db_path = tmp_path / "towns.sqlite3"
+        first = make_townsquare(db_path, tmp_path / "first", settings)
+        second = make_townsquare(db_path, tmp_path / "second", settings)
+        try:
+            await add_player(first, category, 1)
+            # loaded cold from the store
+            await add_player(second, category, 2)
+            # reloaded after the other process changed it
+            await add_player(first, category, 3)
+            assert first.get_town(category).players == {1, 2, 3}
+            # each town square logged only its own additions
+            assert first.events.stats["events"] == 2
+            assert second.events.stats["events"] == 1
+        finally:
+            first.teardown()
+            second.teardown()
+
+    asyncio.run(main())
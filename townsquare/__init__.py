@@ -11,20 +11,15 @@
 """Discord extension for facilitating Blood on the Clocktower voice/text games."""
 
 from .common import BOTCTownSquare
+from .handoff import put_handoff, take_handoff
+from .listeners import BOTCTownSquareListeners
 from .manage import BOTCTownSquareManage
 from .players import BOTCTownSquarePlayers
+from .settings import BOTC_CATEGORY_DEFAULT_SETTINGS
 from .setup import BOTCTownSquareSetup
 from .storytellers import BOTCTownSquareStorytellers
 from ...utils.persistent_settings import DiscordIDSettings
 
-BOTC_CATEGORY_DEFAULT_SETTINGS = {
-    "emoji.dead": "💀",
-    "emoji.vote": "👻",
-    "emoji.novote": "🚫",
-    "emoji.traveling": "🚁",
-    "emoji.storytelling": "📕",
-}
-
 
 def setup(bot):
     """Set up the Blood on the Clocktower extension."""
@@ -32,9 +27,16 @@ def setup(bot):
     bot.botc_townsquare_settings = DiscordIDSettings(
         bot, "botc_townsquare", BOTC_CATEGORY_DEFAULT_SETTINGS
     )
-    # set up town square object
-    bot.botc_townsquare = BOTCTownSquare(bot)
+    # set up town square object, with towns shared through a store if one is given,
+    # carrying on from the live state left by teardown if this is a reload
+    bot.botc_townsquare = BOTCTownSquare(
+        bot,
+        store=getattr(bot, "botc_townsquare_store", None),
+        handoff=take_handoff(bot),
+    )
 
+    # keep the town square's caches in step with Discord
+    bot.add_cog(BOTCTownSquareListeners(bot))
     bot.add_cog(BOTCTownSquareSetup(bot))
     bot.add_cog(BOTCTownSquareStorytellers(bot))
     bot.add_cog(BOTCTownSquarePlayers(bot))
@@ -45,5 +47,7 @@ def teardown(bot):
     """Tear down the Blood on the Clocktower extension."""
     # tear down persistent botc town square category settings
     bot.botc_townsquare_settings.teardown()
-    # tear down town square object
-    bot.botc_townsquare.teardown()
+    # hand live town square state to the next setup, in case this is a reload, or
+    # else close the town square's store and files for good
+    ts = bot.botc_townsquare
+    put_handoff(bot, ts.handoff(), ts.teardown)
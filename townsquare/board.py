@@ -0,0 +1,113 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Live town square boards for Blood on the Clocktower town square extension."""
+
+import asyncio
+import collections
+import logging
+import time
+
+import discord
+
+from .scheduler import PRIORITY_COSMETIC, spawn
+
+BOTC_BOARD_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+
+
+class LiveBoards(object):
+    """Pinned town square messages edited in place as their towns change.
+
+    A town has a board if its category's `board.message` setting holds the
+    (channel ID, message ID) of one. After the town changes, the board is edited
+    at most once per `board.interval` seconds however many changes come in a burst:
+    the first change schedules an edit for one interval after the previous edit,
+    and later changes just ride along, since the board is rendered from the town
+    when the edit goes out.
+
+    """
+
+    def __init__(self, townsquare, clock=time.monotonic):
+        """Initialize boards for the given town square."""
+        self.townsquare = townsquare
+        self.clock = clock
+        self.stats = collections.Counter()
+        # category ID -> timer handle of the scheduled edit
+        self._scheduled = {}
+        # category ID -> time of the last edit
+        self._edited = {}
+        self._tasks = set()
+
+    def request(self, category):
+        """Schedule an edit of a category's board, if it has one."""
+        settings = self.townsquare.get_settings(category)
+        if settings["board.message"] is None:
+            return
+        self.stats["requests"] += 1
+        if category.id in self._scheduled:
+            self.stats["coalesced"] += 1
+            return
+        interval = settings["board.interval"] or 0
+        last = self._edited.get(category.id)
+        delay = 0 if last is None else max(last + interval - self.clock(), 0)
+        loop = asyncio.get_event_loop()
+        self._scheduled[category.id] = loop.call_later(
+            delay, lambda: spawn(self._tasks, self._edit(category))
+        )
+
+    def cancel(self, category):
+        """Forget any scheduled edit of a category's board."""
+        handle = self._scheduled.pop(category.id, None)
+        if handle is not None:
+            handle.cancel()
+        self._edited.pop(category.id, None)
+
+    def handoff(self):
+        """Stop scheduling edits and return what `adopt` needs to carry on."""
+        for handle in self._scheduled.values():
+            handle.cancel()
+        return dict(
+            scheduled=list(self._scheduled), edited=self._edited, stats=self.stats
+        )
+
+    def adopt(self, data):
+        """Carry on from another town square's boards, rescheduling their edits."""
+        self._edited = data["edited"]
+        self.stats = data["stats"]
+        for cat_id in data["scheduled"]:
+            category = self.townsquare.bot.get_channel(cat_id)
+            if category is not None:
+                self.request(category)
+
+    async def _edit(self, category):
+        del self._scheduled[category.id]
+        ts = self.townsquare
+        ids = ts.get_settings(category)["board.message"]
+        message = ts.get_partial_message(category.guild, ids)
+        if message is None:
+            return
+        self._edited[category.id] = self.clock()
+        self.stats["edits"] += 1
+        try:
+            await ts.writes.edit_message(
+                message,
+                priority=PRIORITY_COSMETIC,
+                supersede=True,
+                embed=ts.townsquare_embed(category),
+            )
+        except discord.NotFound:
+            # the board was deleted, so stop keeping it
+            ts.bot.botc_townsquare_settings.unset(category.id, "board.message")
+            ts.invalidate_settings(category)
+        except discord.HTTPException as e:
+            ts.metrics.observe_swallowed("board_edit", e)
+            logger.warning("Failed to edit town board in %s: %s", category.id, e)
@@ -11,22 +11,47 @@
 """Common components for Blood on the Clocktower town square extension."""
 
 import collections
-import re
-import textwrap
+import functools
+import math
+import time
 
 import discord
 from discord.ext import commands
 
-BOTC_MESSAGE_DELETE_DELAY = 60
+from .board import LiveBoards
+from .events import GameEventLog
+from .metrics import timed, TownMetrics
+from .profiling import CommandProfiler
+from .registry import TownRegistry
+from .rehydrate import state_from_nicknames, town_members
+from .scheduler import MemberEditBatch, MutationScheduler, spawn
+from .settings import SettingsCache
+from .state import TownState
+from .store import MemoryTownStore, StaleTownError
 
+BOTC_MESSAGE_DELETE_DELAY = 60
 
-async def safe_set_nickname(member, nick):
-    """Set nickname, trimming for length and catching all errors."""
-    shortened = textwrap.shorten(nick, 32, placeholder="")
-    try:
-        await member.edit(nick=shortened)
-    except (discord.Forbidden, discord.HTTPException):
-        pass
+EMOJI_DIGITS = {
+    str(num): "{}\N{VARIATION SELECTOR-16}\N{COMBINING ENCLOSING KEYCAP}".format(num)
+    for num in range(10)
+}
+EMOJI_DIGITS[" "] = "\N{BLACK LARGE SQUARE}"
+EMOJI_DIGITS["10"] = "\N{KEYCAP TEN}"
+EMOJI_DIGITS["*"] = "*\N{VARIATION SELECTOR-16}\N{COMBINING ENCLOSING KEYCAP}"
+
+BOTC_COUNT = {
+    5: dict(town=3, out=0, minion=1, demon=1),
+    6: dict(town=3, out=1, minion=1, demon=1),
+    7: dict(town=5, out=0, minion=1, demon=1),
+    8: dict(town=5, out=1, minion=1, demon=1),
+    9: dict(town=5, out=2, minion=1, demon=1),
+    10: dict(town=7, out=0, minion=2, demon=1),
+    11: dict(town=7, out=1, minion=2, demon=1),
+    12: dict(town=7, out=2, minion=2, demon=1),
+    13: dict(town=9, out=0, minion=3, demon=1),
+    14: dict(town=9, out=1, minion=3, demon=1),
+    15: dict(town=9, out=2, minion=3, demon=1),
+}
 
 
 def is_called_from_botc_category():
@@ -37,8 +62,10 @@ def is_called_from_botc_category():
             # don't restrict match if command is in a DM
             return True
         else:
-            cat_id = ctx.message.channel.category.id
-            return ctx.bot.botc_townsquare_settings.get(cat_id, "is_enabled", False)
+            category = ctx.message.channel.category
+            if category is None:
+                return False
+            return ctx.bot.botc_townsquare.get_settings(category).enabled
 
     return commands.check(predicate)
 
@@ -69,22 +96,31 @@ class BOTCTownSquareErrors(object):
 
         pass
 
+    class TownChanged(commands.CommandError):
+        """Town was changed by another bot process while a command ran."""
+
+        pass
+
 
 class BOTCTownSquareErrorMixin(object):
     async def cog_command_error(self, ctx, error):
         """Handle common cog errors."""
+        writes = self.bot.botc_townsquare.writes
         if isinstance(error, BOTCTownSquareErrors.BadPlayerArgument):
-            await ctx.send(
+            await writes.send(
+                ctx,
                 f"This game isn't meant for {error.member.display_name}.",
                 delete_after=BOTC_MESSAGE_DELETE_DELAY,
             )
         elif isinstance(error, BOTCTownSquareErrors.BadSeatArgument):
-            await ctx.send(
+            await writes.send(
+                ctx,
                 "That seat doesn't look like anything to me.",
                 delete_after=BOTC_MESSAGE_DELETE_DELAY,
             )
         elif isinstance(error, BOTCTownSquareErrors.BadSidebarArgument):
-            await ctx.send(
+            await writes.send(
+                ctx,
                 "That sidebar doesn't look like anything to me.",
                 delete_after=BOTC_MESSAGE_DELETE_DELAY,
             )
@@ -93,162 +129,549 @@ class BOTCTownSquareErrorMixin(object):
                 f"Before I'll allow that, you'll need to put the town into a deep and"
                 f" dreamless slumber. [`{ctx.prefix}unlock` first]"
             )
-            await ctx.send(locked_message, delete_after=BOTC_MESSAGE_DELETE_DELAY)
+            await writes.send(
+                ctx, locked_message, delete_after=BOTC_MESSAGE_DELETE_DELAY
+            )
         elif isinstance(error, BOTCTownSquareErrors.TownUnlocked):
             unlocked_message = (
                 f"This game isn't meant for anyone yet. [`{ctx.prefix}lock` first]"
             )
-            await ctx.send(unlocked_message, delete_after=BOTC_MESSAGE_DELETE_DELAY)
+            await writes.send(
+                ctx, unlocked_message, delete_after=BOTC_MESSAGE_DELETE_DELAY
+            )
+        elif isinstance(error, BOTCTownSquareErrors.TownChanged):
+            await writes.send(
+                ctx,
+                "The town changed while I was busy with that, so it didn't stick."
+                f" Check `{ctx.prefix}townsquare` and try again.",
+                delete_after=BOTC_MESSAGE_DELETE_DELAY,
+            )
         else:
             # if we're not handling the error here, return so the rest doesn't happen
             return
         # mark error as handled so that bot error handler ignores it
         error.handled = True
         # delete errored command message with same delay as deletion of bot's response
-        await ctx.message.delete(delay=BOTC_MESSAGE_DELETE_DELAY)
+        await writes.delete_message(ctx.message, delay=BOTC_MESSAGE_DELETE_DELAY)
+
+
+class BOTCTownSquareMetricsMixin(object):
+    async def cog_before_invoke(self, ctx):
+        """Start timing (and maybe profiling) the command."""
+        await super().cog_before_invoke(ctx)
+        ctx.botc_started = time.perf_counter()
+        self.bot.botc_townsquare.profiler.before(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        """Record the command's latency, including the work done after it."""
+        try:
+            await super().cog_after_invoke(ctx)
+        finally:
+            self.bot.botc_townsquare.profiler.after(ctx)
+            started = getattr(ctx, "botc_started", None)
+            if started is not None:
+                self.bot.botc_townsquare.metrics.observe_command(
+                    ctx.command.qualified_name,
+                    time.perf_counter() - started,
+                    failed=ctx.command_failed,
+                )
+
+
+class BOTCTownSquareJournalMixin(object):
+    async def cog_before_invoke(self, ctx):
+        """Get the command's town ready, checking once that it is current."""
+        await super().cog_before_invoke(ctx)
+        if ctx.guild is not None and ctx.message.channel.category is not None:
+            await self.bot.botc_townsquare.hold_town(ctx.message.channel.category)
+            ctx.botc_held_town = True
+
+    async def cog_after_invoke(self, ctx):
+        """Save the command's changes to the town, then send its member edits.
+
+        If the town can't be saved, the edits are dropped, so that names and roles
+        never disagree with the saved town.
+
+        """
+        ts = self.bot.botc_townsquare
+        if ctx.guild is not None:
+            category = ctx.message.channel.category
+            try:
+                await ts.save_town(category)
+            except Exception:
+                ts.drop_member_edits(ctx)
+                raise
+            finally:
+                if getattr(ctx, "botc_held_town", False):
+                    ts.release_town(category)
+        failures = await ts.commit_member_edits(ctx)
+        await ts.report_edit_failures(ctx, failures)
 
 
 class BOTCTownSquare(object):
     """Blood on the Clocktower Town Square."""
 
-    def __init__(self, bot):
-        """Load/initialize state for the town square."""
+    def __init__(self, bot, store=None, handoff=None):
+        """Load/initialize state for the town square, by default kept in memory.
+
+        Given the `handoff` of a town square torn down by a reload, carry on from its
+        live state instead of restoring from disk.
+
+        """
         self.bot = bot
-        self._towns = {}
+        self._towns = TownRegistry(self._evict_town)
+        # towns handed over by a reload, added to the registry when next used
+        self._adopted = {}
+        # category ID -> number of commands running that checked the town is current
+        self._held = collections.Counter()
+        # IDs of held categories that the store had no town for when first held
+        self._absent = set()
+        self._tasks = set()
+        self.settings = SettingsCache(bot)
+        self.metrics = TownMetrics()
+        self.writes = MutationScheduler(metrics=self.metrics)
+        # only a store made here is handed over, any other outlives the reload itself
+        self._owns_store = store is None
+        if store is None:
+            store = MemoryTownStore(
+                handoff=None if handoff is None else handoff["store"]
+            )
+        self.store = store
+        self.events = GameEventLog()
+        self.boards = LiveBoards(self)
+        self.profiler = CommandProfiler(self)
+        self.metrics.add_gauge(
+            "botc_towns", "Towns held in memory.", lambda: len(self._towns)
+        )
+        self.metrics.add_gauge(
+            "botc_towns_bytes",
+            "Approximate size of the towns held in memory.",
+            self._towns.approx_bytes,
+        )
+        self.metrics.add_gauge(
+            "botc_settings_snapshots",
+            "Category settings snapshots held in memory.",
+            lambda: len(self.settings),
+        )
+        self.metrics.add_gauge(
+            "botc_game_events",
+            "Game events logged since startup.",
+            lambda: self.events.stats["events"],
+        )
+        for key in ("hits", "misses", "evicted_idle", "evicted_lru", "spilled"):
+            self.metrics.add_gauge(
+                f"botc_towns_{key}",
+                f"Town registry {key.replace('_', ' ')} since startup.",
+                functools.partial(self._towns.stats.__getitem__, key),
+            )
+        self.metrics.add_gauge(
+            "botc_store_conflicts",
+            "Town saves refused as stale since startup.",
+            lambda: self.store.stats["conflicts"],
+        )
+        if handoff is not None:
+            self._adopted = handoff["towns"]
+            self.writes.adopt(handoff["writes"])
+            self.events.adopt(handoff["events"])
+            self.boards.adopt(handoff["boards"])
 
     def teardown(self):
-        """Save state for the town square."""
-        pass
-
-    def _get_role_settings(self, category):
-        """Get dictionary of roles from the BOTC town square category settings."""
-        role_vars = ["role.player", "role.traveler", "role.storyteller"]
-        role_ids = {
-            k[5:]: self.bot.botc_townsquare_settings.get(category.id, k)
-            for k in role_vars
-        }
-        return role_ids
-
-    def _get_emoji_settings(self, category):
-        """Get dictionary of emojis from the BOTC town square category settings."""
-        emoji_vars = [
-            "emoji.dead",
-            "emoji.novote",
-            "emoji.vote",
-            "emoji.traveling",
-            "emoji.storytelling",
-        ]
-        emojis = {
-            k[6:]: self.bot.botc_townsquare_settings.get(category.id, k)
-            for k in emoji_vars
-        }
-        return emojis
-
-    def _format_name_re(self, emojis):
-        """Format BOTC name regular expression using the emoji dictionary."""
-        name_re_template = (
-            r"^(?:(?P<seat>_\d+)|(?P<st>!ST))?"
-            r"\s*"
-            r"(?P<dead>{dead})?"
-            r"(?P<votes>{novote}|{vote}+)?"
-            r"(?P<traveling>{traveling})?"
-            r"(?P<storytelling>{storytelling})?"
-            r"\s*"
-            r"(?P<nick>.*)"
+        """Save state for the town square and close its store and files."""
+        self.profiler.finish()
+        self.store.close()
+        self.events.close()
+
+    def handoff(self):
+        """Hand live state over to the town square of the reloaded extension.
+
+        Returns the towns, pending nominations included, along with the store, event
+        log and board state and the write scheduler, whose queued writes carry on.
+        Pending file writes are finished first, so everything is on disk as well
+        should the handoff go unused. Commands still running from before the reload
+        save nothing afterwards.
+
+        """
+        self.profiler.finish()
+        towns = self._adopted
+        for town in self._towns:
+            self.events.append(town.category_id, town.take_events())
+            if not town.is_empty():
+                towns[town.category_id] = town.to_dict()
+        self._towns = TownRegistry(self._evict_town)
+        self._adopted = {}
+        return dict(
+            towns=towns,
+            store=self.store.handoff() if self._owns_store else None,
+            events=self.events.handoff(),
+            boards=self.boards.handoff(),
+            writes=self.writes,
         )
-        name_re = re.compile(name_re_template.format(**emojis))
-        return name_re
 
+    def get_settings(self, category):
+        """Get the settings snapshot for a category."""
+        return self.settings.get(category)
+
+    def invalidate_settings(self, category=None):
+        """Forget the settings snapshot for a category (or all) after changing it."""
+        self.settings.invalidate(None if category is None else category.id)
+
+    def refresh_settings(self, category):
+        """Put a category's changed settings into effect in its town and board now."""
+        self.invalidate_settings(category)
+        town = self._towns.peek(category.id)
+        if town is not None:
+            town.set_settings(self.get_settings(category))
+            self.boards.request(category)
+
+    @timed("get_town")
     def get_town(self, category):
-        """Return the town dictionary for the command's category."""
-        try:
-            town = self._towns[category.id]
-        except KeyError:
-            # load town square settings into this instance at time of creation
-            role_ids = self._get_role_settings(category)
-            emojis = self._get_emoji_settings(category)
-            name_re = self._format_name_re(emojis)
+        """Return the town state for the command's category."""
+        settings = self.get_settings(category)
+        town = self._towns.get(category.id)
+        if town is not None:
+            if town.settings is not settings:
+                # the settings changed since the town last looked
+                town.set_settings(settings)
+            if category.id not in self._held:
+                self._refresh_town(town)
+        else:
             # create an empty town
-            town = dict(
-                players=set(),
-                player_order=[],
-                player_info=collections.defaultdict(
-                    lambda: dict(seat=None, dead=False, num_votes=None, traveling=False)
-                ),
-                travelers=set(),
-                storytellers=set(),
-                locked=False,
-                nomination=None,
-                prev_nomination=None,
-                role_ids=role_ids,
-                emojis=emojis,
-                name_re=name_re,
-            )
-            self._towns[category.id] = town
+            town = TownState(category.id, settings)
+            state = self._adopted.pop(category.id, None)
+            if state is not None and self.store.is_current(category.id):
+                # handed over by a reload, with its events already logged
+                town.update_from_dict(state)
+                town.take_events()
+            else:
+                state = self.store.load(category.id)
+                if state is not None:
+                    # the log already has the game that led to the stored state
+                    town.update_from_dict(state)
+                    town.take_events()
+            town.member_cache.seed_voice(category)
+            self._towns.add(town, category.guild.id)
+        return town
+
+    def _refresh_town(self, town):
+        if not self.store.is_current(town.category_id):
+            self._reload_town(town)
+
+    def _reload_town(self, town):
+        # another process changed the town since it was loaded here, and logged it
+        town.update_from_dict(self.store.load(town.category_id) or {})
+        town.take_events()
+
+    async def hold_town(self, category):
+        """Get a command's town ready, trusting it to be current until released.
+
+        A town that isn't in memory is loaded without blocking where the store
+        allows. Otherwise the store is asked once whether the town is current, and
+        `get_town` doesn't ask again until every command holding the town has called
+        `release_town`. A change made elsewhere in the meantime is still caught when
+        the town is saved.
+
+        """
+        cat_id = category.id
+        town = self._towns.peek(cat_id)
+        if cat_id in self._held:
+            pass
+        elif town is None and cat_id not in self._adopted:
+            if await self.store.has_async(cat_id):
+                await self.store.prefetch(cat_id)
+            else:
+                self._absent.add(cat_id)
+        elif town is not None and not await self.store.is_current_async(cat_id):
+            await self.store.prefetch(cat_id)
+            self._reload_town(town)
+        self._held[cat_id] += 1
+
+    def release_town(self, category):
+        """Let `get_town` check whether a town is current again, after `hold_town`."""
+        held = self._held
+        held[category.id] -= 1
+        if held[category.id] <= 0:
+            del held[category.id]
+            self._absent.discard(category.id)
+
+    def find_town(self, category):
+        """Return the town state for a category if it holds a game, otherwise None.
+
+        Unlike `get_town`, this never creates a town just to look at it.
+
+        """
+        cat_id = category.id
+        if cat_id in self._towns or cat_id in self._adopted:
+            return self.get_town(category)
+        if cat_id not in self._absent and self.store.has(cat_id):
+            return self.get_town(category)
+        return None
+
+    @timed("rehydrate_town")
+    async def rehydrate_town(self, category):
+        """Rebuild a town's players and storytellers from its members' nicknames.
+
+        Members are found through the town roles and voice channels, and no nicknames
+        are changed. Nominations are forgotten, but the town stays (un)locked.
+
+        """
+        town = self.get_town(category)
+        members = town_members(
+            category.guild, town.role_ids, town.member_cache.voice_member_ids()
+        )
+        state = state_from_nicknames(members, town.name_re, town.emojis, town.role_ids)
+        state["locked"] = town.locked
+        town.update_from_dict(state)
+        await self.save_town(category)
         return town
 
+    def _evict_town(self, town):
+        """Leave an evicted town with a game to the store, or else forget it."""
+        self.events.append(town.category_id, town.take_events())
+        if town.is_empty():
+            self.store.evict(town.category_id, None)
+        else:
+            self._towns.stats["spilled"] += 1
+            self.store.evict(town.category_id, town.to_dict())
+
     def del_town(self, category):
-        """Delete the town dictionary for the command's category."""
+        """Delete the town state for the command's category, ending its game log."""
+        self._adopted.pop(category.id, None)
+        town = self._towns.pop(category.id)
+        if town is not None:
+            self.events.append(category.id, town.take_events())
+        self.store.delete(category.id)
+        self.events.rotate(category.id)
+        self.boards.request(category)
+
+    @timed("save_town")
+    async def save_town(self, category):
+        """Record the current state of the category's town and its game events.
+
+        If another process changed the town while the command ran, its state wins:
+        the town is reloaded, the command's changes are dropped, and `TownChanged`
+        is raised so the command can be tried again.
+
+        """
+        town = self._towns.peek(category.id)
+        if town is None:
+            return
         try:
-            del self._towns[category.id]
-        except KeyError:
-            pass
+            changed = await self.store.save_async(category.id, town.to_dict())
+        except StaleTownError:
+            await self.store.prefetch(category.id)
+            town.take_events()
+            town.update_from_dict(self.store.load(category.id) or {})
+            self.events.append(category.id, town.take_events())
+            self.boards.request(category)
+            raise BOTCTownSquareErrors.TownChanged("Town was changed elsewhere")
+        if changed:
+            self.boards.request(category)
+        self.events.append(category.id, town.take_events())
+
+    def get_members(self, guild, member_ids):
+        """Resolve member IDs to the guild's members, skipping any that have left."""
+        members = (guild.get_member(member_id) for member_id in member_ids)
+        return [member for member in members if member is not None]
+
+    def get_partial_message(self, guild, ids):
+        """Get a partial message from (channel ID, message ID), or None if missing."""
+        if ids is None:
+            return None
+        channel = guild.get_channel(ids[0])
+        if channel is None:
+            return None
+        return channel.get_partial_message(ids[1])
+
+    def get_nomination_message(self, guild, nomination):
+        """Get a partial message for a nomination, or None if missing."""
+        if nomination is None:
+            return None
+        return self.get_partial_message(guild, nomination.ids)
 
     def match_name_re(self, category, member):
         """Match a display name to the name regex, extracting player state and nick."""
         town = self.get_town(category)
-        name_re = town["name_re"]
-        return name_re.match(member.display_name)
+        return town.member_cache.match(member, town.name_re)
+
+    def member_renamed(self, member):
+        """Parse a member's new display name in their guild's towns that cache it."""
+        for town in self._towns.in_guild(member.guild.id):
+            if town.name_re is not None:
+                town.member_cache.update_name(member, town.name_re)
+
+    def voice_moved(self, member, before, after):
+        """Follow a member between voice channels (None if not connected)."""
+        if before is not None and before.category is not None:
+            town = self._towns.peek(before.category.id)
+            if town is not None:
+                town.member_cache.update_voice(member.id, None)
+        if after is not None and after.category is not None:
+            town = self._towns.peek(after.category.id)
+            if town is not None:
+                town.member_cache.update_voice(member.id, after.id)
 
     def player_nickname_components(self, ctx, member):
-        """Get a players' nickname components based on their data in player_info."""
-        category = ctx.message.channel.category
+        """Get a players' nickname components based on their player info."""
+        return self.nickname_components(ctx.message.channel.category, member)
+
+    def nickname_components(self, category, member):
+        """Get a players' nickname components in a category's town."""
         town = self.get_town(category)
-        info = town["player_info"][member]
-        emojis = town["emojis"]
+        info = town.get_info(member.id)
+        seat = town.seat_of(member.id)
+        emojis = town.emojis
         fill = dict(seat="", dead="", votes="", traveling="")
         fill["nick"] = self.match_name_re(category, member)["nick"]
         # build the info-derived fill values for the nickname string
-        if info["seat"] is not None:
-            fill["seat"] = f"_{info['seat']:02d}"
-        if info["dead"]:
+        if seat is not None:
+            fill["seat"] = f"_{seat:02d}"
+        if info.dead:
             fill["dead"] = emojis["dead"]
-        if info["num_votes"] is not None:
-            if info["num_votes"] == 0:
+        if info.num_votes is not None:
+            if info.num_votes == 0:
                 fill["votes"] = emojis["novote"]
             else:
-                fill["votes"] = info["num_votes"] * emojis["vote"]
-        if info["traveling"]:
+                fill["votes"] = info.num_votes * emojis["vote"]
+        if info.traveling:
             fill["traveling"] = emojis["traveling"]
         return fill
 
-    async def set_player_nickname(self, ctx, member):
-        """Set a players' nickname based on their data in player_info."""
+    def render_townsquare(self, category, town, players):
+        """Render the town square summary for the given seated players."""
+        lines = []
+        alive_count = 0
+        for player in players:
+            num = town.seat_of(player.id)
+            digits = "".join(EMOJI_DIGITS[d] for d in f"{num}")
+            fill = self.nickname_components(category, player)
+            s = "{digits}{dead}{votes}{traveling} {nick}".format(digits=digits, **fill)
+            lines.append(s)
+            if not town.get_info(player.id).dead:
+                alive_count += 1
+        min_ex = int(math.ceil(alive_count / 2))
+        non_traveler_count = len(town.players) - len(town.travelers)
+        try:
+            count_dict = BOTC_COUNT[non_traveler_count]
+        except KeyError:
+            pass
+        else:
+            lines.append("{town}/{out}/{minion}/{demon}".format(**count_dict))
+        lines.append(f"**{alive_count}** players alive.")
+        lines.append(f"**{min_ex}** votes to execute.")
+        return "\n".join(lines)
+
+    def townsquare_embed(self, category):
+        """Build the town square summary embed for a category's town."""
+        town = self.find_town(category)
+        if town is None:
+            town = TownState(category.id, self.get_settings(category))
+        players = self.get_members(category.guild, town.seating)
+        return discord.Embed(
+            description=self.render_townsquare(category, town, players),
+            color=discord.Color.dark_magenta(),
+        )
+
+    def player_nickname(self, ctx, member):
+        """Get a players' nickname based on their player info."""
         fill = self.player_nickname_components(ctx, member)
-        nickname = "{seat}{dead}{votes}{traveling} {nick}".format(**fill)
-        await safe_set_nickname(member, nickname)
+        return "{seat}{dead}{votes}{traveling} {nick}".format(**fill)
+
+    async def set_player_nickname(self, ctx, member):
+        """Set a players' nickname based on their player info."""
+        await self.writes.set_nickname(member, self.player_nickname(ctx, member))
 
-    async def set_player_info(self, ctx, member, **kwargs):
-        """Set new values for player info and then adjust their nickname."""
-        info = self.get_town(ctx.message.channel.category)["player_info"][member]
-        info.update(kwargs)
-        await self.set_player_nickname(ctx, member)
+    async def set_player_nicknames(self, ctx, members):
+        """Set the nicknames of several players concurrently."""
+        await self.writes.set_nicknames(
+            (member, self.player_nickname(ctx, member)) for member in members
+        )
 
-    async def set_storyteller_nickname(self, ctx, member):
-        """Set a member's nickname to have storyteller markings."""
+    @timed("set_players_info")
+    async def set_players_info(self, ctx, members, **kwargs):
+        """Set new values for the info of players given as arguments, then nicknames.
+
+        The arguments are resolved as in `resolve_player_arg`, with no arguments
+        meaning the caller, and all of them are resolved before any info changes.
+        The players' nicknames are staged to be edited once the town is saved, and
+        any that fail are reported.
+
+        """
+        town = self.get_town(ctx.message.channel.category)
+        players = await self.resolve_player_args(ctx, members)
+        with town.batch():
+            for player in players:
+                town.update_info(player.id, **kwargs)
+        self.stage_player_nicknames(ctx, [player.id for player in players])
+        self.member_edits(ctx).report_nicknames = True
+
+    def stage_player_nicknames(self, ctx, member_ids):
+        """Add nicknames of the players with the given IDs to the command's edits."""
+        edits = self.member_edits(ctx)
+        for member in self.get_members(ctx.guild, member_ids):
+            edits.set_nick(member, self.player_nickname(ctx, member))
+
+    def storyteller_nickname(self, ctx, member):
+        """Get a member's nickname with storyteller markings."""
         category = ctx.message.channel.category
         town = self.get_town(category)
-        emojis = town["emojis"]
-        nick = self.match_name_re(ctx.message.channel.category, member)["nick"]
-        storytelling = emojis["storytelling"]
-        name = f"!ST{storytelling} {nick}"
-        await safe_set_nickname(member, name)
+        nick = self.match_name_re(category, member)["nick"]
+        storytelling = town.emojis["storytelling"]
+        return f"!ST{storytelling} {nick}"
 
-    async def restore_name(self, ctx, member):
-        """Restore a member's nickname after playing."""
+    def restored_nickname(self, ctx, member):
+        """Get a member's nickname with all town markings removed."""
         nick = self.match_name_re(ctx.message.channel.category, member)["nick"]
-        name = f"{nick}"
-        await safe_set_nickname(member, name)
+        return f"{nick}"
+
+    def member_edits(self, ctx):
+        """Get the batch of member nickname/role edits accumulated by a command."""
+        try:
+            batch = ctx.botc_member_edits
+        except AttributeError:
+            batch = MemberEditBatch()
+            ctx.botc_member_edits = batch
+        return batch
+
+    @timed("commit_member_edits")
+    async def commit_member_edits(self, ctx):
+        """Send the member edits accumulated by a command, one edit per member.
+
+        Returns a dictionary mapping each member whose role edit failed to the
+        exception. Nickname-only edits are written behind without waiting, and if
+        the batch asks to report nicknames, any that fail are reported once sent.
+
+        """
+        try:
+            batch = ctx.botc_member_edits
+        except AttributeError:
+            return {}
+        del ctx.botc_member_edits
+
+        def report_nickname(member, error):
+            spawn(self._tasks, self.report_edit_failures(ctx, {member: error}))
+
+        return await self.writes.apply_member_edits(
+            batch, on_nickname_error=report_nickname if batch.report_nicknames else None
+        )
+
+    def drop_member_edits(self, ctx):
+        """Forget the member edits accumulated by a command without sending them."""
+        try:
+            del ctx.botc_member_edits
+        except AttributeError:
+            pass
+
+    async def report_edit_failures(self, ctx, failures):
+        """Tell the channel which members could not be edited."""
+        if not failures:
+            return
+        names = ", ".join(
+            discord.utils.escape_markdown(member.display_name) for member in failures
+        )
+        await self.writes.send(
+            ctx,
+            f"I couldn't update the names and roles of: {names}.",
+            delete_after=BOTC_MESSAGE_DELETE_DELAY,
+        )
 
     async def resolve_member_arg(self, ctx, member):
         """Resolve argument intended to identify a member or player/storyteller."""
@@ -261,20 +684,40 @@ class BOTCTownSquare(object):
         else:
             # or an int, representing seat order
             town = self.get_town(ctx.message.channel.category)
-            try:
-                member = town["player_order"][member - 1]
-            except IndexError:
-                if member == 0 and len(town["storytellers"]) == 1:
-                    member = town["storytellers"][0]
-                else:
-                    raise BOTCTownSquareErrors.BadSeatArgument("Seat number is invalid")
+            member_id = town.member_at_seat(member)
+            if member_id is None and member == 0:
+                member_id = town.sole_storyteller()
+            if member_id is None:
+                raise BOTCTownSquareErrors.BadSeatArgument("Seat number is invalid")
+            member = ctx.guild.get_member(member_id)
+            if member is None:
+                raise BOTCTownSquareErrors.BadSeatArgument("Seat is not in the guild")
         return member
 
+    async def resolve_member_args(self, ctx, members):
+        """Resolve a list of member arguments, dropping repeats, or else the caller."""
+        resolved = {}
+        for member in members or [None]:
+            member = await self.resolve_member_arg(ctx, member)
+            resolved.setdefault(member.id, member)
+        return list(resolved.values())
+
+    async def resolve_player_args(self, ctx, members):
+        """Resolve a list of player arguments, dropping repeats, or else the caller."""
+        players = await self.resolve_member_args(ctx, members)
+        town = self.get_town(ctx.message.channel.category)
+        for player in players:
+            if player.id not in town.players:
+                raise BOTCTownSquareErrors.BadPlayerArgument(
+                    "Member isn't a player", player
+                )
+        return players
+
     async def resolve_player_arg(self, ctx, member):
         """Resolve member argument intended to identify a player."""
         member = await self.resolve_member_arg(ctx, member)
         # now verify that the member is a player
-        if member in self.get_town(ctx.message.channel.category)["players"]:
+        if member.id in self.get_town(ctx.message.channel.category).players:
             return member
         else:
             raise BOTCTownSquareErrors.BadPlayerArgument(
@@ -0,0 +1,325 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Game event log for Blood on the Clocktower town square extension."""
+
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import time
+import types
+
+from .state import TownState
+
+BOTC_EVENTS_PATH = "botc_townsquare_events"
+BOTC_EVENTS_VERSION = 1
+# number of leading arguments of each event type that are member IDs, None for all
+BOTC_EVENT_MEMBER_ARGS = {
+    "play": 1,
+    "quit": 1,
+    "move": 1,
+    "swap": 2,
+    "seats": None,
+    "travel": 1,
+    "untravel": 1,
+    "storytell": 1,
+    "unstorytell": 1,
+    "dead": 1,
+    "alive": 1,
+    "votes": 1,
+    "nominate": 2,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def member_arg_count(event_type, args):
+    """Count the leading arguments of an event that are member IDs."""
+    count = BOTC_EVENT_MEMBER_ARGS.get(event_type, 0)
+    return len(args) if count is None else count
+
+
+class GameEvent(object):
+    """A logged game event, with its index in the game and its Unix time."""
+
+    __slots__ = ("index", "time", "type", "args")
+
+    def __init__(self, index, time, type, args):
+        """Initialize an event."""
+        self.index = index
+        self.time = time
+        self.type = type
+        self.args = args
+
+
+class GameEventLog(object):
+    """Append-only log of the game events of each town, one file per game.
+
+    A town's current game is logged to `<cat_id>/current.jsonl` under `path`, and
+    when the town is cleared the file is closed off as `<cat_id>/<start>.jsonl`,
+    named by its start time in milliseconds. Every line is a compact JSON array:
+    the header `["game", version, cat_id, start]`, `["m", member_id]` to intern the
+    next member index, or an event `[ms since start, type, args...]` with member
+    arguments given by their index.
+
+    As with the journal, files are written in order on a single worker thread. The
+    log is for replay and analysis rather than recovery, so it isn't synced to disk.
+
+    """
+
+    def __init__(self, path=BOTC_EVENTS_PATH):
+        """Initialize event log stored in the given directory."""
+        self.path = pathlib.Path(path)
+        self.stats = dict(events=0, games=0)
+        # category ID -> (start, member indices) of open games, used by the worker
+        self._games = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="botc_events"
+        )
+
+    def current_path(self, cat_id):
+        """Get the path of a town's current game."""
+        return self.path / str(cat_id) / "current.jsonl"
+
+    def game_paths(self, cat_id):
+        """List the paths of a town's finished games, oldest first."""
+        return list(iter_games(self.path, cat_id))
+
+    def append(self, cat_id, events):
+        """Log a town's queued (time, type, args) game events."""
+        if not events:
+            return
+        self.stats["events"] += len(events)
+        self._submit(self._write_events, cat_id, events)
+
+    def rotate(self, cat_id):
+        """Log that a town was cleared and close off its current game."""
+        self._submit(self._close_game, cat_id, time.time())
+
+    def run(self, fn, *args):
+        """Run a function on the worker after pending writes, returning a future."""
+        return self._executor.submit(fn, *args)
+
+    def close(self):
+        """Finish pending writes."""
+        self._executor.shutdown(wait=True)
+
+    def handoff(self):
+        """Finish pending writes and return what `adopt` needs to carry on from here."""
+        self.close()
+        return dict(games=self._games, stats=self.stats)
+
+    def adopt(self, data):
+        """Carry on from the state returned by another log's `handoff`."""
+        self._games = data["games"]
+        self.stats = data["stats"]
+
+    def _submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future):
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Failed to write game event log", exc_info=exc)
+
+    def _open_game(self, cat_id, when):
+        path = self.current_path(cat_id)
+        start = None
+        members = {}
+        torn = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    torn = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record[0] == "game":
+                        start = record[3]
+                    elif record[0] == "m":
+                        members[record[1]] = len(members)
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            if torn:
+                # end a line torn by a crash so that the next one can be read
+                f.write("\n")
+            if start is None:
+                start = when
+                f.write(_dumps(["game", BOTC_EVENTS_VERSION, cat_id, start]) + "\n")
+        self._games[cat_id] = (start, members)
+        return start, members
+
+    def _write_events(self, cat_id, events):
+        try:
+            start, members = self._games[cat_id]
+        except KeyError:
+            start, members = self._open_game(cat_id, events[0][0])
+        lines = []
+        for when, event_type, args in events:
+            count = member_arg_count(event_type, args)
+            indices = []
+            for member_id in args[:count]:
+                index = members.get(member_id)
+                if index is None:
+                    index = members[member_id] = len(members)
+                    lines.append(_dumps(["m", member_id]))
+                indices.append(index)
+            ms = round((when - start) * 1000)
+            lines.append(_dumps([ms, event_type, *indices, *args[count:]]))
+        with open(self.current_path(cat_id), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _close_game(self, cat_id, when):
+        path = self.current_path(cat_id)
+        if cat_id not in self._games and not path.exists():
+            # nothing was logged since the last clear
+            return
+        self._write_events(cat_id, [(when, "clear", ())])
+        start, _ = self._games.pop(cat_id)
+        os.replace(path, path.with_name(f"{round(start * 1000)}.jsonl"))
+        self.stats["games"] += 1
+
+
+def iter_games(path=BOTC_EVENTS_PATH, cat_id=None):
+    """Iterate over the paths of finished games, by town and then oldest first."""
+    root = pathlib.Path(path)
+    if cat_id is not None:
+        dirs = [root / str(cat_id)]
+    else:
+        try:
+            dirs = sorted(entry.path for entry in os.scandir(root) if entry.is_dir())
+        except FileNotFoundError:
+            return
+    for town_dir in dirs:
+        try:
+            starts = sorted(
+                int(name[: -len(".jsonl")])
+                for name in os.listdir(town_dir)
+                if name.endswith(".jsonl") and name[: -len(".jsonl")].isdigit()
+            )
+        except FileNotFoundError:
+            continue
+        for start in starts:
+            yield pathlib.Path(town_dir) / f"{start}.jsonl"
+
+
+def read_game(path):
+    """Iterate over the events of a logged game, with member IDs resolved."""
+    start = 0.0
+    members = []
+    index = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # torn write from a crash
+                continue
+            if record[0] == "game":
+                if record[1] != BOTC_EVENTS_VERSION:
+                    raise ValueError(f"Unsupported event log version {record[1]}.")
+                start = record[3]
+                continue
+            elif record[0] == "m":
+                members.append(record[1])
+                continue
+            ms, event_type, *args = record
+            count = member_arg_count(event_type, args)
+            args[:count] = [members[idx] for idx in args[:count]]
+            yield GameEvent(index, start + ms / 1000, event_type, tuple(args))
+            index += 1
+
+
+def _find_nomination(town, message_id):
+    for nom in town.day_nominations:
+        if nom.message_id == message_id:
+            return nom
+    return None
+
+
+def apply_event(town, event):
+    """Apply a game event to a town state."""
+    event_type = event.type
+    args = event.args
+    if event_type == "play":
+        town.add_player(args[0])
+    elif event_type == "quit":
+        town.remove_player(args[0])
+    elif event_type == "move":
+        town.move_player(args[0], args[1])
+    elif event_type == "swap":
+        town.swap_players(args[0], args[1])
+    elif event_type == "seats":
+        town.reorder_players(args)
+    elif event_type == "travel":
+        town.add_traveler(args[0])
+    elif event_type == "untravel":
+        town.remove_traveler(args[0])
+    elif event_type == "storytell":
+        town.add_storyteller(args[0])
+    elif event_type == "unstorytell":
+        town.remove_storyteller(args[0])
+    elif event_type in ("dead", "alive"):
+        town.update_info(args[0], dead=event_type == "dead")
+    elif event_type == "votes":
+        town.update_info(args[0], num_votes=args[1])
+    elif event_type in ("lock", "unlock"):
+        town.set_locked(event_type == "lock")
+    elif event_type == "nominate":
+        nominator_id, target_id, channel_id, message_id = args
+        message = types.SimpleNamespace(
+            id=message_id, channel=types.SimpleNamespace(id=channel_id)
+        )
+        town.set_nomination(message, nominator_id, target_id)
+    elif event_type == "tally":
+        nomination = _find_nomination(town, args[0])
+        if nomination is not None:
+            town.record_votes(nomination, args[1])
+    elif event_type == "finish":
+        town.finish_nomination()
+    elif event_type == "cancel":
+        town.cancel_nomination()
+    elif event_type == "newday":
+        town.new_day()
+    elif event_type in ("load", "clear"):
+        town.update_from_dict(args[0] if args else {})
+
+
+def replay_game(path, category_id, settings, index=None, context=5):
+    """Rebuild a town state from a logged game up to and including an event index.
+
+    The latest state is rebuilt if `index` is None, and a negative index counts back
+    from the end of the game. Return the town, the number of events in the game, and
+    the last `context` events applied.
+
+    """
+    if index is not None and index < 0:
+        index += sum(1 for _ in read_game(path))
+    town = TownState(category_id, settings)
+    town.events = None
+    recent = collections.deque(maxlen=context)
+    count = 0
+    for event in read_game(path):
+        count += 1
+        if index is None or event.index <= index:
+            apply_event(town, event)
+            recent.append(event)
+    return town, count, list(recent)
@@ -0,0 +1,67 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Reload handoff for Blood on the Clocktower town square extension.
+
+Reloading the extension re-imports its modules, so live state is left on the bot
+object, which outlives them, for the next `setup` to pick up. Bump
+`BOTC_HANDOFF_VERSION` whenever the shape of what `BOTCTownSquare.handoff` returns
+changes, including the write scheduler internals it carries, so that a reload into
+incompatible code falls back to the state saved on disk instead.
+
+Reloading unloads and loads the extension again without giving the event loop a
+turn, so a handoff that no setup has taken by the loop's next iteration was left by
+an unload for good, or by a reload whose setup failed, and is closed then.
+
+"""
+
+import logging
+
+BOTC_HANDOFF_VERSION = 1
+BOTC_HANDOFF_ATTR = "botc_townsquare_handoff"
+
+logger = logging.getLogger(__name__)
+
+
+def put_handoff(bot, data, close):
+    """Leave live state on the bot for the next setup, calling `close` if unused."""
+    data["version"] = BOTC_HANDOFF_VERSION
+    setattr(bot, BOTC_HANDOFF_ATTR, data)
+    if bot.loop.is_closed():
+        _close_unused(bot, data, close)
+    else:
+        bot.loop.call_soon(_close_unused, bot, data, close)
+
+
+def _close_unused(bot, data, close):
+    if getattr(bot, BOTC_HANDOFF_ATTR, None) is not data:
+        # taken by a setup, which shares or has reopened the files even if it
+        # could not use the handoff itself
+        return
+    delattr(bot, BOTC_HANDOFF_ATTR)
+    logger.info("Closing the town square handoff, which no setup has taken")
+    close()
+
+
+def take_handoff(bot):
+    """Take the state left by the last teardown, or None if there is none to use."""
+    data = getattr(bot, BOTC_HANDOFF_ATTR, None)
+    if data is None:
+        return None
+    delattr(bot, BOTC_HANDOFF_ATTR)
+    if data.get("version") != BOTC_HANDOFF_VERSION:
+        logger.warning(
+            "Ignoring town square handoff version %s (expected %s), restoring from"
+            " disk instead",
+            data.get("version"),
+            BOTC_HANDOFF_VERSION,
+        )
+        return None
+    return data
@@ -0,0 +1,285 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Persistent town state journal for Blood on the Clocktower town square extension."""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import time
+
+BOTC_STATE_PATH = "botc_townsquare_state"
+BOTC_JOURNAL_COMPACT_RECORDS = 500
+BOTC_JOURNAL_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class TownJournal(object):
+    """Append-only journal of town state changes with periodic snapshots.
+
+    Town state is recorded as a JSON-serializable dictionary per category ID. Each
+    record in the journal holds only the top-level keys of a town that changed since
+    the previous record, or marks the town as deleted. Once enough records have
+    accumulated, the journal is compacted by writing a snapshot of every town and
+    truncating the journal. Replaying the journal on top of the snapshot always
+    arrives at the latest state, even if a crash lands between the two writes.
+
+    Towns that are idle but still hold a game can be spilled out of memory into a
+    file of their own with `spill`, and brought back with `unspill`. The journal
+    records which towns are spilled, so they survive a restart as well.
+
+    All file writes happen in order on a single worker thread so that the event loop
+    never blocks on disk. Reading a spilled town back has to wait for the worker, so
+    use `unspill_async` from the event loop; `unspill` blocks until the read is done.
+
+    """
+
+    def __init__(
+        self, path=BOTC_STATE_PATH, compact_records=BOTC_JOURNAL_COMPACT_RECORDS
+    ):
+        """Initialize journal stored in the given directory."""
+        self.path = pathlib.Path(path)
+        self.snapshot_path = self.path / "snapshot.json"
+        self.journal_path = self.path / "journal.jsonl"
+        self.spill_path = self.path / "spill"
+        self.compact_records = compact_records
+        self.stats = dict(
+            records=0,
+            snapshots=0,
+            spills=0,
+            unspills=0,
+            record_seconds=0.0,
+            restore_seconds=0.0,
+        )
+        self._states = {}
+        self._spilled = set()
+        self._num_records = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="botc_journal"
+        )
+
+    def load(self):
+        """Return town states from the latest snapshot plus the journal tail."""
+        start = time.perf_counter()
+        states = {}
+        spilled = set()
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            snapshot = None
+        if snapshot is not None and snapshot.get("version") == BOTC_JOURNAL_VERSION:
+            states = {int(cat_id): s for cat_id, s in snapshot["towns"].items()}
+            spilled = set(snapshot.get("spilled", []))
+        num_records = 0
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # torn write from a crash, nothing after it is trustworthy
+                        break
+                    num_records += 1
+                    cat_id = record["c"]
+                    if record.get("x", False):
+                        states.pop(cat_id, None)
+                        spilled.discard(cat_id)
+                    elif record.get("p", False):
+                        states.pop(cat_id, None)
+                        spilled.add(cat_id)
+                    else:
+                        # an unspilled town is recorded in full before any changes
+                        spilled.discard(cat_id)
+                        states.setdefault(cat_id, {}).update(record["s"])
+        except OSError:
+            pass
+        self._states = {cat_id: dict(s) for cat_id, s in states.items()}
+        self._spilled = spilled
+        self._num_records = num_records
+        self.stats["restore_seconds"] = time.perf_counter() - start
+        return states
+
+    def record(self, cat_id, state):
+        """Journal the changes to a town's state, returning whether there were any."""
+        start = time.perf_counter()
+        prev = self._states.get(cat_id)
+        if prev is None:
+            changes = state
+        else:
+            changes = {k: v for k, v in state.items() if prev.get(k) != v}
+            if not changes:
+                return False
+        self._states[cat_id] = state
+        self._append(dict(c=cat_id, s=changes))
+        self.stats["record_seconds"] += time.perf_counter() - start
+        return True
+
+    def remove(self, cat_id):
+        """Journal the deletion of a town."""
+        if cat_id in self._spilled:
+            self._spilled.discard(cat_id)
+            self._submit(self._delete_spill, cat_id)
+        elif self._states.pop(cat_id, None) is None:
+            return
+        self._append(dict(c=cat_id, x=True))
+
+    def is_spilled(self, cat_id):
+        """Whether a town has been spilled out of memory."""
+        return cat_id in self._spilled
+
+    def spill(self, cat_id, state):
+        """Move a town's state out of memory into its own file."""
+        self._states.pop(cat_id, None)
+        self._spilled.add(cat_id)
+        self.stats["spills"] += 1
+        # the file is written before the record marking it spilled
+        self._submit(self._write_spill, cat_id, _dumps(state))
+        self._append(dict(c=cat_id, p=True))
+
+    def unspill(self, cat_id):
+        """Bring a spilled town's state back into memory, or return None if missing."""
+        if cat_id not in self._spilled:
+            return None
+        # wait for the worker so that the spill file has been written
+        state = self._executor.submit(self._read_spill, cat_id).result()
+        return self._unspilled(cat_id, state)
+
+    async def unspill_async(self, cat_id):
+        """Like `unspill`, but waiting for the worker without blocking the loop."""
+        if cat_id not in self._spilled:
+            return None
+        future = self._executor.submit(self._read_spill, cat_id)
+        state = await asyncio.wrap_future(future)
+        if cat_id not in self._spilled:
+            # brought back or deleted by someone else in the meantime
+            return None
+        return self._unspilled(cat_id, state)
+
+    def _unspilled(self, cat_id, state):
+        self._spilled.discard(cat_id)
+        self.stats["unspills"] += 1
+        if state is None:
+            self._append(dict(c=cat_id, x=True))
+            return None
+        self._states[cat_id] = state
+        self._append(dict(c=cat_id, s=state))
+        self._submit(self._delete_spill, cat_id)
+        return state
+
+    def handoff(self):
+        """Finish pending writes and return what `adopt` needs to carry on from here.
+
+        Unlike `close`, this leaves the journal as it is rather than compacting it.
+
+        """
+        self._executor.shutdown(wait=True)
+        return dict(
+            states=self._states,
+            spilled=self._spilled,
+            num_records=self._num_records,
+            stats=self.stats,
+        )
+
+    def adopt(self, data):
+        """Carry on from the state returned by another journal's `handoff`."""
+        self._states = data["states"]
+        self._spilled = data["spilled"]
+        self._num_records = data["num_records"]
+        self.stats = data["stats"]
+
+    def close(self):
+        """Finish pending writes and compact the journal into a snapshot."""
+        self._executor.shutdown(wait=True)
+        self._write_snapshot(self._snapshot_data())
+
+    def _append(self, record):
+        self.stats["records"] += 1
+        self._num_records += 1
+        if self._num_records >= self.compact_records:
+            self._num_records = 0
+            self._submit(self._write_snapshot, self._snapshot_data())
+        else:
+            self._submit(self._write_record, _dumps(record) + "\n")
+
+    def _snapshot_data(self):
+        # serialize now so later changes to the states don't race the writer thread
+        return _dumps(
+            dict(
+                version=BOTC_JOURNAL_VERSION,
+                towns=self._states,
+                spilled=sorted(self._spilled),
+            )
+        )
+
+    def _submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future):
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Failed to write town journal", exc_info=exc)
+
+    def _write_record(self, line):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_snapshot(self, data):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.stats["snapshots"] += 1
+        # the snapshot now covers everything in the journal
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+
+    def _spill_file(self, cat_id):
+        return self.spill_path / f"{cat_id}.json"
+
+    def _write_spill(self, cat_id, data):
+        self.spill_path.mkdir(parents=True, exist_ok=True)
+        path = self._spill_file(cat_id)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _read_spill(self, cat_id):
+        try:
+            with open(self._spill_file(cat_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.error("Failed to read spilled town %s", cat_id, exc_info=True)
+            return None
+
+    def _delete_spill(self, cat_id):
+        try:
+            os.remove(self._spill_file(cat_id))
+        except FileNotFoundError:
+            pass
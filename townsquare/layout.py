@@ -0,0 +1,152 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Town category layouts for Blood on the Clocktower town square extension."""
+
+import discord
+from discord.ext import commands
+
+BOTC_LAYOUT_SIDEBARS = 7
+BOTC_LAYOUT_MAX_SIDEBARS = 20
+BOTC_LAYOUT_MAX_EXTRA_CHANNELS = 10
+# towns provisioned at once by `town create-many`, and the most it will create
+BOTC_CREATE_CONCURRENCY = 3
+BOTC_CREATE_MAX_TOWNS = 25
+
+
+class TownLayout(object):
+    """Template for the channels and permissions of a new town category.
+
+    The category gets a text chat channel named after it followed by any extra text
+    channels, and the Town Square voice channel followed by the numbered sidebars,
+    any extra voice channels, and the Storyteller Sidebar. A private category is not
+    viewable by default, except by the bot and the roles in `allow`.
+
+    """
+
+    __slots__ = (
+        "sidebars",
+        "text_channels",
+        "voice_channels",
+        "storyteller_sidebar",
+        "private",
+        "allow",
+    )
+
+    def __init__(
+        self,
+        sidebars=BOTC_LAYOUT_SIDEBARS,
+        text_channels=(),
+        voice_channels=(),
+        storyteller_sidebar=True,
+        private=False,
+        allow=(),
+    ):
+        """Initialize a layout, by default the standard town layout."""
+        self.sidebars = sidebars
+        self.text_channels = tuple(text_channels)
+        self.voice_channels = tuple(voice_channels)
+        self.storyteller_sidebar = storyteller_sidebar
+        self.private = private
+        self.allow = tuple(allow)
+
+    @classmethod
+    def from_options(cls, options):
+        """Make a layout from (key, value) options given to the create commands."""
+        layout = cls()
+        for key, value in options:
+            if key == "private":
+                layout.private = True
+            elif key == "sidebars":
+                layout.sidebars = value
+            elif key == "text":
+                layout.text_channels += value
+            elif key == "voice":
+                layout.voice_channels += value
+            elif key == "storyteller":
+                layout.storyteller_sidebar = value
+            elif key == "allow":
+                layout.private = True
+                layout.allow += (value,)
+        if len(layout.text_channels) + len(layout.voice_channels) > (
+            BOTC_LAYOUT_MAX_EXTRA_CHANNELS
+        ):
+            raise commands.BadArgument(
+                f"At most {BOTC_LAYOUT_MAX_EXTRA_CHANNELS} extra channels are allowed."
+            )
+        return layout
+
+    def channels(self, name):
+        """List the (type, name, position) of the child channels for a category."""
+        text = [name.replace(" ", "-").lower()]
+        text += [cname.replace(" ", "-").lower() for cname in self.text_channels]
+        voice = ["Town Square"]
+        voice += [f"Sidebar {n}" for n in range(1, self.sidebars + 1)]
+        voice += list(self.voice_channels)
+        if self.storyteller_sidebar:
+            voice.append("Storyteller Sidebar")
+        return [("text", cname, pos) for pos, cname in enumerate(text)] + [
+            ("voice", cname, pos) for pos, cname in enumerate(voice)
+        ]
+
+    def overwrites(self, guild):
+        """Get the permission overwrites for a category in the given guild."""
+        if not self.private:
+            return {}
+        hidden = discord.PermissionOverwrite(read_messages=False, connect=False)
+        visible = discord.PermissionOverwrite(read_messages=True, connect=True)
+        overwrites = {guild.default_role: hidden, guild.me: visible}
+        overwrites.update((role, visible) for role in self.allow)
+        return overwrites
+
+
+class LayoutOption(commands.Converter):
+    """Converter for a town layout option, either `private` or `<key>=<value>`.
+
+    The options are `sidebars=<count>`, `text=<name>[,<name>...]` and
+    `voice=<name>[,<name>...]` for extra channels, `storyteller=no` to leave out the
+    storyteller sidebar, and `allow=<role>` to make the town private but viewable by
+    a role.
+
+    """
+
+    async def convert(self, ctx, argument):
+        """Convert an argument into a (key, value) layout option."""
+        if argument.lower() == "private":
+            return ("private", True)
+        key, sep, value = argument.partition("=")
+        key = key.lower()
+        if not sep or not value:
+            raise commands.BadArgument(f"{argument} is not a layout option.")
+        if key == "sidebars":
+            try:
+                count = int(value)
+            except ValueError:
+                raise commands.BadArgument("Sidebar count must be a number.")
+            if not 0 <= count <= BOTC_LAYOUT_MAX_SIDEBARS:
+                raise commands.BadArgument(
+                    f"Sidebar count must be between 0 and {BOTC_LAYOUT_MAX_SIDEBARS}."
+                )
+            return (key, count)
+        elif key in ("text", "voice"):
+            names = tuple(name.strip() for name in value.split(",") if name.strip())
+            if not names:
+                raise commands.BadArgument(f"No {key} channel names given.")
+            return (key, names)
+        elif key == "storyteller":
+            if value.lower() in ("yes", "true", "on"):
+                return (key, True)
+            elif value.lower() in ("no", "false", "off"):
+                return (key, False)
+            raise commands.BadArgument("Storyteller sidebar must be yes or no.")
+        elif key == "allow":
+            role = await commands.RoleConverter().convert(ctx, value)
+            return (key, role)
+        raise commands.BadArgument(f"{key} is not a layout option.")
@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Event listeners for Blood on the Clocktower town square extension."""
+
+from discord.ext import commands
+
+from .scheduler import spawn
+
+
+class BOTCTownSquareListeners(commands.Cog, name="Town Square Listeners"):
+    """Listeners keeping the town square's caches in step with Discord.
+
+    This cog has no commands, so the caches are kept current whichever of the
+    command cogs are loaded.
+
+    """
+
+    def __init__(self, bot):
+        """Initialize cog for town square event listeners."""
+        self.bot = bot
+        self._started = False
+        self._tasks = set()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Rehydrate towns marked for it at startup, in the background."""
+        if self._started:
+            # on_ready fires again after reconnecting, but towns are already loaded
+            return
+        self._started = True
+        for guild in self.bot.guilds:
+            spawn(self._tasks, self.rehydrate_guild(guild))
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        """Stop using a deleted role in any town's settings snapshot."""
+        self.bot.botc_townsquare.settings.invalidate_role(role.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        """Keep the towns' parsed names current when a member is renamed."""
+        if before.display_name != after.display_name:
+            self.bot.botc_townsquare.member_renamed(after)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        """Keep the towns' voice channel members current."""
+        if before.channel != after.channel:
+            self.bot.botc_townsquare.voice_moved(member, before.channel, after.channel)
+
+    async def rehydrate_guild(self, guild):
+        """Fetch a guild's members and rehydrate its towns marked for startup."""
+        ts = self.bot.botc_townsquare
+        categories = [
+            category
+            for category in guild.categories
+            if ts.get_settings(category).enabled
+            and ts.get_settings(category)["rehydrate.startup"]
+        ]
+        if not categories:
+            return
+        if not guild.chunked:
+            # prefetch all members so neither the scan nor the first command waits
+            await guild.chunk()
+        for category in categories:
+            # towns restored from the journal are already up to date
+            if ts.find_town(category) is None:
+                await ts.rehydrate_town(category)
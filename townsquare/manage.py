@@ -11,17 +11,69 @@
 """Components for Blood on the Clocktower voice/text town management cog."""
 
 import ast
+import asyncio
+import datetime
+import io
+import json
 import typing
 
 import discord
 from discord.ext import commands
 
 from . import common
+from .events import member_arg_count, replay_game
+from .layout import (
+    BOTC_CREATE_CONCURRENCY,
+    BOTC_CREATE_MAX_TOWNS,
+    LayoutOption,
+    TownLayout,
+)
+from .profiling import BOTC_PROFILE_MAX_COMMANDS, BOTC_PROFILE_MAX_SECONDS
+from .settings import (
+    BOTC_EMOJI_KEYS,
+    BOTC_LOCAL_SETTING_KEYS,
+    BOTC_SETTING_KEYS,
+    apply_settings,
+    export_settings,
+    parse_settings_document,
+    validate_setting,
+)
 from ...utils.commands import acknowledge_command, delete_command_message, Flag
 
+ExportFlags = Flag("all")
+ProfileFlags = Flag("off", "sample", "memory")
+StatsFlags = Flag("dump")
+BoardFlags = Flag("off")
+
+
+class ProfileLimit(commands.Converter):
+    """Converter for a profiling limit, a number of commands or `<n>s`/`<n>m`."""
+
+    async def convert(self, ctx, argument):
+        """Convert an argument into a ("count"|"seconds", amount) limit."""
+        if argument.isdigit():
+            count = int(argument)
+            if not 0 < count <= BOTC_PROFILE_MAX_COMMANDS:
+                raise commands.BadArgument(
+                    f"Can profile between 1 and {BOTC_PROFILE_MAX_COMMANDS} commands."
+                )
+            return ("count", count)
+        unit = argument[-1:].lower()
+        if unit in ("s", "m") and argument[:-1].isdigit():
+            seconds = int(argument[:-1]) * (60 if unit == "m" else 1)
+            if not 0 < seconds <= BOTC_PROFILE_MAX_SECONDS:
+                raise commands.BadArgument(
+                    f"Can profile for at most {BOTC_PROFILE_MAX_SECONDS} seconds."
+                )
+            return ("seconds", seconds)
+        raise commands.BadArgument(f"{argument} is not a profiling limit.")
+
 
 class BOTCTownSquareManage(
-    common.BOTCTownSquareErrorMixin, commands.Cog, name="Manage Towns"
+    common.BOTCTownSquareErrorMixin,
+    common.BOTCTownSquareMetricsMixin,
+    commands.Cog,
+    name="Manage Towns",
 ):
     """Commands for managing Blood on the Clocktower voice/text town categories.
 
@@ -40,13 +92,8 @@ class BOTCTownSquareManage(
             traveler=dict(prefix="Traveling", color=discord.Color.gold()),
             storyteller=dict(prefix="Storytelling", color=discord.Color.magenta()),
         )
-        self.emoji_keys = ("dead", "vote", "novote", "traveling", "storytelling")
-
-        self.setting_keys = tuple(
-            ["is_enabled"]
-            + [f"role.{key}" for key in self.roles.keys()]
-            + [f"emoji.{key}" for key in self.emoji_keys]
-        )
+        self.emoji_keys = BOTC_EMOJI_KEYS
+        self.setting_keys = BOTC_SETTING_KEYS
 
     async def cog_check(self, ctx):
         """Check that commands come from a user with appropriate permissions."""
@@ -101,8 +148,8 @@ class BOTCTownSquareManage(
                     )
                     for key in self.setting_keys
                 ]
-            await ctx.send(
-                "\n".join(lines), delete_after=common.BOTC_MESSAGE_DELETE_DELAY
+            await self.bot.botc_townsquare.writes.send(
+                ctx, "\n".join(lines), delete_after=common.BOTC_MESSAGE_DELETE_DELAY
             )
 
     @town.command(brief="Enable town square commands", usage="[<category-name>]")
@@ -111,6 +158,7 @@ class BOTCTownSquareManage(
         if category is None:
             category = ctx.message.channel.category
         self.bot.botc_townsquare_settings.set(category.id, "is_enabled", True)
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
 
     @town.command(brief="Disable town square commands", usage="[<category-name>]")
@@ -119,52 +167,121 @@ class BOTCTownSquareManage(
         if category is None:
             category = ctx.message.channel.category
         self.bot.botc_townsquare_settings.set(category.id, "is_enabled", False)
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
 
+    async def provision_town(self, guild, name, layout):
+        """Create a town category and its channels from a layout and enable it."""
+        writes = self.bot.botc_townsquare.writes
+        reason = "By user request through BOTC townsquare extension"
+        overwrites = layout.overwrites(guild)
+        category = await writes.create(
+            guild,
+            lambda: guild.create_category(
+                name=name, overwrites=overwrites, reason=reason
+            ),
+        )
+
+        def child_channel(kind, cname, position):
+            create_channel = (
+                guild.create_text_channel
+                if kind == "text"
+                else guild.create_voice_channel
+            )
+            return writes.create(
+                guild,
+                lambda: create_channel(
+                    name=cname, category=category, position=position, reason=reason
+                ),
+            )
+
+        # explicit positions keep the channels in order however the creation races
+        await asyncio.gather(
+            *(child_channel(*channel) for channel in layout.channels(name))
+        )
+        # enable the category for townsquare commands
+        self.bot.botc_townsquare_settings.set(category.id, "is_enabled", True)
+        self.bot.botc_townsquare.invalidate_settings(category)
+        return category
+
     @town.command(
-        brief="Create a town square category", usage="[private] <category-name>"
+        brief="Create a town square category",
+        usage="[<layout-option>...] <category-name>",
     )
-    async def create(self, ctx, flags: commands.Greedy[Flag("private")], *, name: str):
+    async def create(self, ctx, options: commands.Greedy[LayoutOption], *, name: str):
         """Create and populate a town square category with the given name.
 
-        Use "private" immediately after the command and before the category name to
-        create a category that is not viewable by default.
+        By default the category gets a text channel, a Town Square voice channel, seven
+        numbered sidebars, and a Storyteller Sidebar. Layout options given before the
+        category name change this:
+
+        `private`: create a category that is not viewable by default
+        `allow=<role>`: create a private category that is viewable by the role
+        `sidebars=<count>`: create this many numbered sidebars
+        `text=<name>[,<name>...]`: create extra text channels after the first
+        `voice=<name>[,<name>...]`: create extra voice channels after the sidebars
+        `storyteller=no`: leave out the storyteller sidebar
+
+        For example, `.town create private sidebars=5 text=rules Ravenswood Bluff`.
 
         """
-        if "private" in flags:
-            overwrites = {
-                ctx.guild.default_role: discord.PermissionOverwrite(
-                    read_messages=False, connect=False
-                ),
-                ctx.guild.me: discord.PermissionOverwrite(
-                    read_messages=True, connect=True
-                ),
-            }
-        else:
-            overwrites = {}
-        reason = "By user request through BOTC townsquare extension"
-        category = await ctx.guild.create_category(
-            name=name, overwrites=overwrites, reason=reason
-        )
-        # text chat channel
-        await ctx.guild.create_text_channel(
-            name=name.replace(" ", "-").lower(), category=category, reason=reason
-        )
-        # voice town square and sidebars
-        await ctx.guild.create_voice_channel(
-            name="Town Square", category=category, reason=reason
-        )
-        # voice sidebars
-        for n in range(1, 8):
-            await ctx.guild.create_voice_channel(
-                name=f"Sidebar {n}", category=category, reason=reason
+        layout = TownLayout.from_options(options)
+        await self.provision_town(ctx.guild, name, layout)
+        await acknowledge_command(ctx)
+
+    @town.command(
+        name="create-many",
+        brief="Create several town square categories",
+        usage="[<layout-option>...] <count> <name-prefix>",
+    )
+    async def create_many(
+        self,
+        ctx,
+        options: commands.Greedy[LayoutOption],
+        count: int,
+        *,
+        prefix: str,
+    ):
+        """Create and populate several numbered town square categories at once.
+
+        The categories are named with the given prefix followed by a number, e.g.
+        `.town create-many 3 Event Town` creates "Event Town 1" through "Event Town 3".
+        Layout options are the same as for `town create` and apply to every town.
+        Progress is reported as each town is finished.
+
+        """
+        if not 1 <= count <= BOTC_CREATE_MAX_TOWNS:
+            raise commands.BadArgument(
+                f"Town count must be between 1 and {BOTC_CREATE_MAX_TOWNS}."
             )
-        # storyteller sidebar
-        await ctx.guild.create_voice_channel(
-            name="Storyteller Sidebar", category=category, reason=reason
-        )
-        # enable the category for townsquare commands
-        self.bot.botc_townsquare_settings.set(category.id, "is_enabled", True)
+        layout = TownLayout.from_options(options)
+        writes = self.bot.botc_townsquare.writes
+        names = [f"{prefix} {n}" for n in range(1, count + 1)]
+        status = dict.fromkeys(names, "\N{HOURGLASS WITH FLOWING SAND}")
+        done = 0
+
+        def progress():
+            lines = [f"Creating {count} towns: {done}/{count} done"]
+            lines += [f"{name}: {mark}" for name, mark in status.items()]
+            return "\n".join(lines)[:1990]
+
+        message = await writes.send(ctx, progress())
+        limit = asyncio.Semaphore(BOTC_CREATE_CONCURRENCY)
+
+        async def create_one(name):
+            nonlocal done
+            async with limit:
+                try:
+                    await self.provision_town(ctx.guild, name, layout)
+                except discord.HTTPException as e:
+                    status[name] = f"\N{CROSS MARK} {e.text or e}"
+                else:
+                    status[name] = "\N{WHITE HEAVY CHECK MARK}"
+            done += 1
+            # only the latest progress is sent if edits are backed up
+            await writes.edit_message(message, content=progress(), supersede=True)
+
+        await asyncio.gather(*(create_one(name) for name in names))
         await acknowledge_command(ctx)
 
     @town.command(brief="Set an emoji property", usage="<emoji-key> <emoji>")
@@ -180,6 +297,7 @@ class BOTCTownSquareManage(
             )
         category = ctx.message.channel.category
         self.bot.botc_townsquare_settings.set(category.id, f"emoji.{key}", str(emoji))
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
 
     @town.command(brief="Unset an emoji property", usage="<emoji-key>")
@@ -191,6 +309,7 @@ class BOTCTownSquareManage(
             )
         category = ctx.message.channel.category
         self.bot.botc_townsquare_settings.unset(category.id, f"emoji.{key}")
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
 
     @town.command(brief="Set/create a role property", usage="<role-key> <role>")
@@ -205,13 +324,17 @@ class BOTCTownSquareManage(
             # create a new role for the category
             role_dict = self.roles[key]
             name = f"{role_dict['prefix']} {category.name}"
+            guild = ctx.guild
             try:
-                role = await ctx.guild.create_role(
-                    name=name,
-                    color=role_dict["color"],
-                    hoist=False,
-                    mentionable=True,
-                    reason="By user request through BOTC townsquare extension",
+                role = await self.bot.botc_townsquare.writes.create(
+                    guild,
+                    lambda: guild.create_role(
+                        name=name,
+                        color=role_dict["color"],
+                        hoist=False,
+                        mentionable=True,
+                        reason="By user request through BOTC townsquare extension",
+                    ),
                 )
             except Exception:
                 # couldn't create role, see if it already exists
@@ -219,6 +342,7 @@ class BOTCTownSquareManage(
                 if role is None:
                     raise
         self.bot.botc_townsquare_settings.set(category.id, f"role.{key}", role.id)
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
 
     @town.command(brief="Unset a role property", usage="<role-key>")
@@ -230,6 +354,7 @@ class BOTCTownSquareManage(
             )
         category = ctx.message.channel.category
         self.bot.botc_townsquare_settings.unset(category.id, f"role.{key}")
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
 
     @town.command(brief="Set a town square property", usage="<key> <value>")
@@ -252,6 +377,7 @@ class BOTCTownSquareManage(
         except (ValueError, SyntaxError):
             val = value
         self.bot.botc_townsquare_settings.set(category.id, key, val)
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
 
     @town.command(brief="Unset a town square property", usage="<key>")
@@ -263,4 +389,365 @@ class BOTCTownSquareManage(
             )
         category = ctx.message.channel.category
         self.bot.botc_townsquare_settings.unset(category.id, key)
+        self.bot.botc_townsquare.invalidate_settings(category)
         await acknowledge_command(ctx)
+
+    @town.command(brief="Export town settings", usage="[all|<category-name>...]")
+    async def export(
+        self,
+        ctx,
+        flags: commands.Greedy[ExportFlags],
+        categories: commands.Greedy[discord.CategoryChannel],
+    ):
+        """Export every setting of the current or given categories as one document.
+
+        Use "all" to export every town in the server. The document is attached as a
+        JSON file that can be kept, edited, and applied with `town import`.
+
+        """
+        ts = self.bot.botc_townsquare
+        if "all" in flags:
+            categories = [
+                category
+                for category in ctx.guild.categories
+                if ts.get_settings(category).enabled
+            ]
+        elif not categories:
+            categories = [ctx.message.channel.category]
+        document = export_settings(categories, self.bot.botc_townsquare_settings)
+        data = json.dumps(document, indent=2, ensure_ascii=False).encode("utf-8")
+        await ts.writes.send(
+            ctx,
+            f"Settings of {len(categories)} town categories:",
+            file=discord.File(io.BytesIO(data), filename="town-settings.json"),
+        )
+
+    @town.command(
+        name="import",
+        brief="Import town settings",
+        usage="[<category-name>...] [<document>]",
+    )
+    async def import_(
+        self,
+        ctx,
+        categories: commands.Greedy[discord.CategoryChannel],
+        *,
+        document: str = None,
+    ):
+        """Apply a settings document made by `town export`, all or nothing.
+
+        Attach the document as a file or paste it after the command. Each town in the
+        document is applied to its own category, unless categories are given, in which
+        case the document must hold a single town to stamp onto each of them (all but
+        its live board). Settings left out of the document are left alone, and a
+        setting of null returns to its default. Every setting is checked before any
+        is changed, and only those that differ are written.
+
+        """
+        ts = self.bot.botc_townsquare
+        settings = self.bot.botc_townsquare_settings
+        if document is None:
+            if not ctx.message.attachments:
+                raise commands.UserInputError("Attach or paste a settings document.")
+            document = (await ctx.message.attachments[0].read()).decode("utf-8")
+        # allow for a pasted code block
+        document = document.strip().strip("`")
+        if document.startswith("json"):
+            document = document[len("json") :]
+        try:
+            towns = parse_settings_document(document)
+        except ValueError as e:
+            raise commands.UserInputError(str(e))
+        if categories:
+            if len(towns) != 1:
+                raise commands.UserInputError(
+                    "Only a document with a single town can be applied to categories."
+                )
+            cat_id, values = towns[0]
+            targets = [
+                (category, values, category.id == cat_id) for category in categories
+            ]
+        else:
+            targets = []
+            for cat_id, values in towns:
+                category = discord.utils.get(ctx.guild.categories, id=cat_id)
+                if category is None:
+                    raise commands.UserInputError(
+                        f"Category {cat_id} is not in this server."
+                    )
+                targets.append((category, values, True))
+
+        problems = []
+        changes = []
+        for category, values, own in targets:
+            for key, value in values.items():
+                if key in BOTC_LOCAL_SETTING_KEYS and not own:
+                    continue
+                try:
+                    validate_setting(key, value, ctx.guild)
+                except ValueError as e:
+                    problems.append(f"{category.name}: {e}")
+                    continue
+                if settings.get(category.id, key, None) != value:
+                    changes.append((category, key, value))
+        if problems:
+            raise commands.UserInputError(
+                "Nothing was imported:\n" + "\n".join(sorted(set(problems)))
+            )
+
+        apply_settings(
+            [(category.id, key, value) for category, key, value in changes], settings
+        )
+        changed = {category.id: category for category, _, _ in changes}
+        for category in changed.values():
+            ts.refresh_settings(category)
+        await ts.writes.send(
+            ctx,
+            f"Imported {len(changes)} changed settings into {len(changed)} of"
+            f" {len(targets)} categories.",
+            delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
+        )
+
+    @town.command(
+        brief="Profile the town's next commands",
+        usage="[off] [sample] [memory] [<count>|<seconds>s] [<command>...]",
+    )
+    async def profile(
+        self,
+        ctx,
+        flags: commands.Greedy[ProfileFlags],
+        limit: typing.Optional[ProfileLimit] = None,
+        *names: str,
+    ):
+        """Profile the next commands run in this town, and post back a summary.
+
+        By default the next 10 commands are profiled with cProfile. Give a count to
+        profile that many commands instead, or a time like `60s` or `5m` to profile
+        every command for that long, and give command names to only profile those
+        commands, e.g. `.town profile 5 shuffle`. Use "sample" to sample the stack
+        rather than trace every call, which costs far less but is coarser, and
+        "memory" to also compare the town square's memory before and after. Use "off"
+        to end profiling early. The full results are saved to files, named in the
+        summary.
+
+        """
+        ts = self.bot.botc_townsquare
+        if "off" in flags:
+            text = ts.profiler.finish()
+            if text is None:
+                raise commands.UserInputError("Nothing is being profiled.")
+            await ts.writes.send(ctx, text)
+            return
+        if ts.profiler.session is not None:
+            raise commands.UserInputError(
+                f"Already profiling {ts.profiler.session.category.name}."
+                f" [`{ctx.prefix}town profile off` first]"
+            )
+        qualified_names = []
+        for name in names:
+            command = self.bot.get_command(name)
+            if command is None:
+                raise commands.UserInputError(f"There is no {name} command.")
+            qualified_names.append(command.qualified_name)
+        kind, amount = limit if limit is not None else (None, None)
+        ts.profiler.start(
+            ctx.message.channel.category,
+            ctx.message.channel,
+            names=qualified_names,
+            count=amount if kind == "count" else None,
+            seconds=amount if kind == "seconds" else None,
+            sample="sample" in flags,
+            memory="memory" in flags,
+        )
+        await acknowledge_command(ctx)
+
+    @town.command(brief="Show town square metrics", usage="[dump]")
+    async def stats(self, ctx, flags: commands.Greedy[StatsFlags]):
+        """Show command latencies, Discord API calls, and ignored errors.
+
+        Use "dump" to instead write the metrics in the Prometheus text format to the
+        bot's metrics file, e.g. for the node exporter's textfile collector.
+
+        """
+        ts = self.bot.botc_townsquare
+        if "dump" in flags:
+            path = ts.metrics.dump()
+            await ts.writes.send(
+                ctx,
+                f"Metrics written to `{path}`.",
+                delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
+            )
+            return
+        writes = ts.writes.stats
+        lines = ts.metrics.summary_lines()
+        lines.append(
+            f"**Writes**: {writes['requests']} sent, {ts.writes.saved_calls} saved,"
+            f" {writes['rate_limited']} rate limited"
+        )
+        # stay within Discord's message length limit
+        text = ""
+        for line in lines:
+            if len(text) + len(line) + 1 > 1990:
+                text += "…"
+                break
+            text += line + "\n"
+        await ts.writes.send(ctx, text, delete_after=common.BOTC_MESSAGE_DELETE_DELAY)
+
+    @town.command(brief="Post a live town square board", usage="[off | <seconds>]")
+    async def board(
+        self, ctx, flags: commands.Greedy[BoardFlags], interval: float = None
+    ):
+        """Post a town square board that is kept up to date, and pin it.
+
+        The board is edited in place whenever the town changes, at most once every
+        `board.interval` seconds (5 by default), and `townsquare` links to it instead
+        of posting a new summary. Give a number of seconds to change the interval,
+        or use "off" to delete the board.
+
+        """
+        ts = self.bot.botc_townsquare
+        settings = self.bot.botc_townsquare_settings
+        category = ctx.message.channel.category
+        board = ts.get_partial_message(
+            ctx.guild, ts.get_settings(category)["board.message"]
+        )
+        if "off" in flags:
+            settings.unset(category.id, "board.message")
+            ts.invalidate_settings(category)
+            ts.boards.cancel(category)
+            if board is not None:
+                await ts.writes.delete_message(board)
+            return await acknowledge_command(ctx)
+        if interval is not None:
+            if interval < 1:
+                raise commands.BadArgument("Board interval must be at least 1 second.")
+            settings.set(category.id, "board.interval", interval)
+            ts.invalidate_settings(category)
+        if board is None:
+            board = await ts.writes.send(
+                ctx, content=None, embed=ts.townsquare_embed(category)
+            )
+            settings.set(category.id, "board.message", [board.channel.id, board.id])
+            ts.invalidate_settings(category)
+            await ts.writes.pin_message(board)
+        else:
+            ts.boards.request(category)
+        await acknowledge_command(ctx)
+
+    @town.command(brief="Rebuild the town from nicknames")
+    async def rehydrate(self, ctx):
+        """Rebuild the current town's players and storytellers from their nicknames.
+
+        Players, seats, and dead/vote/traveler markers are read from the nicknames of
+        members with the town's roles or in its voice channels, without changing any
+        nicknames. Set the `rehydrate.startup` property to do this when the bot
+        starts, for towns that it has no saved state for.
+
+        """
+        ts = self.bot.botc_townsquare
+        category = ctx.message.channel.category
+        if category is None or not ts.get_settings(category).enabled:
+            # without the town's settings there is no name pattern to parse
+            raise commands.UserInputError("This category is not an enabled town.")
+        town = await ts.rehydrate_town(category)
+        await ts.writes.send(
+            ctx,
+            f"Rehydrated {len(town.players)} players ({len(town.travelers)}"
+            f" traveling) and {len(town.storytellers)} storytellers.",
+            delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
+        )
+
+    @town.command(brief="Replay the town's game log", usage="[<event> [<game>]]")
+    async def replay(self, ctx, index: int = None, game: int = 0):
+        """Show the town as it was at an event in the current or an earlier game.
+
+        Events are numbered from 0 and negative numbers count back from the latest
+        event, which is shown if no event is given. Give a game number to replay an
+        earlier game in this category instead of the current one: 1 for the last
+        finished game, 2 for the one before, and so on. The town is rebuilt from the
+        game event log alone, without changing anything on Discord.
+
+        """
+        ts = self.bot.botc_townsquare
+        category = ctx.message.channel.category
+        settings = ts.get_settings(category)
+        if game:
+            paths = ts.events.game_paths(category.id)
+            if not 0 < game <= len(paths):
+                raise commands.UserInputError(
+                    f"Game number must be between 1 and {len(paths)}."
+                )
+            path = paths[-game]
+        else:
+            path = ts.events.current_path(category.id)
+        try:
+            # replay on the log's worker, after any pending writes
+            town, count, recent = await asyncio.wrap_future(
+                ts.events.run(replay_game, path, category.id, settings, index)
+            )
+        except FileNotFoundError:
+            raise commands.UserInputError("No game has been logged in this town.")
+        if not recent or index is not None and not -count <= index < count:
+            raise commands.UserInputError(f"The game only has {count} events.")
+
+        def name(member_id):
+            member = ctx.guild.get_member(member_id)
+            if member is None:
+                return str(member_id)
+            if settings.name_re is None:
+                return member.display_name
+            return settings.name_re.match(member.display_name)["nick"]
+
+        def describe(event):
+            args = event.args
+            num_members = member_arg_count(event.type, args)
+            if event.type == "load":
+                args = []
+            elif event.type == "nominate":
+                # leave out the nomination message IDs
+                args = [name(arg) for arg in args[:num_members]]
+            elif event.type in ("tally", "cancel"):
+                args = list(args[1:])
+            else:
+                members = [name(arg) for arg in args[:num_members]]
+                args = members + list(args[num_members:])
+            when = datetime.datetime.utcfromtimestamp(event.time)
+            return " ".join(
+                [f"`{event.index}` {when:%H:%M:%S}", event.type, *map(str, args)]
+            )
+
+        lines = [f"**Event {recent[-1].index}** of {count}:"]
+        lines += [describe(event) for event in recent]
+        lines.append("**Town**" + (" (locked):" if town.locked else ":"))
+        for seat, member_id in enumerate(town.seating, 1):
+            info = town.get_info(member_id)
+            marks = [
+                mark
+                for mark, on in (
+                    ("dead", info.dead),
+                    (f"votes {info.num_votes}", info.num_votes is not None),
+                    ("traveling", info.traveling),
+                )
+                if on
+            ]
+            marks = f" ({', '.join(marks)})" if marks else ""
+            lines.append(f"{seat}. {name(member_id)}{marks}")
+        if town.storytellers:
+            storytellers = ", ".join(name(member_id) for member_id in town.storytellers)
+            lines.append(f"Storytellers: {storytellers}")
+        for nom in town.day_nominations:
+            if nom is town.nomination:
+                continue
+            lines.append(
+                f"{name(nom.nominator_id)} nominated {name(nom.target_id)}:"
+                f" {nom.votes} votes"
+            )
+        if town.nomination is not None:
+            lines.append(
+                f"{name(town.nomination.nominator_id)} is nominating"
+                f" {name(town.nomination.target_id)}"
+            )
+        text = "\n".join(lines)
+        if len(text) > 1990:
+            text = text[:1989] + "…"
+        await ts.writes.send(ctx, text, delete_after=common.BOTC_MESSAGE_DELETE_DELAY)
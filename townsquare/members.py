@@ -0,0 +1,78 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Member name and voice cache for Blood on the Clocktower town square extension."""
+
+import collections
+
+
+class TownMembers(object):
+    """Parsed display names and voice channels of a town's members.
+
+    A member's display name is parsed with the town's name regex when first needed
+    and kept along with the name and regex it came from, so a stale entry is never
+    used even if the update event for a rename is missed. Voice channels are seeded
+    from the category when the town is loaded and then follow voice state updates.
+
+    """
+
+    __slots__ = ("_names", "_voice", "stats")
+
+    def __init__(self):
+        """Initialize an empty cache."""
+        # member ID -> (display name, name regex, match)
+        self._names = {}
+        # member ID -> ID of their voice channel in the town
+        self._voice = {}
+        self.stats = collections.Counter()
+
+    def match(self, member, name_re):
+        """Match a member's display name to the name regex, parsing it only once."""
+        display_name = member.display_name
+        entry = self._names.get(member.id)
+        if entry is not None and entry[0] == display_name and entry[1] is name_re:
+            self.stats["hits"] += 1
+            return entry[2]
+        self.stats["misses"] += 1
+        match = name_re.match(display_name)
+        self._names[member.id] = (display_name, name_re, match)
+        return match
+
+    def update_name(self, member, name_re):
+        """Parse a renamed member's new display name if they are in the cache."""
+        if member.id in self._names:
+            self._names[member.id] = (
+                member.display_name,
+                name_re,
+                name_re.match(member.display_name),
+            )
+
+    def seed_voice(self, category):
+        """Record the members in the voice channels of the town's category."""
+        self._voice = {
+            member.id: channel.id
+            for channel in category.voice_channels
+            for member in channel.members
+        }
+
+    def voice_channel_id(self, member_id):
+        """Get the ID of a member's voice channel in the town, or None."""
+        return self._voice.get(member_id)
+
+    def voice_member_ids(self):
+        """Get the IDs of the members in the town's voice channels."""
+        return set(self._voice)
+
+    def update_voice(self, member_id, channel_id):
+        """Record a member joining a voice channel in the town, or leaving if None."""
+        if channel_id is None:
+            self._voice.pop(member_id, None)
+        else:
+            self._voice[member_id] = channel_id
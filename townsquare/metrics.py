@@ -0,0 +1,282 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Runtime metrics for Blood on the Clocktower town square extension."""
+
+import asyncio
+import bisect
+import collections
+import functools
+import os
+import pathlib
+import time
+
+# upper bounds (in seconds) of the latency histogram buckets
+BOTC_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+BOTC_METRICS_PATH = "botc_townsquare_metrics.prom"
+
+
+class Histogram(object):
+    """Cumulative-style latency histogram with fixed bucket bounds."""
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds=BOTC_LATENCY_BUCKETS):
+        """Initialize an empty histogram."""
+        self.bounds = bounds
+        # the final count is for observations above the largest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Add an observation to the histogram."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket holding it."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative(self):
+        """Get (upper bound, cumulative count) pairs in Prometheus style."""
+        seen = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            pairs.append((bound, seen))
+        return pairs
+
+
+class TownMetrics(object):
+    """Command latencies, Discord API calls, and swallowed errors.
+
+    Recording an observation costs a clock read, a bisect, and a few dictionary
+    updates, so the metrics can be left on all the time. Histograms are keyed by
+    command name, helper name, and rate-limit bucket kind, which keeps the number of
+    series small and fixed.
+
+    """
+
+    def __init__(self, path=BOTC_METRICS_PATH):
+        """Initialize empty metrics, dumped to the given path on request."""
+        self.path = pathlib.Path(path)
+        self.started = time.time()
+        self.commands = collections.defaultdict(Histogram)
+        self.command_errors = collections.Counter()
+        self.helpers = collections.defaultdict(Histogram)
+        self.api_calls = collections.defaultdict(Histogram)
+        self.api_waits = collections.defaultdict(Histogram)
+        self.api_errors = collections.Counter()
+        self.swallowed = collections.Counter()
+        self.gauges = {}
+
+    def add_gauge(self, name, help_text, fn):
+        """Register a function giving the current value of a gauge."""
+        self.gauges[name] = (help_text, fn)
+
+    def observe_command(self, name, seconds, failed=False):
+        """Record the end-to-end latency of a command."""
+        self.commands[name].observe(seconds)
+        if failed:
+            self.command_errors[name] += 1
+
+    def observe_helper(self, name, seconds):
+        """Record the time spent in a town square helper."""
+        self.helpers[name].observe(seconds)
+
+    def observe_api(self, kind, seconds, waited, error=None):
+        """Record a Discord API call by bucket kind, with its time queued."""
+        self.api_calls[kind].observe(seconds)
+        self.api_waits[kind].observe(waited)
+        if error is not None:
+            self.api_errors[(kind, type(error).__name__)] += 1
+
+    def observe_swallowed(self, where, error):
+        """Record an error that was caught and ignored."""
+        self.swallowed[(where, type(error).__name__)] += 1
+
+    def summary_lines(self):
+        """Summarize the metrics as lines of text for a Discord message."""
+
+        def fmt(seconds):
+            if seconds is None:
+                return "-"
+            if seconds == float("inf"):
+                return f">{BOTC_LATENCY_BUCKETS[-1]:g}s"
+            return f"{seconds * 1000:.0f}ms"
+
+        def hist_line(name, hist):
+            return (
+                f"`{name}`: {hist.count}x, mean {fmt(hist.total / hist.count)},"
+                f" p50 {fmt(hist.quantile(0.5))}, p99 {fmt(hist.quantile(0.99))}"
+            )
+
+        lines = ["**Commands**"]
+        for name, hist in sorted(self.commands.items()):
+            line = hist_line(name, hist)
+            errors = self.command_errors.get(name, 0)
+            if errors:
+                line += f", {errors} failed"
+            lines.append(line)
+        lines.append("**Discord API calls**")
+        for kind, hist in sorted(self.api_calls.items()):
+            line = hist_line(kind, hist)
+            line += f", {fmt(self.api_waits[kind].total / hist.count)} mean queued"
+            lines.append(line)
+        if self.helpers:
+            lines.append("**Helpers**")
+            lines.extend(
+                hist_line(name, hist) for name, hist in sorted(self.helpers.items())
+            )
+        if self.gauges:
+            lines.append("**Gauges**")
+            lines.extend(
+                f"`{name}`: {fn()}" for name, (_, fn) in sorted(self.gauges.items())
+            )
+        if self.swallowed:
+            lines.append("**Ignored errors**")
+            lines.extend(
+                f"`{where}` {error}: {count}"
+                for (where, error), count in sorted(self.swallowed.items())
+            )
+        return lines
+
+    def render_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def histogram(metric, help_text, label, hists):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, hist in sorted(hists.items()):
+                for bound, count in hist.cumulative():
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(
+                        f'{metric}_bucket{{{label}="{name}",le="{le}"}} {count}'
+                    )
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {hist.total:.6f}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {hist.count}')
+
+        def counter(metric, help_text, labels, counts):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for key, count in sorted(counts.items()):
+                label_str = ",".join(f'{k}="{v}"' for k, v in zip(labels, key))
+                lines.append(f"{metric}{{{label_str}}} {count}")
+
+        histogram(
+            "botc_command_seconds",
+            "End-to-end latency of town square commands.",
+            "command",
+            self.commands,
+        )
+        counter(
+            "botc_command_errors_total",
+            "Town square commands that failed.",
+            ("command",),
+            {(name,): count for name, count in self.command_errors.items()},
+        )
+        histogram(
+            "botc_helper_seconds",
+            "Time spent in town square helpers.",
+            "helper",
+            self.helpers,
+        )
+        histogram(
+            "botc_api_call_seconds",
+            "Duration of Discord API calls by rate-limit bucket.",
+            "bucket",
+            self.api_calls,
+        )
+        histogram(
+            "botc_api_wait_seconds",
+            "Time Discord API calls spent queued by rate-limit bucket.",
+            "bucket",
+            self.api_waits,
+        )
+        counter(
+            "botc_api_errors_total",
+            "Failed Discord API calls by rate-limit bucket and error.",
+            ("bucket", "error"),
+            self.api_errors,
+        )
+        counter(
+            "botc_swallowed_errors_total",
+            "Errors caught and ignored, by location and error.",
+            ("where", "error"),
+            self.swallowed,
+        )
+        for name, (help_text, fn) in sorted(self.gauges.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {fn()}")
+        lines.append("# HELP botc_start_time_seconds When the metrics started.")
+        lines.append("# TYPE botc_start_time_seconds gauge")
+        lines.append(f"botc_start_time_seconds {self.started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=None):
+        """Write the Prometheus text format to a file, for a textfile collector."""
+        path = self.path if path is None else pathlib.Path(path)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        # replace atomically so a collector never reads a partial file
+        os.replace(tmp_path, path)
+        return path
+
+
+def timed(name):
+    """Decorate a town square method to record its duration as a helper metric."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.metrics.observe_helper(name, time.perf_counter() - start)
+
+        @functools.wraps(func)
+        async def async_wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                self.metrics.observe_helper(name, time.perf_counter() - start)
+
+        if asyncio.iscoroutinefunction(func):
+            return async_wrapper
+        return wrapper
+
+    return decorator
@@ -11,37 +11,16 @@
 """Components for Blood on the Clocktower voice/text players cog."""
 
 import functools
-import math
+import time
 import typing
 
 import discord
 from discord.ext import commands
 
 from . import common
+from .scheduler import PRIORITY_CRITICAL, PRIORITY_INTERACTIVE
 from ...utils.commands import delete_command_message
 
-EMOJI_DIGITS = {
-    str(num): "{}\N{VARIATION SELECTOR-16}\N{COMBINING ENCLOSING KEYCAP}".format(num)
-    for num in range(10)
-}
-EMOJI_DIGITS[" "] = "\N{BLACK LARGE SQUARE}"
-EMOJI_DIGITS["10"] = "\N{KEYCAP TEN}"
-EMOJI_DIGITS["*"] = "*\N{VARIATION SELECTOR-16}\N{COMBINING ENCLOSING KEYCAP}"
-
-BOTC_COUNT = {
-    5: dict(town=3, out=0, minion=1, demon=1),
-    6: dict(town=3, out=1, minion=1, demon=1),
-    7: dict(town=5, out=0, minion=1, demon=1),
-    8: dict(town=5, out=1, minion=1, demon=1),
-    9: dict(town=5, out=2, minion=1, demon=1),
-    10: dict(town=7, out=0, minion=2, demon=1),
-    11: dict(town=7, out=1, minion=2, demon=1),
-    12: dict(town=7, out=2, minion=2, demon=1),
-    13: dict(town=9, out=0, minion=3, demon=1),
-    14: dict(town=9, out=1, minion=3, demon=1),
-    15: dict(town=9, out=2, minion=3, demon=1),
-}
-
 
 def require_locked_town():
     """Return command decorator that raises an error if the town is lunocked."""
@@ -49,8 +28,8 @@ def require_locked_town():
     def decorator(command):
         @functools.wraps(command)
         async def wrapper(self, ctx, *args, **kwargs):
-            town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-            if not town["locked"]:
+            town = self.bot.botc_townsquare.find_town(ctx.message.channel.category)
+            if town is None or not town.locked:
                 raise common.BOTCTownSquareErrors.TownUnlocked(
                     "Command requires a locked town."
                 )
@@ -62,7 +41,11 @@ def require_locked_town():
 
 
 class BOTCTownSquarePlayers(
-    common.BOTCTownSquareErrorMixin, commands.Cog, name="Players"
+    common.BOTCTownSquareErrorMixin,
+    common.BOTCTownSquareMetricsMixin,
+    common.BOTCTownSquareJournalMixin,
+    commands.Cog,
+    name="Players",
 ):
     """Commands for Blood on the Clocktower voice/text players.
 
@@ -76,14 +59,17 @@ class BOTCTownSquarePlayers(
     bot will give you the appropriate emojis.
 
     Anyone can use `townsquare` or `ts` and the bot will respond with a summary of the
-    state of the town. If you just want to know the default character-type count for
-    the game, use `count`.
+    state of the town. (If the town's `summary.dedupe` property is set to a number of
+    seconds, asking again within that time while nothing has changed will get a link
+    to the previous summary instead.) If you just want to know the default
+    character-type count for the game, use `count`.
 
     To make a nomination yourself, use the `nominate` command (`nom` or `n` for short)
     followed by the seat number of the player you'd like to nominate, e.g.
     `.nominate 1`. When the vote is counted, the storyteller or a helper will record
-    the number of votes as a reaction to the nomination message by using the
-    `nominate votes` sub-command followed by a number.
+    the number of votes on the nomination message by using the `nominate votes`
+    sub-command followed by a number. Each player can nominate and be nominated only
+    once a day, and `nominations` (or `noms`) lists the day's nominations so far.
 
     The `public` command is a general tool for making statements that you want to be
     more noticeable (e.g. Juggler or Gossip abilities). Whatever text you include in
@@ -103,88 +89,127 @@ class BOTCTownSquarePlayers(
         ) and await common.is_called_from_botc_category().predicate(ctx)
         return result
 
-    @commands.command(brief="Set player to 'dead'", usage="[<seat>|<name>]")
+    @commands.command(brief="Set player to 'dead'", usage="[<seat>|<name>...]")
     @delete_command_message()
-    async def dead(self, ctx, *, member: typing.Union[int, discord.Member] = None):
-        """Set the caller or user as dead, changing their name appropriately.
+    async def dead(
+        self,
+        ctx,
+        members: commands.Greedy[typing.Union[int, discord.Member]],
+        *,
+        member: discord.Member = None,
+    ):
+        """Set the caller or users as dead, changing their names appropriately.
 
-        Indicate another player if necessary using either their seat number or their
-        *exact* name/tag.
+        Indicate other players if necessary using either their seat numbers or their
+        *exact* names/tags (only the last may contain spaces unquoted), e.g.
+        `.dead 3 7`. Several players are changed together.
 
         """
+        if member is not None:
+            members.append(member)
         ts = self.bot.botc_townsquare
-        member = await ts.resolve_player_arg(ctx, member)
-        await ts.set_player_info(ctx, member, dead=True, num_votes=1)
+        await ts.set_players_info(ctx, members, dead=True, num_votes=1)
 
-    @commands.command(brief="Set player to 'voted'", usage="[<seat>|<name>]")
+    @commands.command(brief="Set player to 'voted'", usage="[<seat>|<name>...]")
     @delete_command_message()
-    async def voted(self, ctx, *, member: typing.Union[int, discord.Member] = None):
-        """Set the caller or user as dead with a used ghost vote.
+    async def voted(
+        self,
+        ctx,
+        members: commands.Greedy[typing.Union[int, discord.Member]],
+        *,
+        member: discord.Member = None,
+    ):
+        """Set the caller or users as dead with a used ghost vote.
 
-        Indicate another player if necessary using either their seat number or their
-        *exact* name/tag.
+        Indicate other players if necessary using either their seat numbers or their
+        *exact* names/tags (only the last may contain spaces unquoted), e.g.
+        `.voted 3 7`. Several players are changed together.
 
         """
+        if member is not None:
+            members.append(member)
         ts = self.bot.botc_townsquare
-        member = await ts.resolve_player_arg(ctx, member)
-        await ts.set_player_info(ctx, member, dead=True, num_votes=0)
+        await ts.set_players_info(ctx, members, dead=True, num_votes=0)
 
-    @commands.command(brief="Set player to 'alive'", usage="[<seat>|<name>]")
+    @commands.command(brief="Set player to 'alive'", usage="[<seat>|<name>...]")
     @delete_command_message()
-    async def alive(self, ctx, *, member: typing.Union[int, discord.Member] = None):
-        """Set the caller or user as alive, changing their name appropriately.
+    async def alive(
+        self,
+        ctx,
+        members: commands.Greedy[typing.Union[int, discord.Member]],
+        *,
+        member: discord.Member = None,
+    ):
+        """Set the caller or users as alive, changing their names appropriately.
 
-        Indicate another player if necessary using either their seat number or their
-        *exact* name/tag.
+        Indicate other players if necessary using either their seat numbers or their
+        *exact* names/tags (only the last may contain spaces unquoted), e.g.
+        `.alive 3 7`. Several players are changed together.
 
         """
+        if member is not None:
+            members.append(member)
         ts = self.bot.botc_townsquare
-        member = await ts.resolve_player_arg(ctx, member)
-        await ts.set_player_info(ctx, member, dead=False, num_votes=None)
+        await ts.set_players_info(ctx, members, dead=False, num_votes=None)
 
     @commands.command(name="townsquare", aliases=["ts"], brief="Show the town square")
     @require_locked_town()
     @delete_command_message()
     async def townsquare(self, ctx):
-        """Show the current town square."""
-        town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-        lines = []
-        alive_count = 0
-        for idx, player in enumerate(town["player_order"]):
-            num = idx + 1
-            digits = "".join(EMOJI_DIGITS[d] for d in f"{num}")
-            fill = self.bot.botc_townsquare.player_nickname_components(ctx, player)
-            s = "{digits}{dead}{votes}{traveling} {nick}".format(digits=digits, **fill)
-            lines.append(s)
-            if not town["player_info"][player]["dead"]:
-                alive_count += 1
-        min_ex = int(math.ceil(alive_count / 2))
-        non_traveler_count = len(town["players"]) - len(town["travelers"])
-        try:
-            count_dict = BOTC_COUNT[non_traveler_count]
-        except KeyError:
-            pass
+        """Show the current town square, or link to the town's live board."""
+        ts = self.bot.botc_townsquare
+        category = ctx.message.channel.category
+        board = ts.get_partial_message(
+            ctx.guild, ts.get_settings(category)["board.message"]
+        )
+        if board is not None:
+            # the board is kept up to date, so point at it instead of posting
+            return await ts.writes.send(
+                ctx,
+                f"See the town square board. [{board.jump_url}]",
+                delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
+            )
+        town = ts.get_town(category)
+        players = ts.get_members(ctx.guild, town.seating)
+        # names are part of the key so that members renaming themselves are caught
+        key = (town.version, tuple(player.display_name for player in players))
+
+        dedupe = ts.get_settings(category)["summary.dedupe"]
+        if dedupe and town.summary_message is not None:
+            prev_key, channel_id, message_id, sent_at = town.summary_message
+            if prev_key == key and time.monotonic() - sent_at < dedupe:
+                prev = ts.get_partial_message(ctx.guild, (channel_id, message_id))
+                if prev is not None:
+                    return await ts.writes.send(
+                        ctx,
+                        f"The town square hasn't changed. [{prev.jump_url}]",
+                        delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
+                    )
+
+        if town.summary_cache is not None and town.summary_cache[0] == key:
+            description = town.summary_cache[1]
         else:
-            lines.append("{town}/{out}/{minion}/{demon}".format(**count_dict))
-        lines.append(f"**{alive_count}** players alive.")
-        lines.append(f"**{min_ex}** votes to execute.")
-
+            description = ts.render_townsquare(category, town, players)
+            town.summary_cache = (key, description)
         embed = discord.Embed(
-            description="\n".join(lines), color=discord.Color.dark_magenta()
+            description=description, color=discord.Color.dark_magenta()
         )
-        await ctx.send(content=None, embed=embed)
+        message = await ts.writes.send(ctx, content=None, embed=embed)
+        town.summary_message = (key, message.channel.id, message.id, time.monotonic())
 
     @commands.command(brief="Print the count of character types")
     @require_locked_town()
     @delete_command_message()
     async def count(self, ctx):
         """Print the count of each character type in this game."""
-        town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-        non_traveler_count = len(town["players"]) - len(town["travelers"])
+        ts = self.bot.botc_townsquare
+        town = ts.get_town(ctx.message.channel.category)
+        non_traveler_count = len(town.players) - len(town.travelers)
         try:
-            count_dict = BOTC_COUNT[non_traveler_count]
+            count_dict = common.BOTC_COUNT[non_traveler_count]
         except KeyError:
-            await ctx.send(
+            await ts.writes.send(
+                ctx,
                 "You don't have the players for a proper game.",
                 delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
             )
@@ -193,7 +218,7 @@ class BOTCTownSquarePlayers(
                 "{town} townsfolk, {out} outsider(s), {minion} minion(s),"
                 " and {demon} demon"
             ).format(**count_dict)
-            await ctx.send(countstr)
+            await ts.writes.send(ctx, countstr)
 
     @commands.group(
         invoke_without_command=True,
@@ -204,7 +229,11 @@ class BOTCTownSquarePlayers(
     @require_locked_town()
     @delete_command_message()
     async def nominate(
-        self, ctx, members: commands.Greedy[typing.Union[int, discord.Member]]
+        self,
+        ctx,
+        members: commands.Greedy[typing.Union[int, discord.Member]],
+        *,
+        member: discord.Member = None,
     ):
         """Nominate a player for execution, or set both nominator and target.
 
@@ -212,17 +241,21 @@ class BOTCTownSquarePlayers(
         With one argument, the user of the command will be taken as the nominator.
 
         """
+        if member is not None:
+            members.append(member)
         ts = self.bot.botc_townsquare
         category = ctx.message.channel.category
         town = ts.get_town(category)
         if len(members) == 0:
             raise commands.UserInputError("Could not parse any members to nominate")
-        if town["nomination"] is not None:
+        if town.nomination is not None:
             msg = (
                 f"A nomination is already in progress."
                 f" [`{ctx.prefix}nominate votes <#>`]"
             )
-            return await ctx.send(msg, delete_after=common.BOTC_MESSAGE_DELETE_DELAY)
+            return await ts.writes.send(
+                ctx, msg, delete_after=common.BOTC_MESSAGE_DELETE_DELAY
+            )
         if len(members) > 2:
             raise commands.TooManyArguments(
                 "Nominate only accepts 1 or 2 player arguments."
@@ -234,67 +267,131 @@ class BOTCTownSquarePlayers(
             nominator = await ts.resolve_player_arg(ctx, members[0])
             target = await ts.resolve_player_arg(ctx, members[1])
 
-        if target not in town["travelers"]:
-            nom_type = "execution"
-            nom_color = discord.Color.green()
-        else:
-            nom_type = "exile"
-            nom_color = discord.Color.gold()
-
-        nominator_nick = discord.utils.escape_markdown(
-            ts.match_name_re(category, nominator)["nick"]
-        )
-        target_nick = discord.utils.escape_markdown(
-            ts.match_name_re(category, target)["nick"]
+        exile = target.id in town.travelers
+        if not exile:
+            # each player nominates and is nominated at most once a day, but
+            # storytellers can nominate as often as their script calls for
+            prior = None
+            if nominator.id not in town.storytellers:
+                prior = town.day_nominations.by_nominator(nominator.id)
+            if prior is not None:
+                msg = f"{self.nick(ctx, nominator)} has already nominated today."
+            else:
+                prior = town.day_nominations.by_target(target.id)
+                msg = f"{self.nick(ctx, target)} has already been nominated today."
+            if prior is not None:
+                prev = ts.get_nomination_message(ctx.guild, prior)
+                if prev is not None:
+                    msg += f" [{prev.jump_url}]"
+                return await ts.writes.send(
+                    ctx, msg, delete_after=common.BOTC_MESSAGE_DELETE_DELAY
+                )
+        embed = self.nomination_embed(ctx, town, nominator, target, exile)
+        nom_content = embed.description + "\n||\n||"
+        message = await ts.writes.send(
+            ctx, nom_content, priority=PRIORITY_CRITICAL, embed=embed
         )
-        nom_type = "execution" if target not in town["travelers"] else "exile"
-        nom_str = f"**{nominator_nick}** nominates **{target_nick}** for {nom_type}."
-        nom_content = nom_str + "\n||\n||"
-
-        embed = discord.Embed(color=nom_color, description=nom_str)
-        embed.set_author(name=nominator_nick, icon_url=nominator.avatar_url)
-        embed.set_thumbnail(url=target.avatar_url)
-
-        nomination = await ctx.send(content=nom_content, embed=embed)
-        town["nomination"] = nomination
+        town.set_nomination(message, nominator.id, target.id)
 
     @nominate.command(
         name="votes",
         aliases=["vote"],
-        brief="React to nomination with # of votes",
+        brief="Record # of votes on the nomination",
         usage="<num-votes>",
     )
     @require_locked_town()
     @delete_command_message()
     async def nominate_votes(self, ctx, num_votes: int):
-        """React to the current/previous nomination with the given number of votes."""
+        """Record the given number of votes on the current/previous nomination.
+
+        Depending on the town's `nomination.tally` property, the votes are shown as
+        reactions to the nomination message (`reactions`, the default) or by editing
+        the tally into the nomination message itself (`embed`).
+
+        """
         if num_votes < 0 or num_votes > 20:
             raise commands.BadArgument("Number of votes must be in [0, 20].")
-        town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-        if town["nomination"] is not None:
-            nom = town["nomination"]
-        elif town["prev_nomination"] is not None:
-            nom = town["prev_nomination"]
+        ts = self.bot.botc_townsquare
+        category = ctx.message.channel.category
+        town = ts.get_town(category)
+        if town.nomination is not None:
+            nomination = town.nomination
         else:
-            return await ctx.send(
+            nomination = town.prev_nomination
+        nom = ts.get_nomination_message(ctx.guild, nomination)
+        if nom is None:
+            return await ts.writes.send(
+                ctx,
                 "There has not been a nomination to vote on.",
                 delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
             )
-        await nom.clear_reactions()
+        town.record_votes(nomination, num_votes)
+        tally = ts.get_settings(category)["nomination.tally"]
+        if tally == "embed":
+            nominator = ctx.guild.get_member(nomination.nominator_id)
+            target = ctx.guild.get_member(nomination.target_id)
+            embed = self.nomination_embed(
+                ctx, town, nominator, target, nomination.exile, nomination.votes
+            )
+            await ts.writes.edit_message(nom, embed=embed)
+        else:
+            await self.react_votes(nom, num_votes)
+        # now that the nomination has a number of votes set, it should be moved to prev
+        if town.nomination is not None:
+            town.finish_nomination()
+
+    async def react_votes(self, nom, num_votes):
+        """Replace the reactions to a nomination message with the number of votes."""
         digits = []
         tens = num_votes // 10
         ones = num_votes % 10
         if tens == 1:
-            digits.append(EMOJI_DIGITS["10"])
+            digits.append(common.EMOJI_DIGITS["10"])
         elif tens == 2:
-            digits.append(EMOJI_DIGITS["*"])
+            digits.append(common.EMOJI_DIGITS["*"])
         if not (ones == 0 and tens > 0):
-            digits.append(EMOJI_DIGITS[f"{ones}"])
-        for d in digits:
-            await nom.add_reaction(d)
-        # now that the nomination has a number of votes set, it should be moved to prev
-        town["prev_nomination"] = nom
-        town["nomination"] = None
+            digits.append(common.EMOJI_DIGITS[f"{ones}"])
+        await self.bot.botc_townsquare.writes.set_reactions(nom, digits)
+
+    def nick(self, ctx, member):
+        """Get a member's nickname without player state, escaped for markdown."""
+        if member is None:
+            return "Someone"
+        ts = self.bot.botc_townsquare
+        return discord.utils.escape_markdown(
+            ts.match_name_re(ctx.message.channel.category, member)["nick"]
+        )
+
+    def nomination_embed(self, ctx, town, nominator, target, exile, votes=None):
+        """Build the embed for a nomination, with its vote tally if it has one."""
+
+        def nick(member):
+            return self.nick(ctx, member)
+
+        if not exile:
+            nom_type = "execution"
+            nom_color = discord.Color.green()
+        else:
+            nom_type = "exile"
+            nom_color = discord.Color.gold()
+        nominator_nick = nick(nominator)
+        nom_str = f"**{nominator_nick}** nominates **{nick(target)}** for {nom_type}."
+
+        embed = discord.Embed(color=nom_color, description=nom_str)
+        if nominator is not None:
+            embed.set_author(name=nominator_nick, icon_url=nominator.avatar_url)
+        if target is not None:
+            embed.set_thumbnail(url=target.avatar_url)
+        if votes is not None:
+            threshold = town.vote_threshold()
+            embed.add_field(name="Votes", value=f"**{votes}**")
+            embed.add_field(name=f"Needed for {nom_type}", value=f"{threshold}")
+            highest = town.highest_votes()
+            if highest is not None:
+                embed.add_field(name="Highest today", value=f"{highest}")
+            if not exile and target is not None and town.on_the_block() == target.id:
+                embed.set_footer(text="On the block")
+        return embed
 
     @nominate.command(
         name="cancel", aliases=["delete", "del"], brief="Cancel the nomination"
@@ -303,19 +400,77 @@ class BOTCTownSquarePlayers(
     @delete_command_message()
     async def nominate_cancel(self, ctx):
         """Cancel/delete the current or previous nomination."""
-        town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-        if town["nomination"] is not None:
-            await town["nomination"].delete()
-            town["nomination"] = None
-        elif town["prev_nomination"] is not None:
-            await town["prev_nomination"].delete()
-            town["prev_nomination"] = None
+        ts = self.bot.botc_townsquare
+        town = ts.get_town(ctx.message.channel.category)
+        nom = ts.get_nomination_message(ctx.guild, town.cancel_nomination())
+        if nom is not None:
+            await ts.writes.delete_message(nom, priority=PRIORITY_INTERACTIVE)
         else:
-            await ctx.send(
+            await ts.writes.send(
+                ctx,
                 "There is no nomination to cancel.",
                 delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
             )
 
+    @commands.command(
+        name="nominations", aliases=["noms"], brief="List today's nominations"
+    )
+    @require_locked_town()
+    @delete_command_message()
+    async def nominations(self, ctx):
+        """List today's nominations and votes, and who is on the block.
+
+        Also lists the living players who have yet to nominate and the players who
+        have yet to be nominated today.
+
+        """
+        ts = self.bot.botc_townsquare
+        town = ts.get_town(ctx.message.channel.category)
+        ledger = town.day_nominations
+
+        def nick(member_id):
+            return self.nick(ctx, ctx.guild.get_member(member_id))
+
+        lines = []
+        for num, nom in enumerate(ledger, 1):
+            nom_type = "exile" if nom.exile else "execution"
+            votes = "voting" if nom.votes is None else f"{nom.votes} votes"
+            lines.append(
+                f"{num}. **{nick(nom.nominator_id)}** nominated"
+                f" **{nick(nom.target_id)}** for {nom_type}: {votes}"
+            )
+        if not lines:
+            lines.append("There have been no nominations today.")
+        block = town.on_the_block()
+        if block is not None:
+            lines.append(f"**{nick(block)}** is on the block.")
+        elif ledger.highest is not None:
+            tied = " (tied)" if ledger.is_tied() else ""
+            lines.append(
+                f"Nobody is on the block. Highest: **{ledger.highest}**{tied},"
+                f" needed: **{town.vote_threshold()}**."
+            )
+        seated = list(town.seating)
+        yet_to_nominate = [
+            nick(member_id)
+            for member_id in seated
+            if not town.get_info(member_id).dead
+            and ledger.by_nominator(member_id) is None
+        ]
+        yet_to_be_nominated = [
+            nick(member_id)
+            for member_id in seated
+            if member_id not in town.travelers and ledger.by_target(member_id) is None
+        ]
+        if yet_to_nominate:
+            lines.append(f"Yet to nominate: {', '.join(yet_to_nominate)}")
+        if yet_to_be_nominated:
+            lines.append(f"Yet to be nominated: {', '.join(yet_to_be_nominated)}")
+        embed = discord.Embed(
+            description="\n".join(lines)[:4000], color=discord.Color.green()
+        )
+        await ts.writes.send(ctx, content=None, embed=embed)
+
     @commands.command(
         name="public", aliases=["pub", "say"], brief="Make a public statement"
     )
@@ -325,15 +480,14 @@ class BOTCTownSquarePlayers(
         """Make a public statement, highlighted for visibility."""
         if not statement:
             raise commands.UserInputError("Statement is empty")
+        ts = self.bot.botc_townsquare
         author = ctx.message.author
         author_nick = discord.utils.escape_markdown(
-            self.bot.botc_townsquare.match_name_re(
-                ctx.message.channel.category, author
-            )["nick"]
+            ts.match_name_re(ctx.message.channel.category, author)["nick"]
         )
         embed = discord.Embed(description=statement, color=discord.Color.blue())
         embed.set_author(name=author_nick, icon_url=author.avatar_url)
-        await ctx.send(content=None, embed=embed)
+        await ts.writes.send(ctx, content=None, embed=embed)
 
     @commands.command(brief="Go to a voice channel", usage="[sidebar-num|name]")
     @delete_command_message(delay=0)
@@ -370,10 +524,20 @@ class BOTCTownSquarePlayers(
                     "Voice channel number is invalid"
                 )
         # move author to the requested voice channel
+        ts = self.bot.botc_townsquare
+        town = ts.find_town(ctx.message.channel.category)
+        author_id = ctx.message.author.id
+        if (
+            town is not None
+            and town.member_cache.voice_channel_id(author_id) == vchan.id
+        ):
+            # already there, so there's nothing to ask of Discord
+            return
         try:
-            await ctx.message.author.move_to(vchan)
+            await ts.writes.move_member(ctx.message.author, vchan)
         except discord.HTTPException:
-            await ctx.send(
+            await ts.writes.send(
+                ctx,
                 "Bring yourself back online first. [connect to voice]",
                 delete_after=common.BOTC_MESSAGE_DELETE_DELAY,
             )
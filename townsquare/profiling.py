@@ -0,0 +1,340 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""On-demand command profiling for Blood on the Clocktower town square extension."""
+
+import asyncio
+import collections
+import cProfile
+import datetime
+import logging
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from .scheduler import PRIORITY_COSMETIC, spawn
+
+BOTC_PROFILE_PATH = "botc_townsquare_profiles"
+BOTC_PROFILE_COMMANDS = 10
+BOTC_PROFILE_MAX_COMMANDS = 1000
+BOTC_PROFILE_MAX_SECONDS = 3600
+BOTC_PROFILE_SAMPLE_INTERVAL = 0.005
+BOTC_PROFILE_TOP = 8
+# longest summary posted back, leaving room in a Discord message
+BOTC_PROFILE_SUMMARY_CHARS = 1900
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+
+def _where(filename, lineno, name):
+    if filename == "~":
+        # built-in function
+        return name
+    return f"{os.path.basename(filename)}:{lineno}({name})"
+
+
+def _kib(size):
+    return f"{size / 1024:+.1f} KiB"
+
+
+class StackSampler(object):
+    """Samples the stack of the event loop's thread from a background thread.
+
+    Samples are only taken while `active`, and are counted as collapsed stacks
+    (`outer;...;inner`), the format read by flame graph tools. Time the loop spends
+    waiting on Discord shows up as samples in the selector.
+
+    """
+
+    def __init__(self, interval=BOTC_PROFILE_SAMPLE_INTERVAL):
+        """Initialize a sampler for the calling thread."""
+        self.interval = interval
+        self.active = False
+        self.stacks = collections.Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="botc_profile", daemon=True
+        )
+
+    def start(self):
+        """Start sampling in the background."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.active:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    _where(code.co_filename, code.co_firstlineno, code.co_name)
+                )
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def summary(self, top):
+        """List the functions with the most samples of their own code running."""
+        total = sum(self.stacks.values())
+        own = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        lines = [f"{total} samples, top {top} functions by own samples:"]
+        lines += [
+            f"`{count / total:6.1%}  {func}`" for func, count in own.most_common(top)
+        ]
+        return lines
+
+    def write(self, path):
+        """Write the collapsed stacks to a file."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileSession(object):
+    """Profiling of the commands run in one category until a limit is reached."""
+
+    __slots__ = (
+        "category",
+        "channel",
+        "names",
+        "remaining",
+        "timer",
+        "profile",
+        "sampler",
+        "snapshot",
+        "traced",
+        "commands",
+        "depth",
+        "started",
+    )
+
+    def __init__(self, category, channel, names, remaining, sample, memory):
+        """Start profiling."""
+        self.category = category
+        self.channel = channel
+        self.names = frozenset(names)
+        self.remaining = remaining
+        self.timer = None
+        self.commands = collections.Counter()
+        self.depth = 0
+        self.started = time.perf_counter()
+        if sample:
+            self.profile = None
+            self.sampler = StackSampler()
+            self.sampler.start()
+        else:
+            self.profile = cProfile.Profile()
+            self.sampler = None
+        self.snapshot = None
+        self.traced = False
+        if memory:
+            self.traced = not tracemalloc.is_tracing()
+            if self.traced:
+                tracemalloc.start()
+            self.snapshot = self._take_snapshot()
+
+    @staticmethod
+    def _take_snapshot():
+        # only the allocations made by the town square itself, less the profiling
+        return tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(True, os.path.join(PACKAGE_DIR, "*")),
+                tracemalloc.Filter(False, os.path.abspath(__file__)),
+            ]
+        )
+
+    def matches(self, ctx):
+        """Whether a command invocation is to be profiled."""
+        category = ctx.message.channel.category
+        if category is None or category.id != self.category.id:
+            return False
+        if not self.names:
+            return True
+        name = ctx.command.qualified_name
+        return name in self.names or name.split(" ", 1)[0] in self.names
+
+    def enter(self):
+        """Profile while a matching command runs, along with anything it waits on."""
+        self.depth += 1
+        if self.depth == 1:
+            if self.profile is not None:
+                self.profile.enable()
+            else:
+                self.sampler.active = True
+
+    def exit(self, name):
+        """Stop profiling if the last running matching command has finished."""
+        self.depth -= 1
+        if self.depth == 0:
+            if self.profile is not None:
+                self.profile.disable()
+            else:
+                self.sampler.active = False
+        self.commands[name] += 1
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def stop(self, path, top):
+        """Stop profiling, write the results under a path, and summarize them."""
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.profile is not None:
+            self.profile.disable()
+        else:
+            self.sampler.stop()
+        elapsed = time.perf_counter() - self.started
+        path.mkdir(parents=True, exist_ok=True)
+        stem = "{}-{:%Y%m%d-%H%M%S}".format(self.category.id, datetime.datetime.now())
+        num_commands = sum(self.commands.values())
+        counts = ", ".join(f"{name} x{n}" for name, n in self.commands.most_common())
+        lines = [
+            f"Profiled {num_commands} commands in {self.category.name} over"
+            f" {elapsed:.1f}s" + (f" ({counts})" if counts else "") + "."
+        ]
+        if self.profile is not None:
+            stats_path = path / f"{stem}.prof"
+            if num_commands:
+                stats = pstats.Stats(self.profile)
+                stats.dump_stats(stats_path)
+                stats.sort_stats("tottime")
+                lines.append(
+                    f"Top {top} functions by own time (`{stats_path}` has the rest):"
+                )
+                for func in stats.fcn_list[:top]:
+                    _, ncalls, tottime, _, _ = stats.stats[func]
+                    lines.append(f"`{tottime:8.4f}s {ncalls:>7}  {_where(*func)}`")
+        else:
+            stacks_path = path / f"{stem}.stacks.txt"
+            if num_commands and self.sampler.stacks:
+                self.sampler.write(stacks_path)
+                lines += self.sampler.summary(top)
+                lines.append(f"Collapsed stacks are in `{stacks_path}`.")
+        if self.snapshot is not None:
+            diff = self._take_snapshot().compare_to(self.snapshot, "lineno")
+            if self.traced:
+                tracemalloc.stop()
+            memory_path = path / f"{stem}.memory.txt"
+            with open(memory_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(str(stat) for stat in diff) + "\n")
+            total = sum(stat.size_diff for stat in diff)
+            lines.append(
+                f"Town square memory {_kib(total)}, top {top} changes"
+                f" (`{memory_path}` has the rest):"
+            )
+            for stat in diff[:top]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"`{_kib(stat.size_diff):>13} {stat.count_diff:+7} blocks"
+                    f"  {os.path.basename(frame.filename)}:{frame.lineno}`"
+                )
+        return lines
+
+
+class CommandProfiler(object):
+    """Profiles the town square commands of one category on request.
+
+    At most one session runs at a time, since only one profiler can be active. A
+    session profiles the commands run in its category, optionally only those with
+    given names, for a number of commands or until a deadline, and then posts a
+    summary back to the channel it was started from. With `cProfile` the profile
+    covers everything the event loop runs while a profiled command is in flight;
+    with sampling, the loop's stack is sampled over the same stretches instead, at a
+    fraction of the overhead. Memory snapshots compare the town square's own
+    allocations between the start and end of the session.
+
+    When no session is running, the command hooks return right away.
+
+    """
+
+    def __init__(self, townsquare, path=BOTC_PROFILE_PATH, top=BOTC_PROFILE_TOP):
+        """Initialize an idle profiler for the given town square."""
+        self.townsquare = townsquare
+        self.path = pathlib.Path(path)
+        self.top = top
+        self.session = None
+        self._tasks = set()
+
+    def start(
+        self,
+        category,
+        channel,
+        names=(),
+        count=None,
+        seconds=None,
+        sample=False,
+        memory=False,
+    ):
+        """Start profiling a category's commands, by default the next 10 of them."""
+        if count is None and seconds is None:
+            count = BOTC_PROFILE_COMMANDS
+        self.session = ProfileSession(category, channel, names, count, sample, memory)
+        if seconds is not None:
+            self.session.timer = asyncio.get_event_loop().call_later(
+                seconds, self._finish_and_report
+            )
+
+    def before(self, ctx):
+        """Start profiling a command if it is covered by the running session."""
+        session = self.session
+        if session is None or ctx.guild is None or not session.matches(ctx):
+            return
+        ctx.botc_profiled = session
+        session.enter()
+
+    def after(self, ctx):
+        """Stop profiling a command, finishing the session once it's done."""
+        session = getattr(ctx, "botc_profiled", None)
+        ctx.botc_profiled = None
+        if session is None or session is not self.session:
+            # not profiled, or the session ended while the command was running
+            return
+        session.exit(ctx.command.qualified_name)
+        if session.remaining is not None and session.remaining <= 0:
+            self._finish_and_report()
+
+    def finish(self):
+        """End the running session, returning its summary, or None if none is."""
+        session = self.session
+        if session is None:
+            return None
+        self.session = None
+        lines = session.stop(self.path, self.top)
+        text = ""
+        for line in lines:
+            if len(text) + len(line) + 1 > BOTC_PROFILE_SUMMARY_CHARS:
+                break
+            text += line + "\n"
+        return text
+
+    def _finish_and_report(self):
+        channel = self.session.channel
+        text = self.finish()
+        spawn(self._tasks, self._report(channel, text))
+
+    async def _report(self, channel, text):
+        try:
+            await self.townsquare.writes.send(channel, text, priority=PRIORITY_COSMETIC)
+        except Exception:
+            logger.warning("Failed to post profile summary", exc_info=True)
@@ -0,0 +1,166 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Bounded registry of town states for Blood on the Clocktower town square extension."""
+
+import collections
+import json
+import time
+
+BOTC_TOWN_IDLE_TTL = 6 * 60 * 60
+BOTC_TOWN_MAX_TOWNS = 1000
+# towns used more recently than this are never evicted to make room
+BOTC_TOWN_MIN_IDLE = 60
+BOTC_TOWN_SWEEP_INTERVAL = 60
+
+
+def _measure(town):
+    return len(json.dumps(town.to_dict(), separators=(",", ":")))
+
+
+class TownRegistry(object):
+    """Town states by category ID, evicting idle and least recently used towns.
+
+    A town that has not been used for `ttl` seconds is evicted when the registry is
+    next swept, which happens at most every `sweep_interval` seconds as towns are
+    looked up. When there are more than `max_towns` towns, the least recently used
+    towns are evicted as well, except for those used in the last `min_idle` seconds
+    so that a town is never evicted in the middle of a command.
+
+    Each evicted town is passed to the `on_evict` callback, which decides whether to
+    keep it somewhere cheaper or forget it. The `stats` counter records hits, misses,
+    and evictions.
+
+    Towns added with their guild's ID can be looked up by guild with `in_guild`.
+
+    Town sizes for `approx_bytes` are measured lazily, when it is called, and only
+    for towns whose `version` has changed since they were last measured.
+
+    """
+
+    def __init__(
+        self,
+        on_evict,
+        ttl=BOTC_TOWN_IDLE_TTL,
+        max_towns=BOTC_TOWN_MAX_TOWNS,
+        min_idle=BOTC_TOWN_MIN_IDLE,
+        sweep_interval=BOTC_TOWN_SWEEP_INTERVAL,
+        clock=time.monotonic,
+    ):
+        """Initialize an empty registry."""
+        self.on_evict = on_evict
+        self.ttl = ttl
+        self.max_towns = max_towns
+        self.min_idle = min_idle
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.stats = collections.Counter()
+        # category ID -> (town, last used), least recently used first
+        self._towns = collections.OrderedDict()
+        # category ID -> (town, version, serialized size) when last measured
+        self._sizes = {}
+        # guild ID -> IDs of its registered categories, and category ID -> guild ID
+        self._guild_towns = collections.defaultdict(set)
+        self._guilds = {}
+        self._next_sweep = clock() + sweep_interval
+
+    def __len__(self):
+        return len(self._towns)
+
+    def __contains__(self, cat_id):
+        return cat_id in self._towns
+
+    def __iter__(self):
+        return (town for town, _ in self._towns.values())
+
+    def get(self, cat_id):
+        """Get a town and mark it as used, or return None if it is not registered."""
+        now = self.clock()
+        try:
+            town, _ = self._towns[cat_id]
+        except KeyError:
+            self.stats["misses"] += 1
+            town = None
+        else:
+            # mark the town as used first, so the sweep can't evict it from under us
+            self.stats["hits"] += 1
+            self._towns[cat_id] = (town, now)
+            self._towns.move_to_end(cat_id)
+        if now >= self._next_sweep:
+            self.sweep(now)
+        return town
+
+    def peek(self, cat_id):
+        """Get a town without marking it as used, or None if it is not registered."""
+        try:
+            return self._towns[cat_id][0]
+        except KeyError:
+            return None
+
+    def add(self, town, guild_id=None):
+        """Register a town as just used, evicting others if over the size limit."""
+        now = self.clock()
+        self._towns[town.category_id] = (town, now)
+        self._towns.move_to_end(town.category_id)
+        if guild_id is not None:
+            self._guilds[town.category_id] = guild_id
+            self._guild_towns[guild_id].add(town.category_id)
+        while len(self._towns) > self.max_towns:
+            cat_id, (oldest, used) = next(iter(self._towns.items()))
+            if now - used < self.min_idle:
+                # everything left is in active use, so go over the limit for now
+                break
+            self._remove(cat_id)
+            self.stats["evicted_lru"] += 1
+            self.on_evict(oldest)
+
+    def in_guild(self, guild_id):
+        """Get the registered towns of a guild, without marking them as used."""
+        cat_ids = self._guild_towns.get(guild_id, ())
+        return [self._towns[cat_id][0] for cat_id in cat_ids]
+
+    def pop(self, cat_id):
+        """Unregister a town without evicting it, returning it or None."""
+        if cat_id not in self._towns:
+            return None
+        return self._remove(cat_id)
+
+    def sweep(self, now=None):
+        """Evict every town that has been idle for longer than the TTL."""
+        if now is None:
+            now = self.clock()
+        self._next_sweep = now + self.sweep_interval
+        while self._towns:
+            cat_id, (town, used) = next(iter(self._towns.items()))
+            if now - used < self.ttl:
+                break
+            self._remove(cat_id)
+            self.stats["evicted_idle"] += 1
+            self.on_evict(town)
+
+    def approx_bytes(self):
+        """Estimate the memory held by the registered towns from their state size."""
+        total = 0
+        for cat_id, (town, _) in self._towns.items():
+            measured = self._sizes.get(cat_id)
+            if measured is None or measured[:2] != (town, town.version):
+                measured = self._sizes[cat_id] = (town, town.version, _measure(town))
+            total += measured[2]
+        return total
+
+    def _remove(self, cat_id):
+        self._sizes.pop(cat_id, None)
+        guild_id = self._guilds.pop(cat_id, None)
+        if guild_id is not None:
+            cat_ids = self._guild_towns[guild_id]
+            cat_ids.discard(cat_id)
+            if not cat_ids:
+                del self._guild_towns[guild_id]
+        return self._towns.pop(cat_id)[0]
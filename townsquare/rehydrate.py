@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Rebuilding town state from nicknames for Blood on the Clocktower town square."""
+
+
+def town_members(guild, role_ids, voice_member_ids):
+    """Collect the members of a town from its roles and voice channels, once each."""
+    members = {}
+    for role_id in role_ids.values():
+        role = None if role_id is None else guild.get_role(role_id)
+        if role is not None:
+            members.update((member.id, member) for member in role.members)
+    for member_id in voice_member_ids:
+        member = guild.get_member(member_id)
+        if member is not None:
+            members[member_id] = member
+    return list(members.values())
+
+
+def state_from_nicknames(members, name_re, emojis, role_ids):
+    """Parse members' display names into a town state dictionary.
+
+    The result has the same form as `TownState.to_dict` (without nominations), so
+    it can be loaded with `TownState.update_from_dict`. Players are seated in the
+    order of the seat numbers in their names, followed by any players with a town
+    role but no seat number.
+
+    """
+    vote_width = max(len(emojis["vote"]), 1)
+    seated = []
+    unseated = []
+    player_info = {}
+    travelers = []
+    storytellers = []
+    for member in members:
+        match = name_re.match(member.display_name)
+        member_roles = {role.id for role in member.roles}
+        if match["st"] or role_ids["storyteller"] in member_roles:
+            storytellers.append(member.id)
+            continue
+        traveling = bool(match["traveling"]) or role_ids["traveler"] in member_roles
+        if match["seat"]:
+            seated.append((int(match["seat"][1:]), member.display_name, member.id))
+        elif traveling or role_ids["player"] in member_roles:
+            unseated.append((member.display_name, member.id))
+        else:
+            continue
+        votes = match["votes"]
+        if not votes:
+            num_votes = None
+        elif votes == emojis["novote"]:
+            num_votes = 0
+        else:
+            num_votes = len(votes) // vote_width
+        player_info[str(member.id)] = dict(
+            dead=bool(match["dead"]), num_votes=num_votes, traveling=traveling
+        )
+        if traveling:
+            travelers.append(member.id)
+    order = [member_id for _, _, member_id in sorted(seated)]
+    order += [member_id for _, member_id in sorted(unseated)]
+    return dict(
+        players=sorted(order),
+        player_order=order,
+        player_info=player_info,
+        travelers=sorted(travelers),
+        storytellers=sorted(storytellers),
+    )
@@ -0,0 +1,668 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Scheduling of Discord writes for Blood on the Clocktower town square extension."""
+
+import asyncio
+import collections
+import heapq
+import itertools
+import textwrap
+import time
+
+import discord
+
+# priority classes for Discord writes, most urgent first
+PRIORITY_CRITICAL = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_COSMETIC = 2
+
+# (requests, per seconds) budgets approximating Discord's rate limits by bucket kind
+BOTC_BUCKET_LIMITS = {
+    "member": (10, 10.0),
+    "message": (5, 5.0),
+    "delete": (5, 1.0),
+    "reaction": (1, 0.25),
+    "guild": (5, 5.0),
+}
+BOTC_BUCKET_CONCURRENCY = 4
+BOTC_BUCKET_PRESSURE_QUEUE = 10
+BOTC_NICKNAME_DEBOUNCE = 0.25
+BOTC_NICKNAME_DEGRADED_DEBOUNCE = 2.0
+
+
+def spawn(tasks, coro):
+    """Run a coroutine in the background, keeping its task in `tasks` until done.
+
+    The event loop only holds weak references to tasks, so a task that nothing else
+    holds can be garbage collected before it finishes.
+
+    """
+    task = asyncio.ensure_future(coro)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    return task
+
+
+def shorten_nickname(nick):
+    """Trim a nickname to the length allowed by Discord."""
+    return textwrap.shorten(nick, 32, placeholder="")
+
+
+async def safe_set_nickname(member, nick):
+    """Set nickname, trimming for length and returning (not raising) any error."""
+    shortened = shorten_nickname(nick)
+    try:
+        await member.edit(nick=shortened)
+    except (discord.Forbidden, discord.HTTPException) as e:
+        return e
+    return None
+
+
+class PendingNickname(object):
+    """Nickname edit waiting in the write-behind queue."""
+
+    __slots__ = ("member", "nick", "future", "on_error")
+
+    def __init__(self, member, nick, future):
+        self.member = member
+        self.nick = nick
+        self.future = future
+        # callbacks given (member, error) if the edit fails to land
+        self.on_error = []
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        if future.cancelled():
+            return
+        error = future.exception() or future.result()
+        if error is not None:
+            for callback in self.on_error:
+                callback(self.member, error)
+
+
+class MemberEdit(object):
+    """Desired nickname and role changes for a single member."""
+
+    __slots__ = ("member", "nick", "add_roles", "remove_roles")
+
+    def __init__(self, member):
+        self.member = member
+        self.nick = None
+        self.add_roles = set()
+        self.remove_roles = set()
+
+
+class MemberEditBatch(object):
+    """Nickname and role changes for members, accumulated to send one edit each.
+
+    Later changes for a member override earlier ones, so that a command that chains
+    other commands only sends the final nickname and role set for each member. Set
+    `report_nicknames` to have failed nickname-only edits reported too.
+
+    """
+
+    def __init__(self):
+        """Initialize an empty batch."""
+        self._edits = {}
+        self.report_nicknames = False
+
+    def __len__(self):
+        return len(self._edits)
+
+    def __iter__(self):
+        return iter(self._edits.values())
+
+    def _get_edit(self, member):
+        try:
+            edit = self._edits[member.id]
+        except KeyError:
+            edit = MemberEdit(member)
+            self._edits[member.id] = edit
+        edit.member = member
+        return edit
+
+    def set_nick(self, member, nick):
+        """Set the nickname to give a member."""
+        self._get_edit(member).nick = nick
+
+    def add_role(self, member, role_id):
+        """Add a role (by ID, ignoring None) to give a member."""
+        if role_id is not None:
+            edit = self._get_edit(member)
+            edit.remove_roles.discard(role_id)
+            edit.add_roles.add(role_id)
+
+    def remove_role(self, member, role_id):
+        """Add a role (by ID, ignoring None) to take from a member."""
+        if role_id is not None:
+            edit = self._get_edit(member)
+            edit.add_roles.discard(role_id)
+            edit.remove_roles.add(role_id)
+
+
+class ScheduledMutation(object):
+    """Discord write waiting in a bucket queue."""
+
+    __slots__ = ("priority", "seq", "factory", "future", "supersede_key", "submitted")
+
+    def __init__(self, priority, seq, factory, future, supersede_key, submitted):
+        self.priority = priority
+        self.seq = seq
+        self.factory = factory
+        self.future = future
+        self.supersede_key = supersede_key
+        self.submitted = submitted
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RateLimitBucket(object):
+    """Token accounting and priority queue for one rate-limit bucket.
+
+    Tokens refill continuously up to the bucket's capacity, and each write spends
+    one. A rate-limited response blocks the bucket until Discord's retry-after time
+    has passed.
+
+    """
+
+    def __init__(self, key, capacity, per, concurrency, clock):
+        """Initialize a full bucket."""
+        self.key = key
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.queue = []
+        self.queued = {}
+        self.worker = None
+        self.rate_limited = 0
+
+    def refill(self):
+        """Add the tokens accumulated since the last refill."""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Get the seconds until a token can be spent."""
+        self.refill()
+        blocked = max(self.blocked_until - self.clock(), 0.0)
+        if self.tokens >= 1:
+            return blocked
+        return max(blocked, (1 - self.tokens) / self.rate)
+
+    def block(self, retry_after):
+        """Stop spending tokens until the retry-after time has passed."""
+        self.rate_limited += 1
+        self.blocked_until = max(self.blocked_until, self.clock() + retry_after)
+
+    @property
+    def under_pressure(self):
+        """Whether the bucket is rate limited or has a backlog of writes."""
+        return (
+            self.blocked_until > self.clock()
+            or len(self.queue) >= BOTC_BUCKET_PRESSURE_QUEUE
+        )
+
+
+class MutationScheduler(object):
+    """Send Discord writes through prioritized, rate-limit-aware bucket queues.
+
+    Every write is submitted to the bucket that it counts against (e.g. member edits
+    against the guild's member bucket, messages against the channel's message
+    bucket) along with a priority class. Each bucket spends tokens at roughly
+    Discord's rate, sending the most urgent queued write whenever a token is
+    available, with at most a fixed number of writes in flight. Discord's HTTP
+    client still enforces the real limits, but queueing here first means that a
+    nomination post never waits behind a backlog of cosmetic nickname edits.
+
+    A write submitted with a `supersede_key` replaces any write with the same key
+    that is still queued, so stale cosmetic edits are dropped rather than sent.
+    When a bucket is under pressure (rate limited or backlogged), nickname edits are
+    held for a longer debounce window so that more of them are superseded.
+
+    Nickname edits are also written behind a short debounce window. Requests for a
+    member that already has an edit pending replace that edit's nickname instead of
+    sending another, and edits that would not change the member's current name are
+    dropped. The `stats` counter records how many requests were made, sent,
+    superseded, and skipped as no-ops, along with rate-limited responses.
+
+    Writes are given as coroutine factories, so the scheduler can be driven by any
+    stand-in for the Discord HTTP layer. If given `metrics`, the duration and queued
+    time of every write are recorded by bucket kind.
+
+    """
+
+    def __init__(
+        self,
+        concurrency=BOTC_BUCKET_CONCURRENCY,
+        debounce=BOTC_NICKNAME_DEBOUNCE,
+        degraded_debounce=BOTC_NICKNAME_DEGRADED_DEBOUNCE,
+        limits=None,
+        clock=time.monotonic,
+        metrics=None,
+    ):
+        """Initialize scheduler with the default per-bucket concurrency limit."""
+        self.concurrency = concurrency
+        self.debounce = debounce
+        self.degraded_debounce = degraded_debounce
+        self.limits = dict(BOTC_BUCKET_LIMITS if limits is None else limits)
+        self.clock = clock
+        self.metrics = metrics
+        self.stats = collections.Counter()
+        self._limits = {}
+        self._buckets = {}
+        self._seq = itertools.count()
+        self._pending = {}
+        self._inflight = {}
+        self._tasks = set()
+
+    @property
+    def saved_calls(self):
+        """Number of API calls avoided by coalescing and no-op detection."""
+        return self.stats["superseded"] + self.stats["noop"]
+
+    def set_concurrency(self, guild_id, limit=None):
+        """Set (or reset with None) the member edit concurrency limit for a guild."""
+        if limit is None:
+            self._limits.pop(guild_id, None)
+        else:
+            if limit < 1:
+                raise ValueError("Concurrency limit must be at least 1.")
+            self._limits[guild_id] = limit
+        # a new bucket is created with the new limit on next use
+        bucket = self._buckets.get(("member", guild_id))
+        if bucket is not None and not bucket.queue:
+            del self._buckets[("member", guild_id)]
+
+    def adopt(self, previous):
+        """Take over the queued writes and rate limit state of a previous scheduler.
+
+        The queues, pending nickname edits and counters are shared rather than
+        copied, so writes already on their way through the previous scheduler land
+        in the same books and still supersede or are superseded by new ones.
+
+        """
+        self._limits = previous._limits
+        self._buckets = previous._buckets
+        self._seq = previous._seq
+        self._pending = previous._pending
+        self._inflight = previous._inflight
+        self._tasks = previous._tasks
+        self.stats = previous.stats
+
+    def get_concurrency(self, guild_id):
+        """Get the member edit concurrency limit for a guild."""
+        return self._limits.get(guild_id, self.concurrency)
+
+    def get_bucket(self, key):
+        """Get the bucket for a (kind, ID) key, creating it if necessary."""
+        try:
+            bucket = self._buckets[key]
+        except KeyError:
+            kind, snowflake = key
+            capacity, per = self.limits[kind]
+            if kind == "member":
+                concurrency = self.get_concurrency(snowflake)
+            else:
+                concurrency = self.concurrency
+            bucket = RateLimitBucket(key, capacity, per, concurrency, self.clock)
+            self._buckets[key] = bucket
+        return bucket
+
+    def under_pressure(self, key):
+        """Whether the bucket for a key is rate limited or backlogged."""
+        bucket = self._buckets.get(key)
+        return bucket is not None and bucket.under_pressure
+
+    async def submit(self, key, priority, factory, supersede_key=None):
+        """Queue a write on a bucket and return its result once it has been sent.
+
+        `factory` is called with no arguments to make the coroutine for the write.
+
+        """
+        bucket = self.get_bucket(key)
+        loop = asyncio.get_event_loop()
+        queued = bucket.queued.get(supersede_key) if supersede_key else None
+        if queued is not None:
+            # replace what the queued write will send, keeping its place in line
+            self.stats["superseded"] += 1
+            queued.factory = factory
+            queued.priority = min(queued.priority, priority)
+            heapq.heapify(bucket.queue)
+            return await asyncio.shield(queued.future)
+        entry = ScheduledMutation(
+            priority,
+            next(self._seq),
+            factory,
+            loop.create_future(),
+            supersede_key,
+            time.perf_counter(),
+        )
+        heapq.heappush(bucket.queue, entry)
+        if supersede_key:
+            bucket.queued[supersede_key] = entry
+        if bucket.worker is None or bucket.worker.done():
+            bucket.worker = spawn(self._tasks, self._drain(bucket))
+        return await asyncio.shield(entry.future)
+
+    async def _drain(self, bucket):
+        """Send queued writes by priority as the bucket's tokens allow."""
+        while bucket.queue:
+            await bucket.semaphore.acquire()
+            wait = bucket.wait_time()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = bucket.wait_time()
+            if not bucket.queue:
+                bucket.semaphore.release()
+                break
+            entry = heapq.heappop(bucket.queue)
+            if entry.supersede_key:
+                del bucket.queued[entry.supersede_key]
+            bucket.tokens -= 1
+            spawn(self._tasks, self._run(bucket, entry))
+
+    async def _run(self, bucket, entry):
+        """Send a write, releasing its bucket slot when done."""
+        start = time.perf_counter()
+        error = None
+        try:
+            self.stats["requests"] += 1
+            result = await entry.factory()
+        except discord.HTTPException as e:
+            if getattr(e, "status", None) == 429:
+                self.stats["rate_limited"] += 1
+                bucket.block(_retry_after(e))
+            error = e
+            entry.future.set_exception(e)
+        except Exception as e:
+            error = e
+            entry.future.set_exception(e)
+        else:
+            entry.future.set_result(result)
+        finally:
+            bucket.semaphore.release()
+            if self.metrics is not None:
+                end = time.perf_counter()
+                self.metrics.observe_api(
+                    bucket.key[0], end - start, start - entry.submitted, error
+                )
+
+    def _current_nickname(self, key, member):
+        # an edit that is already on its way will be the member's name when it lands
+        inflight = self._inflight.get(key)
+        return member.display_name if inflight is None else inflight.nick
+
+    async def set_nickname(self, member, nick, on_error=None):
+        """Queue a nickname edit, returning as soon as it is queued.
+
+        The edit is written behind, so the caller never waits for it to land. Errors
+        are not raised, but if the edit (or the one that replaces it) fails to land,
+        `on_error` is called with the member and the error.
+
+        """
+        pending = self._queue_nickname(member, nick)
+        if pending is not None and on_error is not None:
+            pending.on_error.append(on_error)
+
+    def _queue_nickname(self, member, nick, immediate=False):
+        """Queue a nickname edit, returning its pending edit or None if a no-op.
+
+        The edit is sent after the debounce window, unless `immediate` is True, in
+        which case it (and any pending edit it replaces) is queued to send now.
+
+        """
+        self.stats["requested"] += 1
+        nick = shorten_nickname(nick)
+        key = (member.guild.id, member.id)
+        try:
+            pending = self._pending[key]
+        except KeyError:
+            if nick == self._current_nickname(key, member):
+                self.stats["noop"] += 1
+                return None
+            loop = asyncio.get_event_loop()
+            pending = PendingNickname(member, nick, loop.create_future())
+            self._pending[key] = pending
+            if immediate:
+                spawn(self._tasks, self._flush(key, pending))
+                return pending
+            if self.under_pressure(("member", member.guild.id)):
+                debounce = self.degraded_debounce
+            else:
+                debounce = self.debounce
+            loop.call_later(
+                debounce, lambda: spawn(self._tasks, self._flush(key, pending))
+            )
+        else:
+            # the pending edit has not gone out yet, so just change what it will send
+            pending.member = member
+            pending.nick = nick
+            self.stats["superseded"] += 1
+            if immediate:
+                # its timer finds the edit already gone and sends nothing
+                spawn(self._tasks, self._flush(key, pending))
+        return pending
+
+    async def _flush(self, key, pending):
+        """Send the pending nickname edit for a member through their guild's bucket."""
+        if self._pending.get(key) is not pending:
+            # already sent early, or taken over by a combined member edit
+            return
+
+        async def send():
+            if self._pending.get(key) is not pending:
+                # a combined member edit took over this nickname edit
+                return
+            # edits requested while waiting in the queue still supersede this one
+            del self._pending[key]
+            if pending.nick == self._current_nickname(key, pending.member):
+                self.stats["noop"] += 1
+                return
+            self._inflight[key] = pending
+            self.stats["sent"] += 1
+            try:
+                error = await safe_set_nickname(pending.member, pending.nick)
+            finally:
+                # a later edit for the member may have gone out while this one waited
+                if self._inflight.get(key) is pending:
+                    del self._inflight[key]
+            if error is not None:
+                self.stats["nickname_errors"] += 1
+                if self.metrics is not None:
+                    self.metrics.observe_swallowed("safe_set_nickname", error)
+            return error
+
+        try:
+            error = await self.submit(
+                ("member", key[0]),
+                PRIORITY_COSMETIC,
+                send,
+                supersede_key=("nick", key[1]),
+            )
+        except Exception as e:
+            if not pending.future.done():
+                pending.future.set_exception(e)
+        else:
+            if not pending.future.done():
+                pending.future.set_result(error)
+
+    async def set_nicknames(self, edits):
+        """Set nicknames concurrently from an iterable of (member, nick) pairs.
+
+        A batch is already everything the caller wants to change, so its edits are
+        queued right away instead of waiting out the debounce window. The returned
+        awaitable completes when every edit in the batch has landed.
+
+        """
+        pendings = [self._queue_nickname(m, nick, immediate=True) for m, nick in edits]
+        await asyncio.gather(
+            *(asyncio.shield(p.future) for p in pendings if p is not None)
+        )
+
+    async def edit_member(self, member, priority=PRIORITY_INTERACTIVE, **fields):
+        """Edit a member in a single request through their guild's bucket.
+
+        A nickname given here replaces any nickname edit still pending for the member.
+        Without one, the pending nickname is sent along with this edit instead. Unlike
+        nickname edits, errors are raised to the caller.
+
+        """
+        key = (member.guild.id, member.id)
+        if "nick" in fields:
+            fields["nick"] = shorten_nickname(fields["nick"])
+
+        async def send():
+            pending = self._pending.pop(key, None)
+            if pending is not None:
+                if "nick" in fields:
+                    self.stats["superseded"] += 1
+                else:
+                    fields["nick"] = pending.nick
+            self.stats["member_edits"] += 1
+            try:
+                await member.edit(**fields)
+            except Exception as e:
+                if pending is not None and not pending.future.done():
+                    # as from the nickname queue, Discord errors are returned
+                    if isinstance(e, discord.HTTPException):
+                        pending.future.set_result(e)
+                    else:
+                        pending.future.set_exception(e)
+                raise
+            else:
+                if pending is not None and not pending.future.done():
+                    pending.future.set_result(None)
+
+        await self.submit(("member", key[0]), priority, send)
+
+    async def apply_member_edits(
+        self, batch, priority=PRIORITY_INTERACTIVE, on_nickname_error=None
+    ):
+        """Send a batch of member edits concurrently, returning failures by member.
+
+        Members whose roles change get a single edit with both their roles and
+        nickname. Members with only a new nickname go through the nickname queue
+        without waiting for it, and their errors are passed to `on_nickname_error`
+        (if given) once the edits are sent.
+
+        """
+
+        async def apply(edit):
+            member = edit.member
+            current = {role.id for role in member.roles if not role.is_default()}
+            wanted = (current | edit.add_roles) - edit.remove_roles
+            roles = [member.guild.get_role(role_id) for role_id in wanted]
+            roles = [role for role in roles if role is not None]
+            if {role.id for role in roles} != current:
+                fields = dict(roles=roles)
+                if edit.nick is not None:
+                    fields["nick"] = edit.nick
+                await self.edit_member(member, priority=priority, **fields)
+            elif edit.nick is not None:
+                await self.set_nickname(member, edit.nick, on_error=on_nickname_error)
+
+        edits = list(batch)
+        results = await asyncio.gather(
+            *(apply(edit) for edit in edits), return_exceptions=True
+        )
+        return {
+            edit.member: result
+            for edit, result in zip(edits, results)
+            if isinstance(result, Exception)
+        }
+
+    async def move_member(self, member, channel, priority=PRIORITY_INTERACTIVE):
+        """Move a member to a voice channel."""
+        await self.submit(
+            ("member", member.guild.id), priority, lambda: member.move_to(channel)
+        )
+
+    async def send(
+        self, messageable, content=None, priority=PRIORITY_INTERACTIVE, **kwargs
+    ):
+        """Send a message to a channel or context, returning the message."""
+        channel = getattr(messageable, "channel", messageable)
+        return await self.submit(
+            ("message", channel.id),
+            priority,
+            lambda: messageable.send(content, **kwargs),
+        )
+
+    async def edit_message(
+        self, message, priority=PRIORITY_INTERACTIVE, supersede=False, **kwargs
+    ):
+        """Edit a message, replacing a queued edit of it if `supersede` is True."""
+        await self.submit(
+            ("message", message.channel.id),
+            priority,
+            lambda: message.edit(**kwargs),
+            supersede_key=("edit", message.id) if supersede else None,
+        )
+
+    async def pin_message(self, message, priority=PRIORITY_INTERACTIVE):
+        """Pin a message."""
+        await self.submit(("message", message.channel.id), priority, message.pin)
+
+    async def delete_message(self, message, priority=PRIORITY_COSMETIC, delay=None):
+        """Delete a message, in the background after a delay if one is given."""
+        if delay is not None:
+
+            async def delayed():
+                await asyncio.sleep(delay)
+                try:
+                    await self.delete_message(message, priority=priority)
+                except discord.HTTPException:
+                    pass
+
+            spawn(self._tasks, delayed())
+            return
+        await self.submit(("delete", message.channel.id), priority, message.delete)
+
+    async def set_reactions(self, message, emojis, priority=PRIORITY_COSMETIC):
+        """Replace a message's reactions with the given emojis, in order.
+
+        Queued reactions for the same message are superseded by the newer set.
+
+        """
+        emojis = list(emojis)
+
+        async def react():
+            await message.clear_reactions()
+            for emoji in emojis:
+                await message.add_reaction(emoji)
+
+        await self.submit(
+            ("reaction", message.channel.id),
+            priority,
+            react,
+            supersede_key=("reactions", message.id),
+        )
+
+    async def create(self, guild, create, priority=PRIORITY_INTERACTIVE):
+        """Create a channel, category, or role with the given coroutine factory."""
+        return await self.submit(("guild", guild.id), priority, create)
+
+
+def _retry_after(error):
+    """Get the retry-after seconds from a rate-limited HTTP error."""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        try:
+            retry_after = float(error.response.headers["Retry-After"])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            retry_after = 1.0
+    return retry_after
@@ -0,0 +1,112 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Seating arrangement for Blood on the Clocktower town square extension."""
+
+import random
+
+
+class Seating(object):
+    """Seat order of players with constant-time lookups in both directions.
+
+    Seats are numbered from 1. Every operation that rearranges the seats returns
+    the list of member IDs whose seat number changed, which is exactly the set of
+    players whose nicknames need to be updated.
+
+    """
+
+    __slots__ = ("_order", "_seats")
+
+    def __init__(self, member_ids=()):
+        """Initialize seating with the given member IDs in seat order."""
+        self._order = []
+        self._seats = {}
+        for member_id in member_ids:
+            self.insert(member_id)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __contains__(self, member_id):
+        return member_id in self._seats
+
+    def seat_of(self, member_id):
+        """Get the seat number of a member, or None if they are not seated."""
+        return self._seats.get(member_id)
+
+    def member_at(self, seat):
+        """Get the ID of the member in the given seat, or None if it is empty."""
+        if 1 <= seat <= len(self._order):
+            return self._order[seat - 1]
+        return None
+
+    def _clamp(self, seat, size):
+        return min(max(seat, 1), size)
+
+    def _reindex(self, start, stop):
+        """Renumber the seats in the index range [start, stop), returning changes."""
+        changed = []
+        for idx in range(start, stop):
+            member_id = self._order[idx]
+            if self._seats.get(member_id) != idx + 1:
+                self._seats[member_id] = idx + 1
+                changed.append(member_id)
+        return changed
+
+    def insert(self, member_id, seat=None):
+        """Seat a member, by default in a new last seat, shifting later members."""
+        if member_id in self._seats:
+            raise ValueError("Member is already seated.")
+        if seat is None:
+            seat = len(self._order) + 1
+        seat = self._clamp(seat, len(self._order) + 1)
+        self._order.insert(seat - 1, member_id)
+        return self._reindex(seat - 1, len(self._order))
+
+    def remove(self, member_id):
+        """Unseat a member, shifting later members up one seat."""
+        seat = self._seats.pop(member_id)
+        del self._order[seat - 1]
+        return self._reindex(seat - 1, len(self._order))
+
+    def move(self, member_id, seat):
+        """Move a member to a seat, shifting those in between toward the old seat."""
+        old = self._seats[member_id]
+        new = self._clamp(seat, len(self._order))
+        self._order.insert(new - 1, self._order.pop(old - 1))
+        return self._reindex(min(old, new) - 1, max(old, new))
+
+    def swap(self, member_id, other_id):
+        """Swap the seats of two members."""
+        seat = self._seats[member_id]
+        other_seat = self._seats[other_id]
+        if seat == other_seat:
+            return []
+        self._order[seat - 1] = other_id
+        self._order[other_seat - 1] = member_id
+        self._seats[member_id] = other_seat
+        self._seats[other_id] = seat
+        return [member_id, other_id]
+
+    def reorder(self, member_ids):
+        """Seat the same members in the given order."""
+        order = list(member_ids)
+        if sorted(order) != sorted(self._order):
+            raise ValueError("Can only reorder the seated members.")
+        self._order = order
+        return self._reindex(0, len(self._order))
+
+    def shuffle(self, rng=random):
+        """Randomly reorder all seats."""
+        rng.shuffle(self._order)
+        return self._reindex(0, len(self._order))
@@ -0,0 +1,293 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Category settings snapshots for Blood on the Clocktower town square extension."""
+
+import collections
+import json
+import logging
+import numbers
+import re
+import types
+
+BOTC_ROLE_KEYS = ("player", "traveler", "storyteller")
+BOTC_EMOJI_KEYS = ("dead", "vote", "novote", "traveling", "storytelling")
+BOTC_SETTING_KEYS = tuple(
+    ["is_enabled"]
+    + [f"role.{key}" for key in BOTC_ROLE_KEYS]
+    + [f"emoji.{key}" for key in BOTC_EMOJI_KEYS]
+    + ["summary.dedupe", "nomination.tally", "rehydrate.startup"]
+    + ["board.interval", "board.message"]
+)
+# settings that only mean something in their own category, so aren't copied
+BOTC_LOCAL_SETTING_KEYS = ("board.message",)
+BOTC_SETTINGS_DOCUMENT_VERSION = 1
+BOTC_CATEGORY_DEFAULT_SETTINGS = {
+    "emoji.dead": "💀",
+    "emoji.vote": "👻",
+    "emoji.novote": "🚫",
+    "emoji.traveling": "🚁",
+    "emoji.storytelling": "📕",
+    "summary.dedupe": 0,
+    "nomination.tally": "reactions",
+    "rehydrate.startup": False,
+    "board.interval": 5,
+    "board.message": None,
+}
+BOTC_NOMINATION_TALLIES = ("reactions", "embed")
+CUSTOM_EMOJI_RE = re.compile(r"<a?:\w+:\d+>")
+
+logger = logging.getLogger(__name__)
+
+
+def format_name_re(emojis):
+    """Format BOTC name regular expression using the emoji dictionary."""
+    name_re_template = (
+        r"^(?:(?P<seat>_\d+)|(?P<st>!ST))?"
+        r"\s*"
+        r"(?P<dead>{dead})?"
+        r"(?P<votes>{novote}|{vote}+)?"
+        r"(?P<traveling>{traveling})?"
+        r"(?P<storytelling>{storytelling})?"
+        r"\s*"
+        r"(?P<nick>.*)"
+    )
+    name_re = re.compile(name_re_template.format(**emojis))
+    return name_re
+
+
+def validate_setting(key, value, guild):
+    """Check a setting value, raising ValueError if it's not valid for the key.
+
+    A value of None unsets the key, returning it to its default.
+
+    """
+    if value is None:
+        return
+    if key not in BOTC_SETTING_KEYS:
+        raise ValueError(f"`{key}` is not a setting")
+    elif key in ("is_enabled", "rehydrate.startup"):
+        if not isinstance(value, bool):
+            raise ValueError(f"`{key}` must be true or false")
+    elif key.startswith("role."):
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, int)
+            or guild.get_role(value) is None
+        ):
+            raise ValueError(f"`{key}` must be the ID of a role in this server")
+    elif key.startswith("emoji."):
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"`{key}` must be an emoji")
+        if CUSTOM_EMOJI_RE.search(value):
+            raise ValueError(f"`{key}` can't be a custom Discord emoji")
+    elif key in ("summary.dedupe", "board.interval"):
+        if isinstance(value, bool) or not isinstance(value, numbers.Real) or value < 0:
+            raise ValueError(f"`{key}` must be a number of seconds")
+    elif key == "nomination.tally":
+        if value not in BOTC_NOMINATION_TALLIES:
+            raise ValueError(f"`{key}` must be one of {BOTC_NOMINATION_TALLIES}")
+    elif key == "board.message":
+        if not (
+            isinstance(value, list)
+            and len(value) == 2
+            and all(isinstance(v, int) and not isinstance(v, bool) for v in value)
+        ):
+            raise ValueError(f"`{key}` must be a [channel ID, message ID] pair")
+
+
+def export_settings(categories, store):
+    """Make a settings document with every setting of the given categories."""
+    towns = [
+        dict(
+            category=category.id,
+            name=category.name,
+            settings={
+                key: store.get(category.id, key, None) for key in BOTC_SETTING_KEYS
+            },
+        )
+        for category in categories
+    ]
+    return dict(version=BOTC_SETTINGS_DOCUMENT_VERSION, towns=towns)
+
+
+def _write_setting(store, cat_id, key, value):
+    if value is None:
+        store.unset(cat_id, key)
+    else:
+        store.set(cat_id, key, value)
+
+
+def stored_setting(store, cat_id, key):
+    """Get the value stored for a category's setting, or None if left to default.
+
+    The settings store doesn't say whether it holds a value or is falling back to
+    the default, so a value equal to the default counts as not stored.
+
+    """
+    value = store.get(cat_id, key, None)
+    if value == BOTC_CATEGORY_DEFAULT_SETTINGS.get(key):
+        return None
+    return value
+
+
+def apply_settings(changes, store):
+    """Write (category ID, key, value) changes to a settings store, all or nothing.
+
+    A value of None unsets the setting. If a write fails, the settings already
+    written are put back as they were, unset again if they had no stored value,
+    before the error is raised. A failure to put a setting back is logged, so that
+    the error raised is always the one that stopped the changes.
+
+    """
+    written = []
+    try:
+        for cat_id, key, value in changes:
+            previous = stored_setting(store, cat_id, key)
+            _write_setting(store, cat_id, key, value)
+            written.append((cat_id, key, previous))
+    except Exception:
+        for cat_id, key, previous in reversed(written):
+            try:
+                _write_setting(store, cat_id, key, previous)
+            except Exception:
+                logger.error(
+                    "Failed to roll back setting %s of category %s",
+                    key,
+                    cat_id,
+                    exc_info=True,
+                )
+        raise
+
+
+def parse_settings_document(text):
+    """Parse a settings document into a list of (category ID, settings) pairs.
+
+    Raise ValueError if the document is not shaped like one made by
+    `export_settings`. The setting values are checked separately with
+    `validate_setting`, since that needs the guild.
+
+    """
+    try:
+        document = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Settings document is not valid JSON ({e})")
+    if not isinstance(document, dict) or not isinstance(document.get("towns"), list):
+        raise ValueError("Settings document must have a list of towns")
+    if document.get("version") != BOTC_SETTINGS_DOCUMENT_VERSION:
+        raise ValueError(
+            f"Unsupported settings document version {document.get('version')}"
+        )
+    towns = []
+    for town in document["towns"]:
+        if not (
+            isinstance(town, dict)
+            and isinstance(town.get("category"), int)
+            and isinstance(town.get("settings"), dict)
+        ):
+            raise ValueError("Each town must have a category ID and settings")
+        towns.append((town["category"], town["settings"]))
+    return towns
+
+
+class CategorySettings(object):
+    """Immutable snapshot of a category's town square settings.
+
+    Besides the raw setting values, a snapshot holds what is derived from them: the
+    town role IDs and the resolved `discord.Role` objects (None if unset or deleted),
+    the emojis, and the compiled name regular expression. A snapshot of a category
+    that is not an enabled town has `enabled` False and nothing else derived.
+
+    """
+
+    __slots__ = (
+        "category_id",
+        "enabled",
+        "values",
+        "role_ids",
+        "roles",
+        "emojis",
+        "name_re",
+    )
+
+    def __init__(self, category, store):
+        """Read the settings for a category from the persistent settings store."""
+        values = {key: store.get(category.id, key, None) for key in BOTC_SETTING_KEYS}
+        enabled = bool(values["is_enabled"])
+        role_ids = {key: values[f"role.{key}"] for key in BOTC_ROLE_KEYS}
+        emojis = {key: values[f"emoji.{key}"] for key in BOTC_EMOJI_KEYS}
+        guild = category.guild
+        roles = {
+            key: None if role_id is None else guild.get_role(role_id)
+            for key, role_id in role_ids.items()
+        }
+        set_attr = super().__setattr__
+        set_attr("category_id", category.id)
+        set_attr("enabled", enabled)
+        set_attr("values", types.MappingProxyType(values))
+        set_attr("role_ids", types.MappingProxyType(role_ids))
+        set_attr("roles", types.MappingProxyType(roles))
+        set_attr("emojis", types.MappingProxyType(emojis))
+        set_attr("name_re", format_name_re(emojis) if enabled else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Category settings snapshots are immutable.")
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def references_role(self, role_id):
+        """Whether one of the town roles is the given role."""
+        return role_id in self.role_ids.values()
+
+
+class SettingsCache(object):
+    """Settings snapshots by category ID, rebuilt only when invalidated.
+
+    Every category that is looked up gets a snapshot, including those that are not
+    towns, so deciding that a command isn't for a town is a single dictionary hit.
+    Anything that changes a category's settings must call `invalidate`.
+
+    """
+
+    def __init__(self, bot):
+        """Initialize an empty cache reading from the bot's settings store."""
+        self.bot = bot
+        self.stats = collections.Counter()
+        self._snapshots = {}
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def get(self, category):
+        """Get the settings snapshot for a category."""
+        try:
+            snapshot = self._snapshots[category.id]
+        except KeyError:
+            self.stats["misses"] += 1
+            snapshot = CategorySettings(category, self.bot.botc_townsquare_settings)
+            self._snapshots[category.id] = snapshot
+        else:
+            self.stats["hits"] += 1
+        return snapshot
+
+    def invalidate(self, cat_id=None):
+        """Forget the snapshot for a category ID, or for all categories if None."""
+        self.stats["invalidations"] += 1
+        if cat_id is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(cat_id, None)
+
+    def invalidate_role(self, role_id):
+        """Forget the snapshots of categories that use the given role."""
+        for cat_id, snapshot in list(self._snapshots.items()):
+            if snapshot.references_role(role_id):
+                self.invalidate(cat_id)
@@ -11,7 +11,6 @@
 """Components for Blood on the Clocktower voice/text game setup cog."""
 
 import functools
-import random
 import typing
 
 import discord
@@ -27,8 +26,8 @@ def require_unlocked_town():
     def decorator(command):
         @functools.wraps(command)
         async def wrapper(self, ctx, *args, **kwargs):
-            town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-            if town["locked"]:
+            town = self.bot.botc_townsquare.find_town(ctx.message.channel.category)
+            if town is not None and town.locked:
                 raise common.BOTCTownSquareErrors.TownLocked(
                     "Command requires an unlocked town."
                 )
@@ -39,7 +38,13 @@ def require_unlocked_town():
     return decorator
 
 
-class BOTCTownSquareSetup(common.BOTCTownSquareErrorMixin, commands.Cog, name="Setup"):
+class BOTCTownSquareSetup(
+    common.BOTCTownSquareErrorMixin,
+    common.BOTCTownSquareMetricsMixin,
+    common.BOTCTownSquareJournalMixin,
+    commands.Cog,
+    name="Setup",
+):
     """Commands for Blood on the Clocktower voice/text town square game setup.
 
     If you want to play in the next game, use the `play` command in the game's text
@@ -49,7 +54,8 @@ class BOTCTownSquareSetup(common.BOTCTownSquareErrorMixin, commands.Cog, name="S
     Even though the seating is virtual, you might want to 'sit' next to someone else or
     have a particular number. You can use the `sit` command followed by a seat number,
     like `.sit 4`, to move yourself to a particular seat. The current occupant and
-    everyone in-between will shift toward your old seat. Anyone can also use the
+    everyone in-between will shift toward your old seat. To trade places with one
+    other player instead, use `swap` with their seat number. Anyone can also use the
     `shuffle` command to assign seats randomly.
 
     Once the town is locked by the Storyteller, in-game commands become active.
@@ -80,92 +86,106 @@ class BOTCTownSquareSetup(common.BOTCTownSquareErrorMixin, commands.Cog, name="S
         town = ts.get_town(ctx.message.channel.category)
         if member is None:
             member = ctx.message.author
-        if member in town["players"]:
+        if member.id in town.players:
             return
-        if member in town["storytellers"]:
-            await ctx.invoke(self.unstorytell)
-        town["players"].add(member)
-        order = town["player_order"]
-        order.append(member)
-        number = len(order)
-        await ts.set_player_info(ctx, member, seat=number)
-        role_id = town["role_ids"]["player"]
-        if role_id is not None:
-            role = ctx.guild.get_role(role_id)
-            await member.add_roles(role)
+        changed = self.add_player(ctx, town, ts.member_edits(ctx), member)
+        ts.stage_player_nicknames(ctx, changed)
 
     @commands.command(
-        aliases=["quit"], brief="Remove a player", usage="[<seat>|<name>]"
+        aliases=["quit"],
+        brief="Remove a player",
+        usage="[<seat>|<name>...]",
     )
     @require_unlocked_town()
     @delete_command_message()
-    async def unplay(self, ctx, *, member: typing.Union[int, discord.Member] = None):
-        """Remove the caller or given user as a player, also restoring name.
+    async def unplay(
+        self,
+        ctx,
+        members: commands.Greedy[typing.Union[int, discord.Member]],
+        *,
+        member: discord.Member = None,
+    ):
+        """Remove the caller or given users as players, also restoring names.
 
-        Indicate another player if necessary using either their seat number or their
-        *exact* name/tag.
+        Indicate other players if necessary using either their seat numbers or their
+        *exact* names/tags (only the last may contain spaces unquoted).
 
         """
+        if member is not None:
+            members.append(member)
         ts = self.bot.botc_townsquare
         town = ts.get_town(ctx.message.channel.category)
-        member = await ts.resolve_member_arg(ctx, member)
-        if member in town["travelers"]:
-            await ctx.invoke(self.untravel, member=member)
-        if member in town["players"]:
-            town["players"].remove(member)
-            town["player_order"].remove(member)
-        await ts.restore_name(ctx, member)
-        for idx, player in enumerate(town["player_order"]):
-            if town["player_info"][player]["seat"] != idx + 1:
-                await ts.set_player_info(ctx, player, seat=idx + 1)
-        role_id = town["role_ids"]["player"]
-        if role_id is not None:
-            role = ctx.guild.get_role(role_id)
-            await member.remove_roles(role)
-
-    @commands.command(brief="Set player as a traveler", usage="[<seat>|<name>]")
+        members = await ts.resolve_member_args(ctx, members)
+        changed = self.remove_players(ctx, town, ts.member_edits(ctx), members)
+        # the removed players' names are already restored
+        ts.stage_player_nicknames(ctx, changed.intersection(town.players))
+
+    @commands.command(
+        brief="Set player as a traveler",
+        usage="[<seat>|<name>...]",
+    )
     @require_unlocked_town()
     @delete_command_message()
-    async def travel(self, ctx, *, member: typing.Union[int, discord.Member] = None):
-        """Set the caller or given user as a traveler.
+    async def travel(
+        self,
+        ctx,
+        members: commands.Greedy[typing.Union[int, discord.Member]],
+        *,
+        member: discord.Member = None,
+    ):
+        """Set the caller or given users as travelers.
 
-        Indicate another player if necessary using either their seat number (if already
-        a player) or their *exact* name/tag.
+        Indicate other players if necessary using either their seat numbers (if
+        already players) or their *exact* names/tags (only the last may contain
+        spaces unquoted).
 
         """
+        if member is not None:
+            members.append(member)
         ts = self.bot.botc_townsquare
         town = ts.get_town(ctx.message.channel.category)
-        member = await ts.resolve_member_arg(ctx, member)
-        if member not in town["players"]:
-            await ctx.invoke(self.play, member=member)
-        town["travelers"].add(member)
-        await ts.set_player_info(ctx, member, traveling=True)
-        role_id = town["role_ids"]["traveler"]
-        if role_id is not None:
-            role = ctx.guild.get_role(role_id)
-            await member.add_roles(role)
-
-    @commands.command(brief="Unset player as a traveler", usage="[<seat>|<name>]")
+        members = await ts.resolve_member_args(ctx, members)
+        edits = ts.member_edits(ctx)
+        changed = set(member.id for member in members)
+        with town.batch():
+            for member in members:
+                if member.id not in town.players:
+                    changed.update(self.add_player(ctx, town, edits, member))
+                town.add_traveler(member.id)
+                edits.add_role(member, town.role_ids["traveler"])
+        ts.stage_player_nicknames(ctx, changed)
+
+    @commands.command(
+        brief="Unset player as a traveler",
+        usage="[<seat>|<name>...]",
+    )
     @require_unlocked_town()
     @delete_command_message()
-    async def untravel(self, ctx, *, member: typing.Union[int, discord.Member] = None):
-        """Unset the caller or given user as a traveler.
+    async def untravel(
+        self,
+        ctx,
+        members: commands.Greedy[typing.Union[int, discord.Member]],
+        *,
+        member: discord.Member = None,
+    ):
+        """Unset the caller or given users as travelers.
 
-        Indicate another player if necessary using either their seat number or their
-        *exact* name/tag.
+        Indicate other players if necessary using either their seat numbers or their
+        *exact* names/tags (only the last may contain spaces unquoted).
 
         """
+        if member is not None:
+            members.append(member)
         ts = self.bot.botc_townsquare
         town = ts.get_town(ctx.message.channel.category)
-        member = await ts.resolve_player_arg(ctx, member)
-        if member not in town["travelers"]:
-            return
-        town["travelers"].remove(member)
-        await ts.set_player_info(ctx, member, traveling=False)
-        role_id = town["role_ids"]["traveler"]
-        if role_id is not None:
-            role = ctx.guild.get_role(role_id)
-            await member.remove_roles(role)
+        members = await ts.resolve_player_args(ctx, members)
+        travelers = [member for member in members if member.id in town.travelers]
+        edits = ts.member_edits(ctx)
+        with town.batch():
+            for member in travelers:
+                town.remove_traveler(member.id)
+                edits.remove_role(member, town.role_ids["traveler"])
+        ts.stage_player_nicknames(ctx, [member.id for member in travelers])
 
     @commands.command(
         name="storytell", aliases=["st"], brief="Add a storyteller", usage="[<name>]"
@@ -182,16 +202,15 @@ class BOTCTownSquareSetup(common.BOTCTownSquareErrorMixin, commands.Cog, name="S
         town = ts.get_town(ctx.message.channel.category)
         if member is None:
             member = ctx.message.author
-        if member in town["storytellers"]:
+        if member.id in town.storytellers:
             return
-        if member in town["players"]:
-            await ctx.invoke(self.unplay, member=member)
-        town["storytellers"].add(member)
-        await ts.set_storyteller_nickname(ctx, member)
-        role_id = town["role_ids"]["storyteller"]
-        if role_id is not None:
-            role = ctx.guild.get_role(role_id)
-            await member.add_roles(role)
+        edits = ts.member_edits(ctx)
+        if member.id in town.players:
+            changed = self.remove_players(ctx, town, edits, [member])
+            ts.stage_player_nicknames(ctx, changed.intersection(town.players))
+        town.add_storyteller(member.id)
+        edits.set_nick(member, ts.storyteller_nickname(ctx, member))
+        edits.add_role(member, town.role_ids["storyteller"])
 
     @commands.command(
         name="unstorytell", aliases=["unst"], brief="Unset storyteller(s)"
@@ -202,13 +221,7 @@ class BOTCTownSquareSetup(common.BOTCTownSquareErrorMixin, commands.Cog, name="S
         """Unset the existing storyteller(s)."""
         ts = self.bot.botc_townsquare
         town = ts.get_town(ctx.message.channel.category)
-        for storyteller in list(town["storytellers"]):
-            town["storytellers"].remove(storyteller)
-            await ts.restore_name(ctx, storyteller)
-            role_id = town["role_ids"]["storyteller"]
-            if role_id is not None:
-                role = ctx.guild.get_role(role_id)
-                await storyteller.remove_roles(role)
+        self.remove_storytellers(ctx, town, ts.member_edits(ctx))
 
     @commands.command(
         brief="Move player to a given seat", usage="<new-seat> [<old-seat>|<name>]"
@@ -230,15 +243,37 @@ class BOTCTownSquareSetup(common.BOTCTownSquareErrorMixin, commands.Cog, name="S
         ts = self.bot.botc_townsquare
         town = ts.get_town(ctx.message.channel.category)
         member = await ts.resolve_player_arg(ctx, member)
-        order = town["player_order"]
-        oldindex = order.index(member)
-        newindex = seat - 1
+        if seat < 1:
+            raise common.BOTCTownSquareErrors.BadSeatArgument("Seat number is invalid")
         # puts member in the given seat while shifting the existing occupants
         # between the new seat and old toward the old seat
-        order.insert(newindex, order.pop(oldindex))
-        for idx, player in enumerate(order):
-            if town["player_info"][player]["seat"] != idx + 1:
-                await ts.set_player_info(ctx, player, seat=idx + 1)
+        changed = town.move_player(member.id, seat)
+        ts.stage_player_nicknames(ctx, changed)
+
+    @commands.command(
+        brief="Swap seats of two players", usage="<seat>|<name> [<seat>|<name>]"
+    )
+    @require_unlocked_town()
+    @delete_command_message()
+    async def swap(
+        self,
+        ctx,
+        other: typing.Union[int, discord.Member],
+        *,
+        member: typing.Union[int, discord.Member] = None,
+    ):
+        """Swap seats between the caller or given user and another player.
+
+        Indicate players using either their seat number or their *exact* name/tag. To
+        swap two other players, give both of them.
+
+        """
+        ts = self.bot.botc_townsquare
+        town = ts.get_town(ctx.message.channel.category)
+        other = await ts.resolve_player_arg(ctx, other)
+        member = await ts.resolve_player_arg(ctx, member)
+        changed = town.swap_players(member.id, other.id)
+        ts.stage_player_nicknames(ctx, changed)
 
     @commands.command(brief="Shuffle seat order")
     @require_unlocked_town()
@@ -247,8 +282,45 @@ class BOTCTownSquareSetup(common.BOTCTownSquareErrorMixin, commands.Cog, name="S
         """Shuffle the seat order of the current players."""
         ts = self.bot.botc_townsquare
         town = ts.get_town(ctx.message.channel.category)
-        order = town["player_order"]
-        random.shuffle(order)
-        for idx, player in enumerate(order):
-            if town["player_info"][player]["seat"] != idx + 1:
-                await ts.set_player_info(ctx, player, seat=idx + 1)
+        changed = town.shuffle_players()
+        ts.stage_player_nicknames(ctx, changed)
+
+    def add_player(self, ctx, town, edits, member):
+        """Seat a member as a player, returning the IDs of members whose seat moved.
+
+        Storytellers are unset first. Role and nickname changes are added to `edits`,
+        except for the nicknames of the moved players.
+
+        """
+        if member.id in town.storytellers:
+            self.remove_storytellers(ctx, town, edits)
+        changed = town.add_player(member.id)
+        edits.add_role(member, town.role_ids["player"])
+        return changed
+
+    def remove_players(self, ctx, town, edits, members):
+        """Remove members as players, returning the IDs of members whose seat moved.
+
+        The removed members' names are restored in `edits`, but the nicknames of the
+        remaining players who moved are left to the caller.
+
+        """
+        ts = self.bot.botc_townsquare
+        changed = set()
+        with town.batch():
+            for member in members:
+                if member.id in town.travelers:
+                    town.remove_traveler(member.id)
+                    edits.remove_role(member, town.role_ids["traveler"])
+                changed.update(town.remove_player(member.id))
+                edits.set_nick(member, ts.restored_nickname(ctx, member))
+                edits.remove_role(member, town.role_ids["player"])
+        return changed
+
+    def remove_storytellers(self, ctx, town, edits):
+        """Unset all of a town's storytellers, restoring their names in `edits`."""
+        ts = self.bot.botc_townsquare
+        for storyteller in ts.get_members(ctx.guild, list(town.storytellers)):
+            town.remove_storyteller(storyteller.id)
+            edits.set_nick(storyteller, ts.restored_nickname(ctx, storyteller))
+            edits.remove_role(storyteller, town.role_ids["storyteller"])
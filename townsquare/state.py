@@ -0,0 +1,544 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Town state model for Blood on the Clocktower town square extension."""
+
+import contextlib
+import math
+import time
+
+from .members import TownMembers
+from .seating import Seating
+
+
+class PlayerInfo(object):
+    """Game state of a single player."""
+
+    __slots__ = ("dead", "num_votes", "traveling")
+
+    def __init__(self, dead=False, num_votes=None, traveling=False):
+        """Initialize player info, by default for a living player."""
+        self.dead = dead
+        self.num_votes = num_votes
+        self.traveling = traveling
+
+    def update(self, **kwargs):
+        """Set new values for the given player info attributes."""
+        for key, val in kwargs.items():
+            setattr(self, key, val)
+
+    def to_dict(self):
+        """Convert player info to a JSON-serializable dictionary."""
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create player info from a dictionary made by `to_dict`."""
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+
+class Nomination(object):
+    """A nomination, its message, and the number of votes it received."""
+
+    __slots__ = (
+        "channel_id",
+        "message_id",
+        "nominator_id",
+        "target_id",
+        "exile",
+        "votes",
+    )
+
+    def __init__(
+        self, channel_id, message_id, nominator_id, target_id, exile=False, votes=None
+    ):
+        """Initialize a nomination that has not yet been voted on."""
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.nominator_id = nominator_id
+        self.target_id = target_id
+        self.exile = exile
+        self.votes = votes
+
+    @property
+    def ids(self):
+        """The (channel ID, message ID) pair of the nomination message."""
+        return (self.channel_id, self.message_id)
+
+    def to_dict(self):
+        """Convert the nomination to a JSON-serializable dictionary."""
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a nomination from a dictionary made by `to_dict`."""
+        return cls(**{key: data[key] for key in cls.__slots__ if key in data})
+
+
+class NominationLedger(object):
+    """Today's nominations in order, indexed by nominator and by target.
+
+    Executions and exiles are indexed separately, since a player can nominate and be
+    nominated once a day for each. The highest vote count of today's executions and
+    the nominations that reached it are kept as votes are recorded, so finding the
+    player on the block never scans the day.
+
+    """
+
+    __slots__ = ("_nominations", "_by_nominator", "_by_target", "highest", "_leaders")
+
+    def __init__(self, nominations=()):
+        """Initialize a ledger with the given nominations in order."""
+        self._reset()
+        for nom in nominations:
+            self.add(nom)
+
+    def __len__(self):
+        return len(self._nominations)
+
+    def __iter__(self):
+        return iter(self._nominations)
+
+    def __contains__(self, nomination):
+        return nomination in self._nominations
+
+    def by_nominator(self, member_id, exile=False):
+        """Get today's nomination (or exile) made by a member, or None."""
+        return self._by_nominator.get((exile, member_id))
+
+    def by_target(self, member_id, exile=False):
+        """Get today's nomination (or exile) of a member, or None."""
+        return self._by_target.get((exile, member_id))
+
+    def add(self, nomination):
+        """Add a nomination to the end of the day."""
+        self._nominations.append(nomination)
+        key = nomination.exile
+        self._by_nominator.setdefault((key, nomination.nominator_id), nomination)
+        self._by_target.setdefault((key, nomination.target_id), nomination)
+        self._tally(nomination)
+
+    def remove(self, nomination):
+        """Remove a nomination, as if it had never been made."""
+        self._nominations.remove(nomination)
+        self._reindex()
+
+    def record_votes(self, nomination, votes):
+        """Record the number of votes a nomination received, adding it if new."""
+        previous = nomination.votes
+        nomination.votes = votes
+        if nomination not in self._nominations:
+            self.add(nomination)
+        elif previous is None:
+            self._tally(nomination)
+        else:
+            # a corrected count can dethrone the leaders, so count again
+            self._reindex()
+
+    def on_the_block(self, threshold):
+        """Get the target of the one execution with the most votes, if enough."""
+        if self.highest is None or self.highest < threshold:
+            return None
+        if len(self._leaders) != 1:
+            return None
+        return self._leaders[0].target_id
+
+    def is_tied(self):
+        """Whether more than one execution has the highest vote count."""
+        return len(self._leaders) > 1
+
+    def _tally(self, nomination):
+        votes = nomination.votes
+        if nomination.exile or votes is None:
+            return
+        if self.highest is None or votes > self.highest:
+            self.highest = votes
+            self._leaders = [nomination]
+        elif votes == self.highest:
+            self._leaders.append(nomination)
+
+    def _reset(self):
+        self._nominations = []
+        # (exile, member ID) -> the member's first such nomination today
+        self._by_nominator = {}
+        self._by_target = {}
+        self.highest = None
+        self._leaders = []
+
+    def _reindex(self):
+        nominations = self._nominations
+        self._reset()
+        for nom in nominations:
+            self.add(nom)
+
+
+class TownState(object):
+    """Game state of a town, with members identified by their IDs.
+
+    Players, travelers, and storytellers are held as member IDs and nominations by
+    their channel and message IDs, so that a town never keeps Discord objects alive
+    past their usefulness. Resolve them against the guild when they are needed.
+
+    Every nomination made today is kept in the `day_nominations` ledger, along with the
+    current and previous nominations. Only players have an entry in `player_info`. Use
+    `get_info` to look up the info for any member without adding an entry. Seats are
+    kept by `seating`, and the methods that change seats return the IDs of the players
+    whose seat changed.
+
+    The town's roles, emojis, and name regex come from the category settings
+    snapshot in `settings`, which is replaced whenever the settings change. Parsed
+    member names and voice channels are cached in `member_cache`.
+
+    Change the town only through its methods, which bump `version` so that anything
+    derived from the town state can be cached against it. The methods also queue
+    game events in `events` as (time, type, args) for the game event log, unless
+    `events` is None.
+
+    """
+
+    __slots__ = (
+        "category_id",
+        "players",
+        "seating",
+        "player_info",
+        "travelers",
+        "storytellers",
+        "locked",
+        "nomination",
+        "prev_nomination",
+        "day_nominations",
+        "settings",
+        "version",
+        "summary_cache",
+        "summary_message",
+        "events",
+        "member_cache",
+        "_batching",
+        "_batch_changed",
+    )
+
+    def __init__(self, category_id, settings):
+        """Initialize an empty town using the given category settings snapshot."""
+        self.category_id = category_id
+        self.players = set()
+        self.seating = Seating()
+        self.player_info = {}
+        self.travelers = set()
+        self.storytellers = set()
+        self.locked = False
+        self.nomination = None
+        self.prev_nomination = None
+        self.day_nominations = NominationLedger()
+        self.settings = settings
+        self.version = 0
+        self.summary_cache = None
+        self.summary_message = None
+        self.events = []
+        self.member_cache = TownMembers()
+        self._batching = 0
+        self._batch_changed = False
+
+    def touch(self):
+        """Mark the town state as changed."""
+        if self._batching:
+            self._batch_changed = True
+        else:
+            self.version += 1
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Group changes made in the block into a single change of the version."""
+        self._batching += 1
+        try:
+            yield self
+        finally:
+            self._batching -= 1
+            if not self._batching and self._batch_changed:
+                self._batch_changed = False
+                self.version += 1
+
+    def emit(self, event_type, *args):
+        """Queue a game event for the event log."""
+        if self.events is not None:
+            self.events.append((time.time(), event_type, args))
+
+    def take_events(self):
+        """Remove and return the queued game events."""
+        events = self.events
+        self.events = [] if events is not None else None
+        return events or []
+
+    @property
+    def role_ids(self):
+        """IDs of the town roles by role key, None if unset."""
+        return self.settings.role_ids
+
+    @property
+    def emojis(self):
+        """Emojis marking player state by emoji key."""
+        return self.settings.emojis
+
+    @property
+    def name_re(self):
+        """Regular expression parsing player state from nicknames."""
+        return self.settings.name_re
+
+    def set_settings(self, settings):
+        """Use a new category settings snapshot."""
+        self.settings = settings
+        self.touch()
+
+    def is_empty(self):
+        """Whether the town holds no game worth keeping."""
+        return not (self.players or self.storytellers or self.locked)
+
+    def get_info(self, member_id):
+        """Get the player info for a member, or default info for a non-player."""
+        try:
+            return self.player_info[member_id]
+        except KeyError:
+            return PlayerInfo()
+
+    def update_info(self, member_id, **kwargs):
+        """Set new values for a player's info."""
+        self.player_info[member_id].update(**kwargs)
+        for key, val in kwargs.items():
+            if key == "dead":
+                self.emit("dead" if val else "alive", member_id)
+            elif key == "num_votes":
+                self.emit("votes", member_id, val)
+            elif key == "traveling":
+                self.emit("travel" if val else "untravel", member_id)
+        self.touch()
+
+    def seat_of(self, member_id):
+        """Get the seat number of a player, or None for a non-player."""
+        return self.seating.seat_of(member_id)
+
+    def member_at_seat(self, seat):
+        """Get the ID of the player in the given seat, or None if it is empty."""
+        return self.seating.member_at(seat)
+
+    def add_player(self, member_id):
+        """Add a player in the last seat, returning IDs of players with new seats."""
+        if member_id in self.players:
+            return []
+        self.players.add(member_id)
+        self.player_info[member_id] = PlayerInfo()
+        self.emit("play", member_id)
+        self.touch()
+        return self.seating.insert(member_id)
+
+    def remove_player(self, member_id):
+        """Remove a player and their info, returning IDs of players with new seats."""
+        if member_id not in self.players:
+            return []
+        self.players.remove(member_id)
+        self.travelers.discard(member_id)
+        del self.player_info[member_id]
+        self.emit("quit", member_id)
+        self.touch()
+        return self.seating.remove(member_id)
+
+    def move_player(self, member_id, seat):
+        """Move a player to a seat, returning IDs of players with new seats."""
+        self.emit("move", member_id, seat)
+        self.touch()
+        return self.seating.move(member_id, seat)
+
+    def swap_players(self, member_id, other_id):
+        """Swap the seats of two players, returning IDs of players with new seats."""
+        self.emit("swap", member_id, other_id)
+        self.touch()
+        return self.seating.swap(member_id, other_id)
+
+    def shuffle_players(self):
+        """Shuffle the seats, returning IDs of players with new seats."""
+        self.touch()
+        moved = self.seating.shuffle()
+        # the new order is recorded since it can't be replayed
+        self.emit("seats", *self.seating)
+        return moved
+
+    def reorder_players(self, member_ids):
+        """Seat the players in the given order, returning IDs with new seats."""
+        self.touch()
+        moved = self.seating.reorder(member_ids)
+        self.emit("seats", *self.seating)
+        return moved
+
+    def add_traveler(self, member_id):
+        """Mark an existing player as a traveler."""
+        self.travelers.add(member_id)
+        self.player_info[member_id].traveling = True
+        self.emit("travel", member_id)
+        self.touch()
+
+    def remove_traveler(self, member_id):
+        """Unmark a player as a traveler."""
+        self.travelers.discard(member_id)
+        if member_id in self.player_info:
+            self.player_info[member_id].traveling = False
+        self.emit("untravel", member_id)
+        self.touch()
+
+    def add_storyteller(self, member_id):
+        """Add a storyteller."""
+        self.storytellers.add(member_id)
+        self.emit("storytell", member_id)
+        self.touch()
+
+    def remove_storyteller(self, member_id):
+        """Remove a storyteller."""
+        self.storytellers.discard(member_id)
+        self.emit("unstorytell", member_id)
+        self.touch()
+
+    def sole_storyteller(self):
+        """Get the ID of the storyteller if there is exactly one, otherwise None."""
+        if len(self.storytellers) == 1:
+            return next(iter(self.storytellers))
+        return None
+
+    def set_locked(self, locked):
+        """Lock or unlock the town."""
+        self.locked = locked
+        self.emit("lock" if locked else "unlock")
+        self.touch()
+
+    def alive_count(self):
+        """Count the living players."""
+        return sum(not info.dead for info in self.player_info.values())
+
+    def vote_threshold(self):
+        """Get the number of votes needed to execute (or exile)."""
+        return int(math.ceil(self.alive_count() / 2))
+
+    def set_nomination(self, message, nominator_id, target_id):
+        """Set the current nomination from its message."""
+        self.nomination = Nomination(
+            message.channel.id,
+            message.id,
+            nominator_id,
+            target_id,
+            exile=target_id in self.travelers,
+        )
+        self.day_nominations.add(self.nomination)
+        self.emit("nominate", nominator_id, target_id, message.channel.id, message.id)
+        self.touch()
+
+    def record_votes(self, nomination, votes):
+        """Record the number of votes a nomination received today."""
+        self.day_nominations.record_votes(nomination, votes)
+        self.emit("tally", nomination.message_id, votes)
+        self.touch()
+
+    def highest_votes(self):
+        """Get the highest vote count of today's executions, or None if none."""
+        return self.day_nominations.highest
+
+    def on_the_block(self):
+        """Get the ID of the player about to be executed, or None.
+
+        The player on the block is the target of today's nomination with the most
+        votes, provided they reached the threshold and nobody tied with them.
+
+        """
+        return self.day_nominations.on_the_block(self.vote_threshold())
+
+    def new_day(self):
+        """Start a new day, forgetting the previous day's nominations."""
+        self.nomination = None
+        self.prev_nomination = None
+        self.day_nominations = NominationLedger()
+        self.emit("newday")
+        self.touch()
+
+    def finish_nomination(self):
+        """Move the current nomination to the previous nomination."""
+        self.prev_nomination = self.nomination
+        self.nomination = None
+        self.emit("finish")
+        self.touch()
+
+    def cancel_nomination(self):
+        """Forget the current, or else previous, nomination and return it."""
+        if self.nomination is not None:
+            nomination = self.nomination
+            self.nomination = None
+        else:
+            nomination = self.prev_nomination
+            self.prev_nomination = None
+        if nomination in self.day_nominations:
+            self.day_nominations.remove(nomination)
+        self.emit("cancel", None if nomination is None else nomination.message_id)
+        self.touch()
+        return nomination
+
+    def to_dict(self):
+        """Convert the persistent parts of the town to a JSON-serializable dict."""
+
+        def nomination(nom):
+            return None if nom is None else nom.to_dict()
+
+        return dict(
+            players=sorted(self.players),
+            player_order=list(self.seating),
+            player_info={
+                str(member_id): info.to_dict()
+                for member_id, info in self.player_info.items()
+            },
+            travelers=sorted(self.travelers),
+            storytellers=sorted(self.storytellers),
+            locked=self.locked,
+            nomination=nomination(self.nomination),
+            prev_nomination=nomination(self.prev_nomination),
+            day_nominations=[nom.to_dict() for nom in self.day_nominations],
+        )
+
+    def update_from_dict(self, data):
+        """Load the persistent parts of the town from a dictionary made by `to_dict`."""
+
+        self.players = set(data.get("players", []))
+        self.seating = Seating(
+            member_id
+            for member_id in data.get("player_order", [])
+            if member_id in self.players
+        )
+        for member_id in sorted(self.players - set(self.seating)):
+            self.seating.insert(member_id)
+        info = data.get("player_info", {})
+        self.player_info = {
+            member_id: PlayerInfo.from_dict(info.get(str(member_id), {}))
+            for member_id in self.players
+        }
+        self.travelers = set(data.get("travelers", [])) & self.players
+        self.storytellers = set(data.get("storytellers", []))
+        self.locked = data.get("locked", False)
+        self.day_nominations = NominationLedger(
+            Nomination.from_dict(nom) for nom in data.get("day_nominations", [])
+        )
+        # keep the current/previous nominations identical to those in the day list
+        day = {nom.ids: nom for nom in self.day_nominations}
+
+        def nomination(nom):
+            if nom is None:
+                return None
+            nom = Nomination.from_dict(nom)
+            return day.get(nom.ids, nom)
+
+        self.nomination = nomination(data.get("nomination"))
+        self.prev_nomination = nomination(data.get("prev_nomination"))
+        # states saved before every nomination was in the ledger
+        for nom in (self.nomination, self.prev_nomination):
+            if nom is not None and nom not in self.day_nominations:
+                self.day_nominations.add(nom)
+        self.emit("load", data)
+        self.touch()
@@ -0,0 +1,369 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2020 Ryan Volz
+# All rights reserved.
+#
+# Distributed under the terms of the BSD 3-clause license.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#
+# SPDX-License-Identifier: BSD-3-Clause
+# ----------------------------------------------------------------------------
+"""Town state stores for Blood on the Clocktower town square extension."""
+
+import abc
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import sqlite3
+
+from .journal import TownJournal
+
+BOTC_STORE_PATH = "botc_townsquare_state.sqlite3"
+# seconds to wait for another process's write before giving up
+BOTC_STORE_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+class StaleTownError(Exception):
+    """A town was changed by someone else since its state was last loaded."""
+
+    def __init__(self, cat_id):
+        self.cat_id = cat_id
+        super().__init__(f"Town {cat_id} was changed elsewhere")
+
+
+class TownStore(abc.ABC):
+    """Where town states live when they are not in the town registry.
+
+    Town states are the JSON-serializable dictionaries made by `TownState.to_dict`,
+    keyed by category ID. The store remembers which version of each town this process
+    last loaded or saved: `is_current` says whether that is still the latest, and
+    `save` only succeeds if it is, raising `StaleTownError` otherwise, so that two
+    processes sharing a store never silently overwrite each other's changes.
+
+    """
+
+    def __init__(self):
+        """Initialize the store's statistics."""
+        self.stats = collections.Counter()
+
+    @abc.abstractmethod
+    def has(self, cat_id):
+        """Whether a town is stored."""
+
+    @abc.abstractmethod
+    def load(self, cat_id):
+        """Get a stored town's state, or None if it isn't stored."""
+
+    @abc.abstractmethod
+    def is_current(self, cat_id):
+        """Whether the town state last loaded or saved here is still the latest."""
+
+    async def has_async(self, cat_id):
+        """Like `has`, but without blocking the event loop where the store allows."""
+        return self.has(cat_id)
+
+    async def is_current_async(self, cat_id):
+        """Like `is_current`, but without blocking the event loop where it allows."""
+        return self.is_current(cat_id)
+
+    async def prefetch(self, cat_id):
+        """Get ready to load a town without blocking, if loading it would block."""
+        pass
+
+    @abc.abstractmethod
+    def save(self, cat_id, state):
+        """Store a town's state, returning whether it changed."""
+
+    async def save_async(self, cat_id, state):
+        """Like `save`, but without blocking the event loop where the store allows."""
+        return self.save(cat_id, state)
+
+    @abc.abstractmethod
+    def delete(self, cat_id):
+        """Delete a town, whoever changed it last."""
+
+    @abc.abstractmethod
+    def evict(self, cat_id, state):
+        """Let go of a town leaving the registry, deleting it if its state is None."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Finish pending writes."""
+
+
+class MemoryTownStore(TownStore):
+    """Process-local store, with towns kept in the registry and journaled to disk.
+
+    This is the default store. Nothing else can change its towns, so they are always
+    current. Towns restored from the journal are handed over to the registry when
+    first loaded, and evicted towns with a game are spilled out of memory by the
+    journal until they are loaded again.
+
+    """
+
+    def __init__(self, journal=None, handoff=None):
+        """Initialize the store, restoring towns from the journal.
+
+        Given the `handoff` of a store torn down by a reload, carry on from its state
+        instead of reading the journal back from disk.
+
+        """
+        super().__init__()
+        self.journal = TownJournal() if journal is None else journal
+        # towns are restored lazily, when their category is next used
+        if handoff is None:
+            self._restored = self.journal.load()
+        else:
+            self.journal.adopt(handoff["journal"])
+            self._restored = handoff["restored"]
+            self.stats = handoff["stats"]
+
+    def has(self, cat_id):
+        return cat_id in self._restored or self.journal.is_spilled(cat_id)
+
+    def load(self, cat_id):
+        self.stats["loads"] += 1
+        state = self._restored.pop(cat_id, None)
+        if state is None:
+            # rehydrate a town that was evicted while holding a game
+            state = self.journal.unspill(cat_id)
+        return state
+
+    def is_current(self, cat_id):
+        return True
+
+    async def prefetch(self, cat_id):
+        if cat_id not in self._restored:
+            # read a spilled town back on the journal's worker, ready for `load`
+            state = await self.journal.unspill_async(cat_id)
+            if state is not None:
+                self._restored[cat_id] = state
+
+    def save(self, cat_id, state):
+        if not self.journal.record(cat_id, state):
+            return False
+        self.stats["saves"] += 1
+        return True
+
+    def delete(self, cat_id):
+        self._restored.pop(cat_id, None)
+        self.journal.remove(cat_id)
+
+    def evict(self, cat_id, state):
+        if state is None:
+            self.journal.remove(cat_id)
+        else:
+            self.journal.spill(cat_id, state)
+
+    def close(self):
+        self.journal.close()
+
+    def handoff(self):
+        """Finish pending writes and return what a new store needs to carry on."""
+        return dict(
+            journal=self.journal.handoff(), restored=self._restored, stats=self.stats
+        )
+
+
+class SQLiteTownStore(TownStore):
+    """Store shared by bot processes on one machine through a SQLite database.
+
+    Each town is a row holding its state and a version that goes up with every save.
+    A save is a single compare-and-swap on the version this process last saw, so a
+    process that missed another's change gets `StaleTownError` instead of writing
+    over it. Versions are cached and only read again after SQLite's `data_version`
+    shows that another connection has committed something, which keeps checking that
+    a town is current to one cheap query while nothing changes.
+
+    The database is in WAL mode, so readers never wait on writers, and is only used
+    from a single worker thread. A save is a few tens of microseconds unless another
+    process is writing at the same moment, in which case it waits up to `timeout`
+    seconds, so use the `*_async` methods and `prefetch` from the event loop; the
+    others block until the worker is done. Deletes and evictions don't wait at all.
+
+    """
+
+    def __init__(self, path=BOTC_STORE_PATH, timeout=BOTC_STORE_TIMEOUT):
+        """Open (creating if necessary) the database at the given path."""
+        super().__init__()
+        self.path = path
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="botc_store"
+        )
+        self._db = self._call(self._connect, path, timeout)
+        self._data_version = None
+        # category ID -> version in the database (0 if missing), as last read
+        self._stored = {}
+        # category ID -> (version, serialized state) last loaded or saved here
+        self._held = {}
+        # category ID -> row (or None if missing) read ahead of `load` by `prefetch`
+        self._prefetched = {}
+
+    @staticmethod
+    def _connect(path, timeout):
+        # autocommit, since every write is a single statement
+        db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS towns ("
+            "category_id INTEGER PRIMARY KEY,"
+            " version INTEGER NOT NULL,"
+            " state TEXT NOT NULL)"
+        )
+        return db
+
+    def _call(self, fn, *args):
+        return self._executor.submit(fn, *args).result()
+
+    async def _call_async(self, fn, *args):
+        return await asyncio.wrap_future(self._executor.submit(fn, *args))
+
+    def _submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future):
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Failed to write town store", exc_info=exc)
+
+    def _sync(self):
+        """Forget the cached versions if another connection has written since."""
+        data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._stored.clear()
+
+    def _stored_version(self, cat_id):
+        try:
+            return self._stored[cat_id]
+        except KeyError:
+            pass
+        self.stats["version_reads"] += 1
+        row = self._db.execute(
+            "SELECT version FROM towns WHERE category_id = ?", (cat_id,)
+        ).fetchone()
+        version = self._stored[cat_id] = 0 if row is None else row[0]
+        return version
+
+    def _held_version(self, cat_id):
+        held = self._held.get(cat_id)
+        return 0 if held is None else held[0]
+
+    def _has(self, cat_id):
+        self._sync()
+        return self._stored_version(cat_id) > 0
+
+    def has(self, cat_id):
+        return self._call(self._has, cat_id)
+
+    async def has_async(self, cat_id):
+        return await self._call_async(self._has, cat_id)
+
+    def _read(self, cat_id):
+        return self._db.execute(
+            "SELECT version, state FROM towns WHERE category_id = ?", (cat_id,)
+        ).fetchone()
+
+    def _prefetch(self, cat_id):
+        self._prefetched[cat_id] = self._read(cat_id)
+
+    def _load(self, cat_id):
+        self.stats["loads"] += 1
+        try:
+            # a save by another process since is still caught by the next save here
+            row = self._prefetched.pop(cat_id)
+        except KeyError:
+            row = self._read(cat_id)
+        if row is None:
+            self._stored[cat_id] = 0
+            self._held.pop(cat_id, None)
+            return None
+        self._stored[cat_id] = row[0]
+        self._held[cat_id] = row
+        return json.loads(row[1])
+
+    def load(self, cat_id):
+        return self._call(self._load, cat_id)
+
+    async def prefetch(self, cat_id):
+        await self._call_async(self._prefetch, cat_id)
+
+    def _is_current(self, cat_id):
+        self._sync()
+        return self._stored_version(cat_id) == self._held_version(cat_id)
+
+    def is_current(self, cat_id):
+        return self._call(self._is_current, cat_id)
+
+    async def is_current_async(self, cat_id):
+        return await self._call_async(self._is_current, cat_id)
+
+    def _save(self, cat_id, text):
+        version = self._held_version(cat_id)
+        if version and self._held[cat_id][1] == text:
+            return False
+        if version:
+            cursor = self._db.execute(
+                "UPDATE towns SET version = ?, state = ?"
+                " WHERE category_id = ? AND version = ?",
+                (version + 1, text, cat_id, version),
+            )
+        else:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO towns VALUES (?, 1, ?)", (cat_id, text)
+            )
+        if cursor.rowcount != 1:
+            self.stats["conflicts"] += 1
+            self._stored.pop(cat_id, None)
+            raise StaleTownError(cat_id)
+        self.stats["saves"] += 1
+        self._stored[cat_id] = version + 1
+        self._held[cat_id] = (version + 1, text)
+        return True
+
+    def save(self, cat_id, state):
+        return self._call(self._save, cat_id, _dumps(state))
+
+    async def save_async(self, cat_id, state):
+        return await self._call_async(self._save, cat_id, _dumps(state))
+
+    def _delete(self, cat_id):
+        self._db.execute("DELETE FROM towns WHERE category_id = ?", (cat_id,))
+        self._stored[cat_id] = 0
+        self._held.pop(cat_id, None)
+        self._prefetched.pop(cat_id, None)
+
+    def delete(self, cat_id):
+        self._submit(self._delete, cat_id)
+
+    def _evict(self, cat_id, empty):
+        held = self._held.pop(cat_id, None)
+        if empty and held is not None:
+            # unless another process has since put a game in it
+            self._db.execute(
+                "DELETE FROM towns WHERE category_id = ? AND version = ?",
+                (cat_id, held[0]),
+            )
+        self._stored.pop(cat_id, None)
+        self._prefetched.pop(cat_id, None)
+
+    def evict(self, cat_id, state):
+        self._submit(self._evict, cat_id, state is None)
+
+    def close(self):
+        self._submit(self._close)
+        self._executor.shutdown(wait=True)
+
+    def _close(self):
+        self._db.close()
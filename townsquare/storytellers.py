@@ -10,7 +10,6 @@
 # ----------------------------------------------------------------------------
 """Components for Blood on the Clocktower voice/text storytellers cog."""
 
-import discord
 from discord.ext import commands
 
 from . import common
@@ -18,13 +17,18 @@ from ...utils.commands import acknowledge_command, delete_command_message
 
 
 class BOTCTownSquareStorytellers(
-    common.BOTCTownSquareErrorMixin, commands.Cog, name="Storytellers"
+    common.BOTCTownSquareErrorMixin,
+    common.BOTCTownSquareMetricsMixin,
+    common.BOTCTownSquareJournalMixin,
+    commands.Cog,
+    name="Storytellers",
 ):
     """Commands for Blood on the Clocktower voice/text storytellers.
 
     Once all players are ready, use the `lock` command to freeze the player list and
     seat assignments. If you need to make adjustments mid-game, use the `unlock`
-    command to re-enable the game setup commands.
+    command to re-enable the game setup commands. At the start of each day, use the
+    `newday` command so that the day's nominations and vote counts start fresh.
 
     After the game, use the `clear` command to erase the game state and reset the
     players' nicknames and roles.
@@ -48,8 +52,8 @@ class BOTCTownSquareStorytellers(
             pass
         else:
             return result
-        town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-        role_id = town["role_ids"]["storyteller"]
+        settings = self.bot.botc_townsquare.get_settings(ctx.message.channel.category)
+        role_id = settings.role_ids["storyteller"]
         if role_id is not None:
             result = result and await commands.has_role(role_id).predicate(ctx)
         return result
@@ -59,7 +63,7 @@ class BOTCTownSquareStorytellers(
     async def lock(self, ctx):
         """Start a game with the current players, locking the town and seat order."""
         town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-        town["locked"] = True
+        town.set_locked(True)
         await acknowledge_command(ctx)
 
     @commands.command(name="unlock", brief="Unlock the town")
@@ -67,7 +71,15 @@ class BOTCTownSquareStorytellers(
     async def unlock(self, ctx):
         """Stop (pause) a game, unlocking the town and seat order."""
         town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
-        town["locked"] = False
+        town.set_locked(False)
+        await acknowledge_command(ctx)
+
+    @commands.command(name="newday", aliases=["day"], brief="Start a new day")
+    @delete_command_message()
+    async def newday(self, ctx):
+        """Start a new day, forgetting the previous day's nominations and votes."""
+        town = self.bot.botc_townsquare.get_town(ctx.message.channel.category)
+        town.new_day()
         await acknowledge_command(ctx)
 
     @commands.command(brief="End game and clear the town")
@@ -78,31 +90,15 @@ class BOTCTownSquareStorytellers(
         category = ctx.message.channel.category
         town = ts.get_town(category)
 
-        roles = {}
-        for key, role_id in town["role_ids"].items():
-            if role_id is not None:
-                roles[key] = ctx.guild.get_role(role_id)
-            else:
-                roles[key] = role_id
-        for player in town["players"]:
-            await ts.restore_name(ctx, player)
-            if roles["player"] is not None:
-                try:
-                    await player.remove_roles(roles["player"])
-                except (discord.Forbidden, discord.HTTPException):
-                    pass
-        for storyteller in town["storytellers"]:
-            await ts.restore_name(ctx, storyteller)
-            if roles["storyteller"] is not None:
-                try:
-                    await storyteller.remove_roles(roles["storyteller"])
-                except (discord.Forbidden, discord.HTTPException):
-                    pass
-        if roles["traveler"] is not None:
-            for traveler in town["travelers"]:
-                try:
-                    await traveler.remove_roles(roles["traveler"])
-                except (discord.Forbidden, discord.HTTPException):
-                    pass
+        edits = ts.member_edits(ctx)
+        for key, member_ids in (
+            ("player", town.players),
+            ("traveler", town.travelers),
+            ("storyteller", town.storytellers),
+        ):
+            for member in ts.get_members(ctx.guild, member_ids):
+                edits.set_nick(member, ts.restored_nickname(ctx, member))
+                edits.remove_role(member, town.role_ids[key])
+        edits.report_nicknames = True
         ts.del_town(category)
         await acknowledge_command(ctx)